@@ -1,93 +1,104 @@
 import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from dotenv import load_dotenv
 import os
 
 from starlette.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 
 load_dotenv()
 
 import logging
-from pythonjsonlogger import jsonlogger
 
 from fastapi.middleware.cors import CORSMiddleware
 
-def setup_logging():
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-
-    # Удаляем все существующие обработчики
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
-
-    # Создаем форматтер для JSON
-    formatter = jsonlogger.JsonFormatter(
-        '%(asctime)s %(name)s %(levelname)s %(message)s %(service)s %(method)s %(endpoint)s %(status_code)s %(duration_sec)s',
-        json_ensure_ascii=False,
-        rename_fields={
-            "asctime": "timestamp",
-            "levelname": "level",
-            "name": "logger"
+from proxy.utils.log import setup_logging
+from proxy.utils.timing import start_request, server_timing, get_spans
+from proxy.utils.profiling import record_slow
+from proxy.utils.admission import Rejected, client_ip
+from proxy.utils.compression import CompressionMiddleware
+
+
+class LoggingMiddleware:
+    """Лог и Server-Timing каждого запроса, дерево фаз медленных запросов (SLOW_REQUEST_MS).
+    Чистый ASGI: без отдельной задачи и обертки тела ответа, как у BaseHTTPMiddleware"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        phases = start_request()
+        spans = get_spans()
+        status_code = 500
+        fields = {
+            "service": "request_manager_service",
+            "method": scope["method"],
+            "endpoint": scope["path"],
         }
-    )
 
-    # Обработчик для вывода в консоль (Docker будет собирать эти логи)
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+        # Входящий запрос пишем только в DEBUG: итог запроса все равно попадет в "Request completed"
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Incoming request", extra={**fields, "client_ip": client_ip(HTTPConnection(scope))})
 
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if phases:
+                    # Разбивка времени по фазам (embed, milvus_search, llm, ...) видна клиенту и в бенчмарке
+                    MutableHeaders(scope=message).append("Server-Timing", server_timing(phases))
+            await send(message)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        logger = logging.getLogger(__name__)
-        
-        # Логируем входящий запрос
-        logger.info(
-            "Incoming request",
-            extra={
-                "service": "request_manager_service",
-                "method": request.method,
-                "endpoint": str(request.url.path),
-                "client_ip": request.client.host if request.client else None,
-            }
-        )
-        
         try:
-            response = await call_next(request)
-            duration = time.time() - start_time
-            
-            # Логируем успешный ответ
-            logger.info(
-                "Request completed",
-                extra={
-                    "service": "request_manager_service",
-                    "method": request.method,
-                    "endpoint": str(request.url.path),
-                    "status_code": response.status_code,
-                    "duration_sec": round(duration, 3),
-                }
-            )
-            
-            return response
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
-            duration = time.time() - start_time
-            logger.error(
+            record_slow(scope["method"], scope["path"], 500, start_time, time.perf_counter() - start_time, spans)
+            self.logger.error(
                 "Request failed",
                 extra={
-                    "service": "request_manager_service",
-                    "method": request.method,
-                    "endpoint": str(request.url.path),
+                    **fields,
                     "status_code": 500,
-                    "duration_sec": round(duration, 3),
+                    "duration_sec": round(time.perf_counter() - start_time, 3),
+                    "client_ip": client_ip(HTTPConnection(scope)),
                     "error": str(e),
                 },
                 exc_info=True
             )
             raise
 
+        duration = time.perf_counter() - start_time
+        record_slow(scope["method"], scope["path"], status_code, start_time, duration, spans)
+        self.logger.info(
+            "Request completed",
+            extra={
+                **fields,
+                "status_code": status_code,
+                "duration_sec": round(duration, 3),
+                "client_ip": client_ip(HTTPConnection(scope)),
+                "phases": {k: round(v, 4) for k, v in phases.items()},
+            }
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from proxy.utils.warmup import start_warmup
+
+    # Модель и подключение к Milvus грузим в фоне: сервис сразу отвечает на /live,
+    # а /ready становится 200, когда можно принимать вопросы
+    start_warmup()
+    yield
+
 
 def create_app() -> FastAPI:
     setup_logging()
@@ -95,9 +106,12 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title="Request manager Service",
         docs_url="/docs",
-        redoc_url="/redoc"
+        redoc_url="/redoc",
+        lifespan=lifespan,
     )
 
+    # Сжатие внутри LoggingMiddleware: его время попадает в Server-Timing и лог запроса
+    app.add_middleware(CompressionMiddleware)
     app.add_middleware(LoggingMiddleware)
     
     app.add_middleware(
@@ -106,8 +120,18 @@ def create_app() -> FastAPI:
         allow_credentials=False,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing", "ETag", "Last-Modified", "Content-Range", "Accept-Ranges", "Content-Length"],
     )
 
+    # Перегрузка и лимиты клиента — быстрый ответ с подсказкой, когда повторить
+    @app.exception_handler(Rejected)
+    async def rejected_handler(request: Request, exc: Rejected):
+        return JSONResponse(
+            status_code=exc.status_code,
+            content={"detail": exc.reason},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
     return app
 
 
@@ -115,7 +139,8 @@ app = create_app()
 
 from proxy.router import (
     health,
-    chat
+    chat,
+    admin
 )
 
 app.include_router(
@@ -128,4 +153,10 @@ app.include_router(
     chat.router,
     prefix="/api/v1/chat",
     tags=["Chat"]
+)
+
+app.include_router(
+    admin.router,
+    prefix="/api/v1/admin",
+    tags=["Admin"]
 )
\ No newline at end of file
@@ -0,0 +1,131 @@
+import logging
+from typing import List, Optional, Tuple, Union
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse
+
+from proxy.utils import metrics, admission, profiling
+from proxy.utils.giga import llm_breaker
+from proxy.utils.search import reindex, rollback, get_reindex_state, get_semantic_cache, is_reindex_running
+from proxy.utils.tenant import normalize_tenant
+from proxy.router.deps import require_admin
+
+from proxy.schema.admin import ReindexRequest
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def _run_reindex(sample_queries: Optional[List[Union[str, Tuple[str, str]]]]):
+    try:
+        reindex(sample_queries=sample_queries)
+    except Exception:
+        # Ошибка уже залогирована и сохранена в состоянии переиндексации
+        pass
+
+
+@router.post("/reindex")
+async def startReindex(background_tasks: BackgroundTasks, request: Optional[ReindexRequest] = None):
+    if get_reindex_state().get("status") in ("building", "validating") or is_reindex_running():
+        raise HTTPException(status_code=409, detail="Reindex is already running")
+
+    logger.info("Reindex requested")
+    background_tasks.add_task(_run_reindex, request.sample_pairs() if request else None)
+    return {"status": "started"}
+
+
+@router.get("/reindex")
+async def reindexStatus():
+    return get_reindex_state()
+
+
+@router.post("/reindex/rollback")
+async def rollbackReindex():
+    if is_reindex_running():
+        raise HTTPException(status_code=409, detail="Reindex is running, rollback is not possible")
+    # Переключение алиаса и загрузка версии — блокирующие вызовы Milvus, не держим цикл событий
+    try:
+        result = await run_in_threadpool(rollback)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "ok", **result}
+
+
+@router.get("/metrics")
+async def getMetrics():
+    return metrics.snapshot()
+
+
+@router.get("/admission")
+async def admissionStats():
+    return admission.stats()
+
+
+@router.get("/llm")
+async def llmStats():
+    """Состояние предохранителя GigaChat: closed / open / half_open"""
+    return llm_breaker.stats()
+
+
+@router.get("/cache")
+async def cacheStats():
+    return get_semantic_cache().stats()
+
+
+@router.delete("/cache")
+async def invalidateCache(tenant: Optional[str] = None):
+    try:
+        tenant = normalize_tenant(tenant) if tenant else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid tenant id")
+    get_semantic_cache().invalidate(tenant)
+    return {"status": "ok"}
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def runProfile(
+        seconds: float = Query(10.0, gt=0, le=profiling.PROFILE_MAX_SEC, description="Длительность профиля, секунды"),
+        interval_ms: float = Query(profiling.PROFILE_INTERVAL_MS, ge=1, le=1000, description="Интервал выборки, мс"),
+        idle: bool = Query(False, description="Писать и стеки простаивающих потоков"),
+):
+    """Выборочный профиль процесса за seconds секунд в формате collapsed stacks (flamegraph.pl, speedscope)"""
+    if profiling.is_profiling():
+        raise HTTPException(status_code=409, detail="Profiling is already running")
+
+    logger.info("Profiling started", extra={"seconds": seconds, "interval_ms": interval_ms})
+    try:
+        result = await run_in_threadpool(profiling.profile, seconds, interval_ms, idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info("Profiling completed", extra={"profile_id": result["id"], "samples": result["samples"]})
+    return PlainTextResponse(
+        result["folded"],
+        headers={"X-Profile-Id": str(result["id"]), "X-Profile-Samples": str(result["samples"])},
+    )
+
+
+@router.get("/profile")
+async def listProfiles():
+    return {"running": profiling.is_profiling(), "profiles": profiling.list_profiles()}
+
+
+@router.get("/profile/{profile_id}", response_class=PlainTextResponse)
+async def getProfile(profile_id: int):
+    result = profiling.get_profile(profile_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(result["folded"], headers={"X-Profile-Id": str(result["id"])})
+
+
+@router.get("/slow")
+async def slowRequests(limit: int = Query(20, ge=1, le=1000)):
+    """Последние запросы дольше SLOW_REQUEST_MS с деревом фаз"""
+    return {"threshold_ms": profiling.SLOW_REQUEST_MS, "requests": profiling.slow_requests(limit)}
+
+
+@router.delete("/slow")
+async def clearSlowRequests():
+    profiling.clear_slow()
+    return {"status": "ok"}
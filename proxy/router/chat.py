@@ -1,15 +1,38 @@
+import asyncio
 import os
+import time
 import logging
 from pathlib import Path
-from typing import List
+from typing import List, Literal, Tuple
+from urllib.parse import quote
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks
-from starlette.responses import FileResponse
+import orjson
+from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks, Depends, Request, Query
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, Response, StreamingResponse
 
-from proxy.utils.giga import giga_answer
-from proxy.utils.search import poisk, parser
+from proxy.utils.giga import giga_answer, llm_breaker, LLM_DEADLINE_SEC
+from proxy.utils.extractive import extractive_answer
+from proxy.utils.search import (
+    embed_query, embed_queries, search_fragments, search_fragments_batch, parser, get_semantic_cache,
+    delete_document, replace_document, is_document_indexed
+)
+from proxy.utils.docfiles import (
+    DOC_ACCEL_REDIRECT_PREFIX, PAGE_FORMATS, safe_doc_name, file_etag, doc_headers, is_not_modified,
+    get_page_cache, page_etag, render_page
+)
+from proxy.utils.tenant import tenant_doc_dir
+from proxy.utils.timing import phase
+from proxy.utils import admission, metrics, relevance, querylog
+from proxy.utils.admission import Rejected
+from proxy.utils.singleflight import SingleFlight, normalize_query
+from proxy.router.deps import get_tenant, require_ready
 
-from proxy.schema.chat import Chat, ChatResponse, FileDownload, FileUploadResponse
+from proxy.schema.chat import (
+    Chat, ChatResponse, BatchChat, BatchChatItem, BatchChatResponse, FileDownload, FileUploadResponse,
+    DocumentDeleteResponse
+)
 
 from dotenv import load_dotenv
 
@@ -17,24 +40,110 @@ load_dotenv()
 
 DOC_DIR = Path(os.getenv("DOC_DIR"))
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+Q_COALESCE = os.getenv("Q_COALESCE", "true").lower() in ("1", "true", "yes")
+# Пакетный /q/batch: сколько вопросов в одном запросе и сколько из них генерируются одновременно
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "256"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+# ?fragments=snippet: сколько символов текста фрагмента отдавать
+SNIPPET_CHARS = int(os.getenv("SNIPPET_CHARS", "300"))
+# full — фрагменты целиком, snippet — начало текста, ids — id чанка, источник, страница и сходство без текста
+FragmentView = Literal["full", "snippet", "ids"]
+
+NOT_FOUND_ANSWER = "Не смогли найти информацию в нашей базе, пожалуйста, переформулируйте ваш вопрос."
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post("/q")
-async def getAnswer(request: Chat) -> ChatResponse:
+_q_flight = SingleFlight("q")
+
+def _snippet(text: str) -> str:
+    if len(text) <= SNIPPET_CHARS:
+        return text
+    return text[:SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+
+
+def _fragment_view(fragments: list, view: str) -> list:
+    if view == "ids":
+        return [{key: fragment.get(key) for key in ("id", "source", "page", "score")} for fragment in fragments]
+    if view == "snippet":
+        return [{**fragment, "text": _snippet(fragment.get("text") or "")} for fragment in fragments]
+    return fragments
+
+
+def _payload(model, view: str) -> dict:
+    payload = model.model_dump()
+    payload["onTextBased"] = _fragment_view(payload["onTextBased"], view)
+    return payload
+
+
+def _json(payload: dict) -> ORJSONResponse:
+    """Ответ через orjson: модели уже собраны из проверенных данных, повторная
+    валидация response_model и стандартный JSON-кодировщик FastAPI не нужны"""
+    with phase("serialize"):
+        return ORJSONResponse(payload)
+
+
+@router.post("/q", dependencies=[Depends(require_ready)], response_model=ChatResponse)
+async def getAnswer(
+        request: Chat,
+        http_request: Request,
+        view: FragmentView = Query("full", alias="fragments", description="Вид фрагментов: full, snippet или ids"),
+        tenant: str = Depends(get_tenant),
+):
     logger.info(
         "Received question request",
         extra={
             "query": request.request,
+            "tenant": tenant,
             "endpoint": "/q"
         }
     )
-    
+
+    # Лимит клиента проверяем до любой тяжелой работы
+    if not Q_COALESCE:
+        admission.rate_limit("q", admission.client_ip(http_request))
+        return _json(_payload(await _admitted_answer(request, tenant), view))
+
+    # Одинаковые одновременные вопросы одного тенанта (например, во время инцидента)
+    # ждут один поиск и одну генерацию; место в лимите /q и токен клиента тратит только первый
+    key = (tenant, normalize_query(request.request))
+    if not _q_flight.joinable(key):
+        admission.rate_limit("q", admission.client_ip(http_request))
+    response = await _q_flight.do(key, lambda: _admitted_answer(request, tenant))
+    return _json(_payload(response.model_copy(update={"request": request.request}), view))
+
+
+async def _admitted_answer(request: Chat, tenant: str) -> ChatResponse:
+    async with admission.stage("q").slot():
+        return await _answer(request, tenant)
+
+
+async def _answer(request: Chat, tenant: str) -> ChatResponse:
     try:
-        logger.info("Starting search for relevant fragments")
-        fragments = poisk(query=request.request)
+        started = time.perf_counter()
+        # Блокирующие вызовы (модель, Milvus, GigaChat) выполняем в пуле потоков,
+        # чтобы event loop продолжал принимать и отклонять запросы
+        async with admission.stage("embed").slot():
+            query_vec = await run_in_threadpool(embed_query, request.request)
+
+        # Переформулировка уже заданного вопроса — отдаем готовый ответ
+        with phase("cache_lookup"):
+            # Поколение читаем до поиска: если загрузка сбросит кэш раньше, чем будет готов ответ,
+            # ответ по старому индексу в кэш не попадет
+            generation = get_semantic_cache().generation(tenant)
+            cached = get_semantic_cache().get(tenant, query_vec)
+        if cached is not None:
+            querylog.record(tenant, request.request, cached.fragments, cached=True)
+            return ChatResponse.model_construct(
+                request = request.request,
+                response = cached.response,
+                onTextBased = cached.fragments,
+            )
+
+        logger.debug("Starting search for relevant fragments")
+        fragments = await run_in_threadpool(search_fragments, query_vec, tenant=tenant)
         logger.info(
             "Search completed",
             extra={
@@ -42,34 +151,57 @@ async def getAnswer(request: Chat) -> ChatResponse:
             }
         )
 
-        if not fragments or len(fragments) < 3:
+        # Слабые совпадения не стоят вызова GigaChat: сразу отдаем запасной ответ
+        evidence, reason = relevance.gate(fragments)
+        if reason:
             logger.warning(
                 "Insufficient fragments found",
                 extra={
-                    "fragments_count": len(fragments) if fragments else 0,
+                    "fragments_count": len(fragments),
+                    "top_score": fragments[0].get("score") if fragments else None,
+                    "reason": reason,
                     "query": request.request
                 }
             )
-            return ChatResponse(
+            querylog.record(tenant, request.request, fragments, kept=len(evidence), gated=reason)
+            return ChatResponse.model_construct(
                 request = request.request,
-                response = "Не смогли найти информацию в нашей базе, пожалуйста, переформулируйте ваш вопрос.",
+                response = NOT_FOUND_ANSWER,
                 onTextBased = fragments,
             )
 
-        logger.info("Generating answer using GigaChat")
-        response = giga_answer(query=request.request, fragments=fragments)
+        retrieved, fragments = fragments, evidence
+        logger.debug("Generating answer using GigaChat")
+        response, degraded = await _generate(request.request, fragments)
+        querylog.record(tenant, request.request, retrieved, kept=len(fragments), degraded=degraded)
         logger.info(
             "Answer generated successfully",
             extra={
-                "response_length": len(response) if response else 0
+                "response_length": len(response) if response else 0,
+                "degraded": degraded
             }
         )
 
-        return ChatResponse(
+        # Запасной ответ не кэшируем: после восстановления GigaChat вопрос получит полноценный ответ
+        if not degraded:
+            get_semantic_cache().put(
+                tenant,
+                query_vec,
+                query=request.request,
+                response=response,
+                fragments=fragments,
+                compute_sec=time.perf_counter() - started,
+                generation=generation,
+            )
+
+        return ChatResponse.model_construct(
             request = request.request,
             response = response,
             onTextBased = fragments,
+            degraded = degraded,
         )
+    except Rejected:
+        raise
     except Exception as e:
         logger.error(
             "Error processing question request",
@@ -81,67 +213,349 @@ async def getAnswer(request: Chat) -> ChatResponse:
         )
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.post("/doc")
-async def downloadDoc(doc: FileDownload) -> FileResponse:
+async def _generate(query: str, fragments: list) -> Tuple[str, bool]:
+    """Ответ GigaChat, а если он не ответил к сроку, упал или отключен предохранителем —
+    извлекающий ответ из найденных фрагментов. Второе значение — признак запасного ответа"""
+    if not llm_breaker.allow():
+        reason = "breaker_open"
+    else:
+        try:
+            async with admission.stage("llm").slot():
+                response = await asyncio.wait_for(
+                    run_in_threadpool(giga_answer, query=query, fragments=fragments),
+                    timeout=LLM_DEADLINE_SEC or None,
+                )
+            llm_breaker.record_success()
+            return response, False
+        except asyncio.CancelledError:
+            llm_breaker.record_skipped()
+            raise
+        except Rejected as e:
+            # Переполнена наша очередь к GigaChat, сам GigaChat исправен — предохранитель не трогаем
+            llm_breaker.record_skipped()
+            reason = "llm_queue_full"
+            logger.warning("LLM queue rejected request", extra={"query": query, "reason": e.reason})
+        except asyncio.TimeoutError:
+            llm_breaker.record_failure()
+            reason = "deadline"
+            logger.warning("LLM deadline exceeded", extra={"query": query, "deadline_sec": LLM_DEADLINE_SEC})
+        except Exception as e:
+            llm_breaker.record_failure()
+            reason = "llm_error"
+            logger.warning("LLM call failed", extra={"query": query, "error": str(e)})
+
+    metrics.inc("llm_degraded")
+    metrics.inc(f"llm_degraded_{reason}")
+    # Ранжирование по словам без модели — миллисекунды, слот эмбеддингов не нужен
+    response = extractive_answer(query, fragments)
+    logger.info("Answered with extracted sentences", extra={"query": query, "reason": reason})
+    return response, True
+
+@router.post("/q/batch", dependencies=[Depends(require_ready)], response_model=BatchChatResponse)
+async def getAnswers(
+        batch: BatchChat,
+        http_request: Request,
+        stream: bool = Query(False, description="Отдавать ответы по мере готовности (NDJSON)"),
+        view: FragmentView = Query("full", alias="fragments", description="Вид фрагментов: full, snippet или ids"),
+        tenant: str = Depends(get_tenant),
+):
+    """Ответы на список вопросов: эмбеддинги одним вызовом модели, поиск одним запросом к Milvus,
+    генерация не более BATCH_LLM_CONCURRENCY вопросов одновременно"""
+    if not batch.requests:
+        raise HTTPException(status_code=422, detail="Empty batch")
+    if len(batch.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many questions in batch (max {BATCH_MAX_ITEMS})")
+
+    admission.rate_limit("batch", admission.client_ip(http_request))
     logger.info(
-        "Received document download request",
-        extra={
-            "doc_name": doc.docName,
-            "endpoint": "/doc"
-        }
+        "Received batch question request",
+        extra={"tenant": tenant, "items": len(batch.requests), "stream": stream, "endpoint": "/q/batch"}
     )
-    
-    try:
-        if not doc.docName or ".." in doc.docName or "/" in doc.docName or "\\" in doc.docName:
-            logger.warning(
-                "Invalid file name provided",
-                extra={
-                    "doc_name": doc.docName
-                }
+    metrics.inc("batch_requests")
+    metrics.inc("batch_items", len(batch.requests))
+
+    # Поиск занимает место в лимите пакетов; генерация ограничена лимитом llm, как у /q
+    async with admission.stage("batch").slot():
+        items, pending, generation = await _batch_retrieve(batch.requests, tenant)
+
+    limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    tasks = [
+        asyncio.ensure_future(_batch_generate(index, batch.requests[index].request, query_vec, fragments, tenant,
+                                               generation, limit))
+        for index, query_vec, fragments in pending
+    ]
+
+    if not stream:
+        try:
+            items.extend(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+        items.sort(key=lambda item: item.index)
+        return _json({"results": [_payload(item, view) for item in items]})
+
+    async def lines():
+        try:
+            # Готовые ответы (кэш, нет фрагментов) — сразу, остальные — по мере генерации
+            for item in items:
+                yield orjson.dumps(_payload(item, view)) + b"\n"
+            for next_item in asyncio.as_completed(tasks):
+                yield orjson.dumps(_payload(await next_item, view)) + b"\n"
+        finally:
+            # Клиент отключился — незавершенные генерации не нужны
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def _batch_retrieve(requests: List[Chat], tenant: str):
+    """Эмбеддинги, кэш и поиск для всего пакета. Возвращает готовые ответы,
+    список (индекс, эмбеддинг, фрагменты) для генерации и поколение кэша до поиска"""
+    async with admission.stage("embed").slot():
+        query_vecs = await run_in_threadpool(embed_queries, [r.request for r in requests])
+
+    items: List[BatchChatItem] = []
+    misses = []
+    cache = get_semantic_cache()
+    with phase("cache_lookup"):
+        generation = cache.generation(tenant)
+        for index, (request, query_vec) in enumerate(zip(requests, query_vecs)):
+            cached = cache.get(tenant, query_vec)
+            if cached is not None:
+                items.append(BatchChatItem(
+                    index=index, request=request.request, response=cached.response, onTextBased=cached.fragments
+                ))
+            else:
+                misses.append(index)
+
+    found = await run_in_threadpool(search_fragments_batch, [query_vecs[i] for i in misses], tenant=tenant)
+
+    pending = []
+    for index, fragments in zip(misses, found):
+        evidence, reason = relevance.gate(fragments)
+        if reason:
+            items.append(BatchChatItem(
+                index=index, request=requests[index].request, response=NOT_FOUND_ANSWER, onTextBased=fragments
+            ))
+        else:
+            pending.append((index, query_vecs[index], evidence))
+
+    logger.info(
+        "Batch retrieval completed",
+        extra={"tenant": tenant, "items": len(requests), "cached": len(requests) - len(misses), "to_generate": len(pending)}
+    )
+    return items, pending, generation
+
+
+async def _batch_generate(index: int, query: str, query_vec, fragments: list, tenant: str, generation: int,
+                          limit: asyncio.Semaphore) -> BatchChatItem:
+    async with limit:
+        started = time.perf_counter()
+        try:
+            response, degraded = await _generate(query, fragments)
+        except Rejected as e:
+            return BatchChatItem(index=index, request=query, onTextBased=fragments, error=e.reason)
+        except Exception as e:
+            logger.error(
+                "Error generating batch answer",
+                extra={"query": query, "index": index, "error": str(e)},
+                exc_info=True
             )
-            raise HTTPException(status_code=400, detail="Invalid file name")
+            return BatchChatItem(index=index, request=query, onTextBased=fragments, error="Internal server error")
+
+    if not degraded:
+        get_semantic_cache().put(
+            tenant,
+            query_vec,
+            query=query,
+            response=response,
+            fragments=fragments,
+            compute_sec=time.perf_counter() - started,
+            generation=generation,
+        )
+    return BatchChatItem(index=index, request=query, response=response, onTextBased=fragments, degraded=degraded)
 
-        if (".pdf" not in doc.docName) and (".PDF" not in doc.docName):
-            doc.docName += ".pdf"
 
-        file_path = DOC_DIR / doc.docName
-        logger.debug(
-            "Constructed file path",
+def _resolve_document(doc_name: str, tenant: str) -> Path:
+    """Путь к PDF тенанта; 400 для недопустимого имени, 404 если файла нет"""
+    try:
+        doc_name = safe_doc_name(doc_name)
+    except ValueError:
+        logger.warning(
+            "Invalid file name provided",
             extra={
-                "file_path": str(file_path),
-                "doc_dir": str(DOC_DIR)
+                "doc_name": doc_name
             }
         )
+        raise HTTPException(status_code=400, detail="Invalid file name")
 
-        if not file_path.exists():
-            logger.warning(
-                "Document not found",
-                extra={
-                    "file_path": str(file_path),
-                    "doc_name": doc.docName
-                }
-            )
-            raise HTTPException(status_code=404, detail="Document not found")
+    doc_dir = tenant_doc_dir(DOC_DIR, tenant)
+    file_path = doc_dir / doc_name
+    logger.debug(
+        "Constructed file path",
+        extra={
+            "file_path": str(file_path),
+            "doc_dir": str(doc_dir)
+        }
+    )
 
-        logger.info(
-            "Serving document",
+    if not file_path.is_file():
+        logger.warning(
+            "Document not found",
             extra={
                 "file_path": str(file_path),
-                "doc_name": doc.docName
+                "doc_name": doc_name
             }
         )
-        
-        return FileResponse(
-            path=str(file_path),
-            media_type="application/pdf",
-            filename=doc.docName,
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, OPTIONS",
-                "Access-Control-Allow-Headers": "*",
-                "Cache-Control": "public, max-age=3600"
-            }
+        raise HTTPException(status_code=404, detail="Document not found")
+    return file_path
+
+async def _serve_document(request: Request, doc_name: str, tenant: str, disposition: str) -> Response:
+    file_path = _resolve_document(doc_name, tenant)
+    doc_name = file_path.name
+
+    stat = file_path.stat()
+    # Хэш считается один раз на версию файла, но для 50 MB это заметное время — не в event loop
+    etag = await run_in_threadpool(file_etag, file_path, stat)
+    headers = doc_headers(etag, stat)
+
+    if is_not_modified(
+        request.headers.get("if-none-match"), request.headers.get("if-modified-since"), etag, stat
+    ):
+        logger.info("Document not modified", extra={"doc_name": doc_name, "tenant": tenant})
+        return Response(status_code=304, headers=headers)
+
+    if DOC_ACCEL_REDIRECT_PREFIX:
+        # Файл отдает nginx (sendfile, Range), приложение только проверяет доступ
+        relative = file_path.relative_to(DOC_DIR).as_posix()
+        headers["X-Accel-Redirect"] = DOC_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative)
+        headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quote(doc_name)}"
+        logger.info("Offloading document to nginx", extra={"doc_name": doc_name, "tenant": tenant})
+        return Response(media_type="application/pdf", headers=headers)
+
+    logger.info(
+        "Serving document",
+        extra={
+            "file_path": str(file_path),
+            "doc_name": doc_name,
+            "range": request.headers.get("range"),
+        }
+    )
+    # FileResponse сам обрабатывает Range/If-Range и отдает файл потоком
+    return FileResponse(
+        path=str(file_path),
+        media_type="application/pdf",
+        filename=doc_name,
+        content_disposition_type=disposition,
+        stat_result=stat,
+        headers=headers,
+    )
+
+@router.api_route("/doc/{doc_name}", methods=["GET", "HEAD"])
+async def getDoc(doc_name: str, request: Request, tenant: str = Depends(get_tenant)) -> Response:
+    logger.info(
+        "Received document request",
+        extra={
+            "doc_name": doc_name,
+            "tenant": tenant,
+            "endpoint": "/doc/{doc_name}"
+        }
+    )
+
+    try:
+        return await _serve_document(request, doc_name, tenant, disposition="inline")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(
+            "Error serving document",
+            extra={
+                "doc_name": doc_name,
+                "error": str(e)
+            },
+            exc_info=True
         )
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/doc/{doc_name}/page/{page}")
+async def getDocPage(
+        doc_name: str,
+        page: int,
+        request: Request,
+        format: str = Query(default="pdf", pattern="^(pdf|text)$"),
+        tenant: str = Depends(get_tenant),
+) -> Response:
+    """Одна страница документа для превью цитаты: одностраничный PDF или текст"""
+    logger.info(
+        "Received document page request",
+        extra={
+            "doc_name": doc_name,
+            "page": page,
+            "format": format,
+            "tenant": tenant,
+            "endpoint": "/doc/{doc_name}/page/{page}"
+        }
+    )
+
+    if page < 1:
+        raise HTTPException(status_code=400, detail="Page numbers start from 1")
+
+    try:
+        file_path = _resolve_document(doc_name, tenant)
+        stat = file_path.stat()
+        doc_etag = await run_in_threadpool(file_etag, file_path, stat)
+        etag = page_etag(doc_etag, page, format)
+        headers = doc_headers(etag, stat)
+
+        if is_not_modified(
+            request.headers.get("if-none-match"), request.headers.get("if-modified-since"), etag, stat
+        ):
+            return Response(status_code=304, headers=headers)
+
+        # Ключ кэша — по содержимому документа: новая версия файла получит новые страницы
+        extension = "pdf" if format == "pdf" else "txt"
+        key = f"{doc_etag.strip(chr(34))}-p{page}.{extension}"
+        try:
+            with phase("page_render"):
+                content = await run_in_threadpool(
+                    get_page_cache().get_or_create, key, lambda out: render_page(file_path, page, format, out)
+                )
+        except IndexError:
+            raise HTTPException(status_code=404, detail="Page not found")
+
+        # Страница — один небольшой файл: отдаем прочитанное содержимое, файл в кэше к этому
+        # моменту может уже вытеснить другой воркер
+        headers["Content-Disposition"] = f"inline; filename*=utf-8''{quote(f'{file_path.stem}_p{page}.{extension}')}"
+        return Response(content=content, media_type=PAGE_FORMATS[format], headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(
+            "Error serving document page",
+            extra={
+                "doc_name": doc_name,
+                "page": page,
+                "error": str(e)
+            },
+            exc_info=True
+        )
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/doc")
+async def downloadDoc(doc: FileDownload, request: Request, tenant: str = Depends(get_tenant)) -> Response:
+    """Устаревший вариант: POST не кэшируется. Используйте GET /doc/{doc_name}"""
+    logger.info(
+        "Received document download request",
+        extra={
+            "doc_name": doc.docName,
+            "tenant": tenant,
+            "endpoint": "/doc"
+        }
+    )
+    
+    try:
+        return await _serve_document(request, doc.docName, tenant, disposition="attachment")
     except HTTPException:
         raise
     except Exception as e:
@@ -155,25 +569,122 @@ async def downloadDoc(doc: FileDownload) -> FileResponse:
         )
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def _parse_uploaded(files: List[str], tenant: str):
+    try:
+        parser(files, tenant)
+    finally:
+        admission.upload_backlog.release()
+
+def _replace_uploaded(files: List[str], tenant: str):
+    try:
+        replace_document(files[0], tenant)
+    finally:
+        admission.upload_backlog.release()
+
+def _delete_indexed(doc_name: str, tenant: str):
+    try:
+        delete_document(doc_name, tenant, remove_file=True)
+    finally:
+        admission.upload_backlog.release()
+
+@router.put("/doc/{doc_name}", response_model=FileUploadResponse)
+async def replaceDoc(
+        doc_name: str,
+        background_tasks: BackgroundTasks,
+        http_request: Request,
+        file: UploadFile = File(...),
+        tenant: str = Depends(get_tenant),
+) -> FileUploadResponse:
+    """Заменить PDF: новые чанки индексируются в фоне, старые удаляются после них"""
+    logger.info(
+        "Received document replace request",
+        extra={
+            "doc_name": doc_name,
+            "tenant": tenant,
+            "endpoint": "/doc/{doc_name}"
+        }
+    )
+    doc_name = _resolve_document(doc_name, tenant).name
+    # Файл сохраняется под именем заменяемого документа, независимо от имени загруженного
+    file.filename = doc_name
+
+    admission.rate_limit("upload", admission.client_ip(http_request))
+    async with admission.stage("upload").slot():
+        return await _save_uploads(background_tasks, [file], tenant, task=_replace_uploaded)
+
+@router.delete("/doc/{doc_name}", response_model=DocumentDeleteResponse)
+async def deleteDoc(
+        doc_name: str,
+        background_tasks: BackgroundTasks,
+        http_request: Request,
+        tenant: str = Depends(get_tenant),
+) -> DocumentDeleteResponse:
+    """Удалить PDF и его чанки в фоне: сначала чанки, затем файл"""
+    logger.info(
+        "Received document delete request",
+        extra={
+            "doc_name": doc_name,
+            "tenant": tenant,
+            "endpoint": "/doc/{doc_name}"
+        }
+    )
+    try:
+        file_path = _resolve_document(doc_name, tenant)
+    except HTTPException as e:
+        # Файла уже нет, но чанки остались (например, прошлое удаление чанков не удалось): дочищаем индекс
+        if e.status_code != 404 or not await run_in_threadpool(is_document_indexed, safe_doc_name(doc_name), tenant):
+            raise
+        file_path = tenant_doc_dir(DOC_DIR, tenant) / safe_doc_name(doc_name)
+    admission.rate_limit("upload", admission.client_ip(http_request))
+
+    # Удаление идет через ту же ограниченную очередь, что и разбор загрузок.
+    # Файл удаляется только после чанков: при ошибке документ не остается в поиске без PDF
+    admission.upload_backlog.reserve()
+    background_tasks.add_task(_delete_indexed, file_path.name, tenant)
+
+    logger.info("Document deletion started in background",
+                extra={"doc_name": file_path.name, "tenant": tenant})
+    return DocumentDeleteResponse(
+        success=True,
+        message="Document deletion started. Its chunks are removed from the index first, then the file.",
+        filename=file_path.name
+    )
+
 @router.post("/upload", response_model=FileUploadResponse)
-async def uploadDoc(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)) -> FileUploadResponse:
+async def uploadDoc(
+        background_tasks: BackgroundTasks,
+        http_request: Request,
+        files: List[UploadFile] = File(...),
+        tenant: str = Depends(get_tenant),
+) -> FileUploadResponse:
     logger.info(
         "Received document upload request",
         extra={
             "files_count": len(files),
+            "tenant": tenant,
             "endpoint": "/upload"
         }
     )
     
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
-    
+
+    # У загрузок свои лимиты: поток загрузок не занимает емкость /q
+    admission.rate_limit("upload", admission.client_ip(http_request))
+    async with admission.stage("upload").slot():
+        return await _save_uploads(background_tasks, files, tenant)
+
+
+async def _save_uploads(background_tasks: BackgroundTasks, files: List[UploadFile], tenant: str,
+                        task=_parse_uploaded) -> FileUploadResponse:
     try:
         safe_filenames = []
         saved_files = []
+        contents = []
         
-        # Создаем директорию, если её нет
-        DOC_DIR.mkdir(parents=True, exist_ok=True)
+        # Создаем директорию тенанта, если её нет
+        doc_dir = tenant_doc_dir(DOC_DIR, tenant)
+        doc_dir.mkdir(parents=True, exist_ok=True)
         
         # Обрабатываем каждый файл
         for file in files:
@@ -212,7 +723,7 @@ async def uploadDoc(background_tasks: BackgroundTasks, files: List[UploadFile] =
             if not safe_filename.lower().endswith('.pdf'):
                 safe_filename = safe_filename.rsplit('.', 1)[0] + '.pdf'
             
-            file_path = DOC_DIR / safe_filename
+            file_path = doc_dir / safe_filename
             
             # Проверка размера файла
             file_content = await file.read()
@@ -236,26 +747,42 @@ async def uploadDoc(background_tasks: BackgroundTasks, files: List[UploadFile] =
                 logger.warning("Empty file uploaded", extra={"file_name": safe_filename})
                 raise HTTPException(status_code=400, detail=f"File '{safe_filename}' is empty")
             
-            # Сохраняем файл
-            with open(file_path, "wb") as f:
-                f.write(file_content)
-            
             safe_filenames.append(safe_filename)
             saved_files.append({
                 "filename": safe_filename,
                 "file_path": str(file_path),
                 "file_size": file_size
             })
+            contents.append((file_path, file_content))
+        
+        # Место в очереди разбора занимаем до записи на диск: при полной очереди (503)
+        # файлы не сохраняются, иначе они остались бы в DOC_DIR без чанков в индексе
+        admission.upload_backlog.reserve()
+        try:
+            for file_path, file_content in contents:
+                # Через временный файл: /doc не отдает недописанный PDF, а при замене (PUT /doc)
+                # старая версия остается на месте, пока новая не записана целиком
+                tmp = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+                try:
+                    with open(tmp, "wb") as f:
+                        f.write(file_content)
+                    os.replace(tmp, file_path)
+                finally:
+                    tmp.unlink(missing_ok=True)
+        except BaseException:
+            admission.upload_backlog.release()
+            raise
         
         # Обработку файлов (парсинг и векторизация) выполняем в фоне
         # передаем весь список файлов в парсер
-        background_tasks.add_task(parser, safe_filenames)
+        background_tasks.add_task(task, safe_filenames, tenant)
         
         total_size = sum(f["file_size"] for f in saved_files)
         logger.info(
             "Documents uploaded successfully, processing started in background",
             extra={
                 "files_count": len(safe_filenames),
+                "tenant": tenant,
                 "total_size": total_size,
                 "files": safe_filenames
             }
@@ -265,9 +792,9 @@ async def uploadDoc(background_tasks: BackgroundTasks, files: List[UploadFile] =
             success=True,
             message=f"Successfully uploaded {len(safe_filenames)} document(s). Processing started in background.",
             filename=", ".join(safe_filenames) if len(safe_filenames) <= 3 else f"{len(safe_filenames)} files",
-            file_path=str(DOC_DIR)
+            file_path=str(doc_dir)
         )
-    except HTTPException:
+    except (HTTPException, Rejected):
         raise
     except Exception as e:
         logger.error(
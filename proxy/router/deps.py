@@ -0,0 +1,40 @@
+import hmac
+import logging
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from proxy.utils.tenant import TENANT_HEADER, normalize_tenant
+from proxy.utils.warmup import is_ready
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Без ADMIN_TOKEN административные эндпоинты отключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def get_tenant(x_tenant_id: Optional[str] = Header(default=None, alias=TENANT_HEADER)) -> str:
+    """Тенант запроса из заголовка X-Tenant-ID (без заголовка — тенант по умолчанию)"""
+    try:
+        return normalize_tenant(x_tenant_id)
+    except ValueError:
+        logger.warning("Invalid tenant id provided", extra={"tenant": x_tenant_id})
+        raise HTTPException(status_code=400, detail="Invalid tenant id")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
+    """Доступ к административным эндпоинтам по токену из заголовка X-Admin-Token"""
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        logger.warning("Admin access denied")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+def require_ready():
+    """Не принимаем вопросы, пока модель и Milvus не прогреты — иначе запрос упрется в таймаут"""
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Service is warming up", headers={"Retry-After": "10"})
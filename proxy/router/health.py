@@ -1,6 +1,11 @@
 import logging
 
 from fastapi import APIRouter
+from starlette.responses import JSONResponse
+
+from proxy.utils.warmup import readiness, PROCESS_STARTED
+
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -9,4 +14,17 @@ router = APIRouter()
 @router.get("/")
 async def health_check():
     logger.info("Health check requested")
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@router.get("/live")
+async def liveness():
+    # Процесс жив и обслуживает event loop; готовность к запросам — см. /ready
+    return {"status": "ok", "uptime_sec": round(time.time() - PROCESS_STARTED, 1)}
+
+@router.get("/ready")
+async def readiness_check():
+    # 503, пока не загружены модель эмбеддингов и подключение к Milvus
+    state = readiness()
+    if state["status"] != "ready":
+        return JSONResponse(status_code=503, content=state, headers={"Retry-After": "10"})
+    return state
\ No newline at end of file
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, field_validator
+from typing import Optional, List, Union
+
+from proxy.utils.tenant import normalize_tenant
+
+class SampleQuery(BaseModel):
+    query: str
+    tenant: Optional[str] = None  # Партиция, в которой запрос должен найти результаты (по умолчанию — тенант по умолчанию)
+
+    @field_validator("tenant")
+    @classmethod
+    def check_tenant(cls, value: Optional[str]) -> str:
+        # Некорректный тенант — 422 сразу, а не ошибка переиндексации в фоне
+        return normalize_tenant(value)
+
+class ReindexRequest(BaseModel):
+    # Контрольные запросы для проверки новой версии: строка (тенант по умолчанию) или {"tenant", "query"}
+    sampleQueries: Optional[List[Union[str, SampleQuery]]] = None
+
+    def sample_pairs(self) -> Optional[List[Union[str, tuple]]]:
+        """Контрольные запросы для reindex: строка или пара (тенант, запрос)"""
+        if not self.sampleQueries:
+            return None
+        return [item if isinstance(item, str) else (item.tenant, item.query) for item in self.sampleQueries]
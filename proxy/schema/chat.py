@@ -6,7 +6,22 @@ class Chat(BaseModel):
 
 class ChatResponse(Chat):
     response: str
-    onTextBased: List[Dict[str, str]]  # Список словарей с ключами 'text' и 'source'
+    onTextBased: List[Dict[str, Any]]  # Список словарей с ключами 'text', 'source', 'page' и 'score'
+    degraded: bool = False  # Ответ составлен из выдержек без GigaChat (он не ответил к сроку или отключен)
+
+class BatchChat(BaseModel):
+    requests: List[Chat]
+
+class BatchChatItem(BaseModel):
+    index: int  # Позиция вопроса в запросе
+    request: str
+    response: Optional[str] = None
+    onTextBased: List[Dict[str, Any]] = []
+    error: Optional[str] = None  # Причина, если на этот вопрос ответить не удалось
+    degraded: bool = False
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatItem]
 
 class FileDownload(BaseModel):
     docName: str
@@ -15,4 +30,9 @@ class FileUploadResponse(BaseModel):
     success: bool
     message: str
     filename: str
-    file_path: str
\ No newline at end of file
+    file_path: str
+
+class DocumentDeleteResponse(BaseModel):
+    success: bool
+    message: str
+    filename: str
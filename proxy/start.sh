@@ -0,0 +1,36 @@
+#!/bin/bash
+# Запуск API. WEB_WORKERS > 1 — несколько воркеров uvicorn; чтобы каждый из них
+# не держал свою копию модели (~2 GB), задайте EMBEDDING_SOCKET: модель будет
+# загружена один раз в общем процессе эмбеддингов.
+set -e
+
+WEB_WORKERS="${WEB_WORKERS:-1}"
+
+if [ -z "$EMBEDDING_SOCKET" ]; then
+    exec uvicorn proxy.main:app --host 0.0.0.0 --port 8080 --workers "$WEB_WORKERS"
+fi
+
+python -m proxy.utils.EmbeddingServer_impl &
+EMBED_PID=$!
+uvicorn proxy.main:app --host 0.0.0.0 --port 8080 --workers "$WEB_WORKERS" &
+WEB_PID=$!
+
+STOPPING=0
+stop() {
+    kill -TERM "$EMBED_PID" "$WEB_PID" 2>/dev/null || true
+}
+# docker stop: передаем сигнал обоим процессам и завершаемся штатно
+trap 'STOPPING=1; stop' TERM INT
+
+# Без общего процесса эмбеддингов воркеры не отвечают ни на один вопрос. Если завершился любой
+# из двух процессов, останавливаем второй и выходим с ошибкой — Docker перезапустит контейнер
+set +e
+wait -n "$EMBED_PID" "$WEB_PID"
+status=$?
+stop
+wait
+if [ "$STOPPING" = 1 ]; then
+    exit 0
+fi
+echo "[ERROR]: embedding server or uvicorn exited (status $status), stopping container" >&2
+exit $(( status == 0 ? 1 : status ))
@@ -0,0 +1,154 @@
+"""Общее окружение тестов: приложение целиком в этом процессе, без Milvus, GigaChat и модели.
+
+Переменные окружения выставляются до импорта proxy.*: модули читают их при импорте.
+Запуск из корня репозитория: python -m pytest proxy/tests
+"""
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+os.environ["MILVUS_BACKEND"] = "memory"
+os.environ["GIGA_BACKEND"] = "fake"
+os.environ["GIGA_FAKE_JITTER_MS"] = "0"
+os.environ["SEMANTIC_CACHE_SIZE"] = "0"
+os.environ["DOC_DIR"] = tempfile.mkdtemp(prefix="test_docs_")
+os.environ["ADMIN_TOKEN"] = "test-admin"
+# Все запросы тестов идут от одного клиента
+os.environ["RATE_LIMIT_Q_PER_MIN"] = "0"
+os.environ["RATE_LIMIT_UPLOAD_PER_MIN"] = "0"
+
+ADMIN_HEADERS = {"X-Admin-Token": "test-admin"}
+
+DIM = 64
+
+
+class FakeModel:
+    """Заглушка SentenceTransformer: мешок слов, разложенный по DIM координатам"""
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        vectors = []
+        for text in [sentences] if single else sentences:
+            vec = np.zeros(DIM, dtype=np.float32)
+            for word in text.lower().split():
+                vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1
+            if normalize_embeddings:
+                vec /= np.linalg.norm(vec) or 1
+            vectors.append(vec)
+        return vectors[0] if single else np.asarray(vectors)
+
+    def get_max_seq_length(self):
+        return 512
+
+    tokenizer = None
+
+
+class FakeEmbedding:
+    backend = "fake"
+
+    def __init__(self):
+        self.embedding_model = FakeModel()
+
+    def vectorize_text(self, chunks):
+        return {"emb": list(self.embedding_model.encode([chunk.page_content for chunk in chunks],
+                                                        normalize_embeddings=True))}
+
+
+class FakeTokenizer:
+    """Заглушка токенизатора модели: токен — слово, служебные токены — два в начале и конце"""
+
+    def __call__(self, text, add_special_tokens=True):
+        ids = list(range(len(text.split())))
+        return {"input_ids": [0] + ids + [0] if add_special_tokens else ids}
+
+
+class FakeChunker:
+    """Заглушка TextChunker: «PDF» тестов — b"%PDF" и чанки через «|», страница 1"""
+
+    def load_pdf_documents(self, path):
+        from langchain_core.documents import Document
+
+        text = Path(path).read_bytes()[4:].decode("utf-8")
+        return [Document(page_content=text, metadata={"source": str(path), "page": 0})]
+
+    def splitting(self, docs):
+        from langchain_core.documents import Document
+
+        return [
+            Document(page_content=part, metadata=dict(doc.metadata))
+            for doc in docs for part in doc.page_content.split("|") if part
+        ]
+
+
+def pdf_bytes(*chunks: str) -> bytes:
+    return b"%PDF" + "|".join(chunks).encode("utf-8")
+
+
+def upload(client, name: str, *chunks: str, tenant: str = None):
+    """Загрузить «PDF» через /upload; разбор выполняется до возврата ответа"""
+    headers = {"X-Tenant-ID": tenant} if tenant else {}
+    r = client.post("/api/v1/chat/upload", files={"files": (name, pdf_bytes(*chunks), "application/pdf")},
+                    headers=headers)
+    assert r.status_code == 200, r.text
+
+
+def search_ids(query: str, tenant: str = None) -> set:
+    """id чанков, которые находит поиск в Milvus по тексту вопроса"""
+    from proxy.utils import search
+
+    vec = search.embed_query(query)
+    partition = search.tenant_partition(search.normalize_tenant(tenant))
+    return set(search.get_milvus().search_by_vector(vec, "docs", limit=50, partition_names=[partition])["id"])
+
+
+def chunk_ids(doc_name: str, tenant: str = None) -> set:
+    """id чанков документа по files_chunks.json и ChunkStore"""
+    from proxy.utils import search
+
+    return set(search._document_ids(doc_name, search.normalize_tenant(tenant)))
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """Прогретое приложение с несколькими чанками тенанта по умолчанию"""
+    # files_chunks.json и lock-файлы лежат в текущей директории
+    os.chdir(tmp_path_factory.mktemp("workdir"))
+
+    from proxy.utils import search
+    search._emb = FakeEmbedding()
+    search._text_docs = FakeChunker()
+
+    from proxy.main import app
+    from proxy.utils.warmup import start_warmup, is_ready
+
+    start_warmup()
+    deadline = time.time() + 30
+    while not is_ready():
+        assert time.time() < deadline, "warm-up did not finish"
+        time.sleep(0.05)
+
+    # Чанки кладутся в files_chunks.json и индексируются переиндексацией, как в работающем сервисе:
+    # тесты переиндексации и отката видят те же данные, что и поиск
+    texts = ["отказ двигателя на взлете", "предполетный осмотр шасси", "противообледенительная обработка"]
+    with search.ingest_lock:
+        first_id = search.allocate_chunk_ids(len(texts))
+        search._write_records([
+            {"id": first_id + i, "source": "manual.pdf", "content": text, "page": 1, "tenant": None,
+             "embeddings": FakeModel().encode(text, normalize_embeddings=True).tolist()}
+            for i, text in enumerate(texts)
+        ])
+    search.reindex()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Синхронный клиент; фоновые задачи (разбор загрузок, удаление) выполняются до возврата ответа"""
+    from fastapi.testclient import TestClient
+
+    return TestClient(app)
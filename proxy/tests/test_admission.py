@@ -0,0 +1,111 @@
+"""Контроль допуска загрузок: очередь разбора, лимит клиента, коды 429/503"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy.router import chat
+from proxy.tests.conftest import pdf_bytes
+from proxy.utils import admission
+from proxy.utils.admission import PendingCounter, RateLimiter, Rejected, StageLimiter
+from proxy.utils.search import DOC_DIR
+
+
+def _post(client, name: str):
+    return client.post("/api/v1/chat/upload", files={"files": (name, pdf_bytes("текст " + name), "application/pdf")})
+
+
+def _pending() -> int:
+    return admission.upload_backlog.stats()["pending"]
+
+
+def test_full_backlog_rejects_before_writing(client, monkeypatch):
+    monkeypatch.setattr(admission.upload_backlog, "limit", _pending())
+
+    r = _post(client, "backlog_full.pdf")
+
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "30"
+    assert not (DOC_DIR / "backlog_full.pdf").exists()
+    assert _pending() == admission.upload_backlog.limit
+
+
+def test_reservation_released_when_write_fails(client, monkeypatch):
+    pending = _pending()
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(chat.os, "replace", failing_replace)
+    r = TestClient(client.app, raise_server_exceptions=False).post(
+        "/api/v1/chat/upload", files={"files": ("disk_full.pdf", pdf_bytes("текст"), "application/pdf")}
+    )
+
+    assert r.status_code == 500
+    assert _pending() == pending
+    assert not list(DOC_DIR.glob("disk_full.pdf*"))
+
+
+def test_reservation_released_when_parsing_fails(app, monkeypatch):
+    pending = _pending()
+
+    def failing_parser(files, tenant):
+        raise RuntimeError("parser crashed")
+
+    monkeypatch.setattr(chat, "parser", failing_parser)
+    TestClient(app, raise_server_exceptions=False).post(
+        "/api/v1/chat/upload", files={"files": ("crash.pdf", pdf_bytes("текст"), "application/pdf")}
+    )
+
+    assert _pending() == pending
+    (DOC_DIR / "crash.pdf").unlink(missing_ok=True)
+
+
+def test_client_rate_limit_maps_to_429(client, monkeypatch):
+    monkeypatch.setitem(admission._rates, "upload", RateLimiter("upload", per_minute=6, burst=1))
+    pending = _pending()
+
+    assert _post(client, "rate_1.pdf").status_code == 200
+    r = _post(client, "rate_2.pdf")
+
+    assert r.status_code == 429
+    # Токен восстанавливается за 10 секунд
+    assert r.headers["Retry-After"] == "10"
+    assert not (DOC_DIR / "rate_2.pdf").exists()
+    assert _pending() == pending
+
+
+def test_pending_counter_limit():
+    counter = PendingCounter("test", limit=2)
+    counter.reserve()
+    counter.reserve()
+    with pytest.raises(Rejected) as e:
+        counter.reserve()
+    assert e.value.status_code == 503
+    counter.release()
+    counter.reserve()
+    assert counter.stats() == {"pending": 2, "limit": 2}
+
+
+def test_stage_rejects_when_queue_is_full():
+    async def scenario():
+        stage = StageLimiter("test", max_inflight=1, max_queue=1, queue_timeout_sec=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with stage.slot():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]  # один выполняется, один в очереди
+        await asyncio.sleep(0.01)
+        try:
+            async with stage.slot():
+                pass
+        except Rejected as e:
+            return e
+        finally:
+            release.set()
+            await asyncio.gather(*holders)
+
+    rejected = asyncio.run(scenario())
+    assert rejected is not None and rejected.status_code == 503 and rejected.retry_after >= 1
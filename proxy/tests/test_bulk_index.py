@@ -0,0 +1,66 @@
+"""Размещение PDF офлайн-индексации в папке документов тенанта"""
+import os
+
+from proxy.tools.bulk_index import stage_pdf, unstage_pdf
+
+
+def test_stage_links_instead_of_copying(app, tmp_path):
+    from proxy.utils.search import DOC_DIR
+
+    source = tmp_path / "linked.pdf"
+    source.write_bytes(b"%PDF linked")
+    target = stage_pdf(source, DOC_DIR)
+    try:
+        assert target == DOC_DIR / "linked.pdf"
+        assert os.path.samefile(source, target)
+        # Повторный запуск узнает уже размещенный файл
+        assert stage_pdf(source, DOC_DIR) == target
+
+        other = tmp_path / "other" / "linked.pdf"
+        other.parent.mkdir()
+        other.write_bytes(b"%PDF another file with the same name")
+        assert stage_pdf(other, DOC_DIR) is None
+    finally:
+        target.unlink(missing_ok=True)
+
+
+def test_stage_copy_mode(app, tmp_path):
+    from proxy.utils.search import DOC_DIR
+
+    source = tmp_path / "copied.pdf"
+    source.write_bytes(b"%PDF copied")
+    target = stage_pdf(source, DOC_DIR, mode="copy")
+    try:
+        assert target.read_bytes() == source.read_bytes()
+        assert not os.path.samefile(source, target)
+    finally:
+        target.unlink(missing_ok=True)
+
+
+def test_unstage_removes_only_files_without_chunks(app, tmp_path):
+    from proxy.utils.search import DOC_DIR
+
+    source = tmp_path / "broken.pdf"
+    source.write_bytes(b"not a pdf")
+    target = stage_pdf(source, DOC_DIR)
+    unstage_pdf(target, source, None)
+    assert not target.exists()
+    assert source.exists()
+
+    # У manual.pdf есть чанки в индексе — его файл в папке документов остается
+    indexed = DOC_DIR / "manual.pdf"
+    indexed.write_bytes(b"%PDF manual")
+    try:
+        unstage_pdf(indexed, tmp_path / "manual.pdf", None)
+        assert indexed.exists()
+    finally:
+        indexed.unlink(missing_ok=True)
+
+    # Папка с PDF и есть папка документов — исходный файл не трогаем
+    in_place = DOC_DIR / "in_place.pdf"
+    in_place.write_bytes(b"%PDF in place")
+    try:
+        unstage_pdf(in_place, in_place, None)
+        assert in_place.exists()
+    finally:
+        in_place.unlink(missing_ok=True)
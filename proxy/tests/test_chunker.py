@@ -0,0 +1,49 @@
+"""Разбиение по структуре: таблицы, не помещающиеся в чанк"""
+from langchain_core.documents import Document
+
+from proxy.tests.conftest import FakeTokenizer
+from proxy.utils.TextChunker_impl import TextChunker
+
+MAX_TOKENS = 40
+
+
+def _chunker() -> TextChunker:
+    return TextChunker(mode="structured", max_tokens=MAX_TOKENS, min_tokens=5, tokenizer=FakeTokenizer())
+
+
+def _table(header_cells: int, rows: int) -> str:
+    header = "| " + " | ".join(f"колонка{i}" for i in range(header_cells)) + " |"
+    body = [f"| строка{r} | значение{r} |" for r in range(rows)]
+    return "\n".join([header] + body)
+
+
+def _split(text: str):
+    chunker = _chunker()
+    return chunker, chunker.splitting([Document(page_content=text, metadata={"source": "t.pdf", "page": 0})])
+
+
+def test_short_table_header_is_repeated():
+    chunker, chunks = _split(_table(header_cells=2, rows=30))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.page_content.startswith("| колонка0 | колонка1 |")
+        assert chunker._text_tokens(chunk.page_content) <= MAX_TOKENS
+
+
+def test_long_table_header_is_truncated_not_split_word_by_word():
+    # Шапка (~60 слов) длиннее всего чанка
+    chunker, chunks = _split(_table(header_cells=30, rows=30))
+    contents = [chunk.page_content for chunk in chunks]
+
+    for content in contents:
+        assert chunker._text_tokens(content) <= MAX_TOKENS
+    # Части со строками таблицы заполнены строками, а не почти пустые
+    with_rows = [c for c in contents if "строка" in c]
+    for content in with_rows:
+        assert content.startswith("| колонка0 |") and "…" in content.split("\n")[0]
+    # Кроме последней части с остатком строк
+    assert all(content.count("строка") >= 3 for content in with_rows[:-1])
+    # Полный текст шапки не потерян
+    text = " ".join(contents)
+    assert all(f"колонка{i}" in text for i in range(30))
+    assert all(f"строка{r} " in text for r in range(30))
@@ -0,0 +1,71 @@
+"""Объединение одинаковых одновременных /q (Q_COALESCE): одна генерация на всех"""
+import asyncio
+
+import httpx
+from fastapi import HTTPException
+
+from proxy.utils import giga, metrics
+from proxy.utils.singleflight import SingleFlight
+
+N = 8
+
+
+async def _ask_all(app, query: str):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await asyncio.gather(*[
+            client.post("/api/v1/chat/q", json={"request": query}) for _ in range(N)
+        ])
+
+
+def test_identical_questions_share_one_generation(app, monkeypatch):
+    # Генерация дольше, чем нужно, чтобы все запросы успели присоединиться к первому
+    monkeypatch.setattr(giga, "GIGA_FAKE_LATENCY_MS", 300)
+    llm_calls, coalesced = metrics.get("llm_calls"), metrics.get("q_coalesced")
+
+    responses = asyncio.run(_ask_all(app, "Отказ двигателя на взлете?"))
+
+    assert [r.status_code for r in responses] == [200] * N
+    assert len({r.json()["response"] for r in responses}) == 1
+    assert metrics.get("llm_calls") - llm_calls == 1
+    assert metrics.get("q_coalesced") - coalesced == N - 1
+
+
+def test_leader_error_reaches_followers(app, monkeypatch):
+    from proxy.router import chat
+
+    calls = []
+
+    async def failing_answer(request, tenant):
+        calls.append(request.request)
+        await asyncio.sleep(0.3)
+        raise HTTPException(status_code=502, detail="LLM is unavailable")
+
+    monkeypatch.setattr(chat, "_answer", failing_answer)
+    coalesced = metrics.get("q_coalesced")
+
+    responses = asyncio.run(_ask_all(app, "Предполетный осмотр шасси"))
+
+    assert len(calls) == 1
+    assert [r.status_code for r in responses] == [502] * N
+    assert metrics.get("q_coalesced") - coalesced == N - 1
+
+
+def test_singleflight_propagates_exception_and_forgets_key():
+    flight = SingleFlight("test")
+    started = []
+
+    async def work():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    async def main():
+        results = await asyncio.gather(*[flight.do("k", work) for _ in range(N)], return_exceptions=True)
+        return results, flight.joinable("k")
+
+    results, joinable = asyncio.run(main())
+
+    assert len(started) == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "boom" for r in results)
+    # После ошибки следующий вызов выполняет работу заново, а не получает старое исключение
+    assert not joinable
@@ -0,0 +1,51 @@
+"""Запасной ответ без GigaChat: по сроку и при разомкнутом предохранителе"""
+from proxy.router import chat
+from proxy.utils import giga, metrics, search
+from proxy.utils.CircuitBreaker_impl import CircuitBreaker
+from proxy.utils.extractive import DEGRADED_NOTICE
+
+
+def _ask(client, query: str) -> dict:
+    r = client.post("/api/v1/chat/q", json={"request": query})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_open_breaker_skips_llm(client, monkeypatch):
+    monkeypatch.setattr(chat, "llm_breaker", CircuitBreaker("llm", failure_threshold=2, cooldown_sec=60))
+    monkeypatch.setattr(giga, "GIGA_FAKE_LATENCY_MS", 0)
+    monkeypatch.setattr(giga, "GIGA_FAKE_ERROR_RATE", 1.0)
+    calls = []
+    monkeypatch.setattr(chat, "giga_answer", lambda query, fragments: calls.append(query) or giga.giga_answer(query, fragments))
+    open_before = metrics.get("llm_degraded_breaker_open")
+
+    # Две ошибки подряд размыкают предохранитель
+    for query in ("отказ двигателя", "осмотр шасси"):
+        assert _ask(client, query)["degraded"] is True
+    assert len(calls) == 2
+
+    answer = _ask(client, "противообледенительная обработка")
+
+    assert answer["degraded"] is True
+    assert answer["response"].startswith(DEGRADED_NOTICE)
+    assert len(calls) == 2
+    assert metrics.get("llm_degraded_breaker_open") - open_before == 1
+
+
+def test_deadline_answers_from_fragments_without_the_model(client, monkeypatch):
+    monkeypatch.setattr(chat, "LLM_DEADLINE_SEC", 0.05)
+    monkeypatch.setattr(giga, "GIGA_FAKE_LATENCY_MS", 500)
+    deadline_before = metrics.get("llm_degraded_deadline")
+
+    encoded = []
+    model = search._emb.embedding_model
+    encode = model.encode
+    monkeypatch.setattr(model, "encode", lambda sentences, **kwargs: encoded.append(sentences) or encode(sentences, **kwargs))
+
+    answer = _ask(client, "предполетный осмотр шасси")
+
+    assert answer["degraded"] is True
+    assert "- предполетный осмотр шасси" in answer["response"]
+    assert metrics.get("llm_degraded_deadline") - deadline_before == 1
+    # Модель векторизовала только вопрос, предложения фрагментов — нет
+    assert len(encoded) <= 1
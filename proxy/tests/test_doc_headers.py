@@ -0,0 +1,48 @@
+"""Заголовки кэширования /doc одинаковы при отдаче приложением и через X-Accel-Redirect"""
+import re
+from pathlib import Path
+
+import pytest
+
+from proxy.router import chat
+from proxy.tests.conftest import pdf_bytes
+from proxy.utils.tenant import tenant_doc_dir
+
+NGINX_CONF = Path(__file__).resolve().parents[2] / "nginx" / "nginx.conf"
+CACHE_HEADERS = ("etag", "last-modified", "cache-control", "vary")
+
+
+@pytest.fixture
+def document(app):
+    path = tenant_doc_dir(chat.DOC_DIR, "default") / "headers.pdf"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(pdf_bytes("заголовки кэширования"))
+    yield path.name
+    path.unlink(missing_ok=True)
+
+
+def _get(client, monkeypatch, prefix: str, doc_name: str, **headers):
+    monkeypatch.setattr(chat, "DOC_ACCEL_REDIRECT_PREFIX", prefix)
+    return client.get(f"/api/v1/chat/doc/{doc_name}", headers=headers)
+
+
+def test_etag_is_the_same_with_and_without_accel_redirect(client, monkeypatch, document):
+    direct = _get(client, monkeypatch, "", document)
+    offloaded = _get(client, monkeypatch, "/internal/docs/", document)
+
+    assert direct.status_code == offloaded.status_code == 200
+    assert offloaded.headers["x-accel-redirect"].startswith("/internal/docs/")
+    assert {h: direct.headers[h] for h in CACHE_HEADERS} == {h: offloaded.headers[h] for h in CACHE_HEADERS}
+
+    # ETag, полученный в одном режиме, подходит для условного запроса в другом
+    etag = direct.headers["etag"]
+    assert _get(client, monkeypatch, "/internal/docs/", document, **{"If-None-Match": etag}).status_code == 304
+    assert _get(client, monkeypatch, "", document, **{"If-None-Match": offloaded.headers["etag"]}).status_code == 304
+
+
+def test_nginx_keeps_the_application_etag():
+    conf = NGINX_CONF.read_text(encoding="utf-8")
+    location = re.search(r"location /internal/docs/ \{(.*?)\}", conf, re.S).group(1)
+    assert re.search(r"^\s*etag off;", location, re.M)
+    assert "add_header ETag $upstream_http_etag;" in location
+    assert "add_header Vary $upstream_http_vary;" in location
@@ -0,0 +1,42 @@
+"""Удаление и замена документа: чанки уходят из индекса вместе с файлом"""
+from proxy.tests.conftest import chunk_ids, pdf_bytes, search_ids, upload
+from proxy.utils.search import DOC_DIR
+
+
+def test_delete_removes_chunks_then_file(client):
+    upload(client, "delete_me.pdf", "регламент буксировки самолета", "проверка тормозов тягача")
+    ids = chunk_ids("delete_me.pdf")
+    assert len(ids) == 2 and ids <= search_ids("регламент буксировки самолета")
+
+    r = client.delete("/api/v1/chat/doc/delete_me.pdf")
+
+    assert r.status_code == 200, r.text
+    assert not (DOC_DIR / "delete_me.pdf").exists()
+    assert not chunk_ids("delete_me.pdf")
+    assert not ids & search_ids("регламент буксировки самолета")
+
+
+def test_delete_cleans_chunks_of_a_missing_file(client):
+    upload(client, "orphan.pdf", "сиротский чанк без файла")
+    (DOC_DIR / "orphan.pdf").unlink()
+
+    assert client.delete("/api/v1/chat/doc/orphan.pdf").status_code == 200
+    assert not chunk_ids("orphan.pdf")
+    assert client.delete("/api/v1/chat/doc/orphan.pdf").status_code == 404
+
+
+def test_replace_swaps_chunks(client):
+    upload(client, "replace_me.pdf", "старая редакция минимального перечня оборудования")
+    old = chunk_ids("replace_me.pdf")
+
+    r = client.put(
+        "/api/v1/chat/doc/replace_me.pdf",
+        files={"file": ("any_name.pdf", pdf_bytes("новая редакция перечня", "дополнение к перечню"), "application/pdf")},
+    )
+
+    assert r.status_code == 200, r.text
+    new = chunk_ids("replace_me.pdf")
+    assert len(new) == 2 and not new & old
+    assert not old & search_ids("старая редакция минимального перечня оборудования")
+    assert new & search_ids("новая редакция перечня")
+    assert (DOC_DIR / "replace_me.pdf").read_bytes() == pdf_bytes("новая редакция перечня", "дополнение к перечню")
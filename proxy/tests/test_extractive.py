@@ -0,0 +1,35 @@
+"""Запасной ответ из предложений найденных фрагментов"""
+from proxy.utils.extractive import DEGRADED_NOTICE, EXTRACTIVE_MAX_SENTENCES, extractive_answer, rank_sentences
+
+FRAGMENTS = [
+    {
+        "text": "Общие положения действуют для всех пассажиров. Перевозчик вправе изменить расписание рейсов.",
+        "source": "rules.pdf",
+        "page": 1,
+    },
+    {
+        "text": "Возврат билетов возможен до вылета рейса. Багаж сверх нормы оплачивается в аэропорту.",
+        "source": "tickets.pdf",
+        "page": 7,
+    },
+]
+
+
+def test_sentences_with_query_words_rank_first():
+    answer = extractive_answer("Как оформить возврат билета?", FRAGMENTS)
+    lines = answer.splitlines()
+    assert lines[0] == DEGRADED_NOTICE
+    # Совпадение по началу слова: «билета» и «билетов»
+    assert lines[2] == "- Возврат билетов возможен до вылета рейса. (tickets.pdf, стр. 7)"
+    assert len(lines) == 2 + EXTRACTIVE_MAX_SENTENCES
+
+
+def test_ties_keep_fragment_order():
+    sentences = ["Первое предложение без совпадений.", "Второе предложение без совпадений."]
+    assert rank_sentences("багаж", sentences) == [0.0, 0.0]
+    answer = extractive_answer("что-то совсем другое", FRAGMENTS)
+    assert answer.splitlines()[2].startswith("- Общие положения")
+
+
+def test_empty_fragments():
+    assert extractive_answer("вопрос", []) == DEGRADED_NOTICE
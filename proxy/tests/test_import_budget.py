@@ -0,0 +1,22 @@
+"""Бюджет времени импорта: import proxy.main в чистом процессе (python -X importtime)"""
+import pytest
+
+from proxy.tools.import_budget import HEAVY_MODULES, measure
+
+BUDGET_MS = 800
+RUNS = 3
+
+
+@pytest.fixture(scope="module")
+def best_run():
+    # Лучший из нескольких запусков: первый может читать файлы с холодного диска
+    return min((measure("proxy.main") for _ in range(RUNS)), key=lambda run: run["total_us"])
+
+
+def test_import_is_within_budget(best_run):
+    assert best_run["total_us"] / 1000 <= BUDGET_MS
+
+
+def test_heavy_dependencies_are_not_imported(best_run):
+    loaded = {name for name, _, _ in best_run["imports"]}
+    assert not [name for name in HEAVY_MODULES if name in loaded]
@@ -0,0 +1,49 @@
+"""Дисковый кэш страниц, общий для нескольких воркеров"""
+import threading
+
+from proxy.utils.PageCache_impl import PageCache
+
+PAGE = 1000
+
+
+def _produce(key: str):
+    def write(path):
+        path.write_bytes(key.encode().ljust(PAGE, b"."))
+    return write
+
+
+def test_budget_is_enforced_for_the_whole_directory(tmp_path):
+    # Два экземпляра на одной папке — как два воркера uvicorn
+    workers = [PageCache(tmp_path, max_bytes=10 * PAGE) for _ in range(2)]
+    for i in range(40):
+        workers[i % 2].get_or_create(f"p{i}", _produce(f"p{i}"))
+
+    assert workers[0].stats()["bytes"] <= 10 * PAGE
+    assert workers[1].stats() == workers[0].stats()
+    # Последняя страница только что записана и не вытесняется
+    assert (tmp_path / "p39").exists()
+
+
+def test_reads_survive_eviction_by_another_worker(tmp_path):
+    reader, writer = PageCache(tmp_path, max_bytes=3 * PAGE), PageCache(tmp_path, max_bytes=3 * PAGE)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                assert reader.get_or_create("hot", _produce("hot")).startswith(b"hot")
+            except Exception as e:
+                errors.append(e)
+                return
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    try:
+        for i in range(300):
+            writer.get_or_create(f"cold{i}", _produce(f"cold{i}"))
+    finally:
+        stop.set()
+        thread.join()
+
+    assert not errors
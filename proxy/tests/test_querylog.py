@@ -0,0 +1,32 @@
+"""Запись вопросов из нескольких воркеров: у каждого свой файл, replay читает все"""
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+from proxy.tools.replay import load_capture
+
+ROOT = Path(__file__).resolve().parents[2]
+
+WORKERS = 3
+RECORDS = 200
+
+
+def test_workers_rotate_own_files_without_losing_records(tmp_path):
+    # Маленький размер файла: каждый воркер много раз ротирует свой файл
+    code = textwrap.dedent(f"""
+        import os
+        os.environ.update(QUERY_LOG_DIR={str(tmp_path)!r}, QUERY_LOG_MAX_MB="0.002", QUERY_LOG_BACKUPS="100")
+        from proxy.utils import querylog
+        for i in range({RECORDS}):
+            querylog.record("default", f"{{os.getpid()}}:{{i}}", [{{"id": i, "score": 0.9}}])
+        querylog._stop()
+    """)
+    workers = [subprocess.Popen([sys.executable, "-c", code], cwd=ROOT) for _ in range(WORKERS)]
+    assert all(worker.wait(timeout=60) == 0 for worker in workers)
+
+    entries = load_capture(tmp_path, tenant="", limit=0, include_cached=True)
+
+    assert len({entry["query"] for entry in entries}) == len(entries) == WORKERS * RECORDS
+    assert [entry["ts"] for entry in entries] == sorted(entry["ts"] for entry in entries)
+    assert len({path.name.split(".")[1] for path in tmp_path.iterdir()}) == WORKERS
@@ -0,0 +1,47 @@
+"""Откат переиндексации: алиас возвращается на прежнюю версию, документы — остаются текущими"""
+import pytest
+
+from proxy.tests.conftest import ADMIN_HEADERS, chunk_ids, search_ids, upload
+from proxy.utils import search
+
+
+def test_rollback_keeps_documents_uploaded_after_the_switch(client):
+    # Документ, который попадет в прежнюю версию и будет удален после её замены
+    upload(client, "gone.pdf", "устаревшая карта загрузки")
+    gone = chunk_ids("gone.pdf")
+    assert client.post("/api/v1/admin/reindex", headers=ADMIN_HEADERS).status_code == 200
+    previous = search.get_milvus().get_alias_target("docs")
+    assert client.post("/api/v1/admin/reindex", headers=ADMIN_HEADERS).status_code == 200
+
+    # После переключения: новый документ есть только в живой версии, удаленный — только в прежней
+    upload(client, "late.pdf", "поздний бюллетень закрылки")
+    late = chunk_ids("late.pdf")
+    assert client.delete("/api/v1/chat/doc/gone.pdf").status_code == 200
+
+    r = client.post("/api/v1/admin/reindex/rollback", headers=ADMIN_HEADERS)
+
+    assert r.status_code == 200, r.text
+    assert r.json()["version"] == previous
+    assert r.json()["reinserted"] == len(late)
+    assert r.json()["removed"] == len(gone)
+    assert search.get_milvus().get_alias_target("docs") == previous
+    assert late and late <= search_ids("поздний бюллетень закрылки")
+    assert gone and not gone & search_ids("устаревшая карта загрузки")
+
+
+def test_rollback_is_refused_while_reindex_runs(client):
+    assert search._reindex_lock.acquire(blocking=False)
+    try:
+        r = client.post("/api/v1/admin/reindex/rollback", headers=ADMIN_HEADERS)
+    finally:
+        search._reindex_lock.release()
+    assert r.status_code == 409
+
+
+def test_rollback_takes_the_reindex_lock():
+    search._reindex_lock.acquire()
+    try:
+        with pytest.raises(RuntimeError, match="Reindex is running"):
+            search.rollback()
+    finally:
+        search._reindex_lock.release()
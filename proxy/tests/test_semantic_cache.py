@@ -0,0 +1,56 @@
+"""Сброс семантического кэша по поколениям, общим для воркеров"""
+import time
+
+from proxy.utils.ChunkStore_impl import ChunkStore
+from proxy.utils.SemanticCache_impl import SemanticCache
+
+VEC = [1.0, 0.0, 0.0]
+
+
+def _put(cache: SemanticCache, tenant: str, response: str, generation=None):
+    cache.put(tenant, VEC, query="q", response=response, fragments=[], compute_sec=1.0, generation=generation)
+
+
+def test_invalidate_drops_entries_and_stale_puts(tmp_path):
+    cache = SemanticCache(max_size=10, generations=ChunkStore(tmp_path / "chunks.sqlite3"), generation_ttl_sec=60)
+    _put(cache, "a", "old")
+    _put(cache, "b", "other")
+    assert cache.get("a", VEC).response == "old"
+
+    generation = cache.generation("a")
+    cache.invalidate("a")
+    # Ответ посчитан по индексу до сброса — не записывается, хотя поколение прочитано из памяти
+    _put(cache, "a", "stale", generation=generation)
+    assert cache.get("a", VEC) is None
+    assert cache.get("b", VEC).response == "other"
+
+    _put(cache, "a", "new", generation=cache.generation("a"))
+    assert cache.get("a", VEC).response == "new"
+
+
+def test_invalidate_in_another_worker_applies_after_generation_ttl(tmp_path):
+    path = tmp_path / "chunks.sqlite3"
+    worker = SemanticCache(max_size=10, generations=ChunkStore(path), generation_ttl_sec=0.2)
+    other = SemanticCache(max_size=10, generations=ChunkStore(path), generation_ttl_sec=0.2)
+    _put(worker, "a", "old")
+    assert worker.get("a", VEC) is not None
+
+    other.invalidate("a")
+    time.sleep(0.3)
+    assert worker.get("a", VEC) is None
+
+
+def test_generation_is_not_read_on_every_request(tmp_path):
+    store = ChunkStore(tmp_path / "chunks.sqlite3")
+    reads = []
+    read = store.cache_generation
+    store.cache_generation = lambda tenant: reads.append(tenant) or read(tenant)
+
+    cache = SemanticCache(max_size=10, generations=store, generation_ttl_sec=60)
+    for _ in range(5):
+        cache.get("a", VEC)
+    assert reads == ["a"]
+
+    disabled = SemanticCache(max_size=0, generations=store)
+    assert disabled.generation("a") == 0 and disabled.get("a", VEC) is None
+    assert reads == ["a"]
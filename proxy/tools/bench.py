@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк /api/v1/chat/q, /upload и /doc на настоящем приложении.
+
+Приложение запускается в этом же процессе (httpx.ASGITransport), GigaChat
+заменяется заглушкой с настраиваемой задержкой, Milvus — встроенной заменой
+(--milvus memory) или локальным контейнером (--milvus standalone).
+Модель эмбеддингов настоящая.
+
+Отчет: p50/p95/p99, пропускная способность, разбивка /q по фазам
+(заголовок Server-Timing, в том числе serialize и compress), CPU процесса на запрос,
+размер ответов до и после сжатия, пиковый RSS, память коллекции в Milvus и размер
+хранилища текста чанков. JSON отчет можно сохранить как
+baseline и сравнивать с ним следующие прогоны.
+
+Примеры:
+    python -m proxy.tools.bench --seed-chunks files_chunks.json --scenario q -n 200 -c 8 --output bench.json
+    python -m proxy.tools.bench --pdf-dir td --scenario upload --scenario q --baseline bench.json
+    python -m proxy.tools.bench --pdf-dir td --scenario doc_post --scenario doc --scenario doc_range --scenario doc_304
+    python -m proxy.tools.bench --seed-chunks files_chunks.json --scenario q_same -n 50 -c 25
+    python -m proxy.tools.bench --seed-chunks files_chunks.json --scenario q --scenario q_batch -n 256 --batch-items 32
+    python -m proxy.tools.bench --seed-chunks files_chunks.json --scenario q --accept-encoding identity --fragments snippet
+    python -m proxy.tools.bench --scenario live -n 5000 -c 64 --log-mode sync --output log_sync.json
+    python -m proxy.tools.bench --scenario live -n 5000 -c 64 --log-mode async --baseline log_sync.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import cycle
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+DEFAULT_QUERIES = [
+    "Какой максимальный вес груза разрешен для перевозки?",
+    "Порядок предполетного осмотра воздушного судна",
+    "Действия экипажа при отказе двигателя на взлете",
+    "Периодичность технического обслуживания шасси",
+    "Требования к противообледенительной обработке",
+    "Какие документы должны находиться на борту?",
+]
+
+# Метрики, по которым ищем регрессии относительно baseline: (ключ, больше — хуже)
+REGRESSION_KEYS = [("latency_ms.p50", True), ("latency_ms.p95", True), ("throughput_rps", False)]
+
+# Счетчики приложения, прирост которых за сценарий попадает в отчет
+REPORT_COUNTERS = ["llm_calls", "llm_calls_avoided", "llm_degraded", "q_coalesced", "semantic_cache_hits", "log_dropped"]
+
+
+def configure_env(args):
+    """Переменные окружения нужно выставить до импорта proxy.*"""
+    os.environ["GIGA_BACKEND"] = "fake"
+    os.environ["GIGA_FAKE_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["GIGA_FAKE_JITTER_MS"] = str(args.llm_jitter_ms)
+    os.environ["GIGA_FAKE_ERROR_RATE"] = str(args.llm_error_rate)
+    if args.llm_deadline_sec is not None:
+        os.environ["LLM_DEADLINE_SEC"] = str(args.llm_deadline_sec)
+    os.environ["MILVUS_BACKEND"] = args.milvus
+    os.environ["LOG_ASYNC"] = "true" if args.log_mode == "async" else "false"
+    if args.log_file:
+        # Логи в файл, а не в терминал: вывод в консоль сам по себе искажает замер
+        sys.stderr = open(args.log_file, "a", encoding="utf-8", buffering=1)
+    os.environ.setdefault("DOC_DIR", tempfile.mkdtemp(prefix="bench_docs_"))
+    if args.with_cache:
+        # В сервисе кэш по умолчанию выключен
+        os.environ.setdefault("SEMANTIC_CACHE_SIZE", "1000")
+    else:
+        os.environ["SEMANTIC_CACHE_SIZE"] = "0"
+    # Все запросы бенчмарка идут от одного клиента — лимит частоты клиента его бы остановил
+    os.environ.setdefault("RATE_LIMIT_Q_PER_MIN", "0")
+    os.environ.setdefault("RATE_LIMIT_UPLOAD_PER_MIN", "0")
+    os.environ.setdefault("RATE_LIMIT_BATCH_PER_MIN", "0")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    ms = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "mean": round(float(np.mean(ms)), 2),
+        "max": round(float(np.max(ms)), 2),
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    phases = {}
+    for part in filter(None, (p.strip() for p in (header or "").split(","))):
+        name, _, rest = part.partition(";")
+        if rest.startswith("dur="):
+            phases[name] = float(rest[4:]) / 1000
+    return phases
+
+
+async def run_load(client, make_request: Callable, total: int, concurrency: int) -> Dict[str, Any]:
+    """Выполнить `total` запросов, не более `concurrency` одновременно"""
+    results = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                results.append({
+                    "latency": time.perf_counter() - started,
+                    "status": response.status_code,
+                    # Байты "на проводе" (после сжатия) и размер тела после распаковки
+                    "bytes": response.num_bytes_downloaded,
+                    "body_bytes": len(response.content),
+                    "phases": parse_server_timing(response.headers.get("server-timing")),
+                })
+            except Exception as e:
+                results.append({"latency": time.perf_counter() - started, "status": type(e).__name__,
+                                "bytes": 0, "body_bytes": 0, "phases": {}})
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    summary = summarize(results, wall, concurrency)
+    # CPU всего процесса (приложение и клиент бенчмарка) на запрос — для сравнения прогонов между собой
+    summary["cpu_ms_per_request"] = round((time.process_time() - cpu_started) * 1000 / max(len(results), 1), 3)
+    return summary
+
+
+def summarize(results: List[Dict[str, Any]], wall: float, concurrency: int) -> Dict[str, Any]:
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+
+    phase_names = sorted({name for r in results for name in r["phases"]})
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": sum(1 for r in results if not (isinstance(r["status"], int) and r["status"] < 400)),
+        "statuses": statuses,
+        "wall_sec": round(wall, 3),
+        "throughput_rps": round(len(results) / wall, 3) if wall else 0.0,
+        "latency_ms": percentiles([r["latency"] for r in results]),
+        "phases_ms": {
+            name: percentiles([r["phases"][name] for r in results if name in r["phases"]])
+            for name in phase_names
+        },
+        "response_bytes_mean": round(float(np.mean([r["bytes"] for r in results])), 1) if results else 0.0,
+        "response_bytes_total": int(sum(r["bytes"] for r in results)),
+        "response_body_bytes_mean": round(float(np.mean([r["body_bytes"] for r in results])), 1) if results else 0.0,
+    }
+
+
+def _get(report: Dict[str, Any], dotted: str):
+    for key in dotted.split("."):
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    print()
+    print(f"📊 Сравнение с baseline ({baseline.get('meta', {}).get('commit', '?')}):")
+    for scenario, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        for key, higher_is_worse in REGRESSION_KEYS:
+            old, new = _get(previous, key), _get(current, key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            mark = "❌" if worse else "✅"
+            print(f"   {mark} {scenario}.{key}: {old} → {new} ({change:+.1%})")
+            if worse:
+                regressions.append(f"{scenario}.{key}")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def prepare_doc_scenario(client, scenario: str, args):
+    """Положить PDF в папку документов и вернуть функцию запроса для сценария отдачи документа:
+    doc — полный GET, doc_range — первые --range-kb KB, doc_304 — повторная проверка по ETag,
+    doc_post — старый POST /doc для сравнения"""
+    import shutil
+    from proxy.utils.tenant import tenant_doc_dir
+
+    pdfs = sorted(Path(args.pdf_dir).glob("*.pdf")) if args.pdf_dir else []
+    if not pdfs:
+        print(f"❌ Для сценария {scenario} нужен --pdf-dir с PDF файлами")
+        return None
+    # Самый большой файл — на нем разница между полным и частичным ответом виднее всего
+    pdf = max(pdfs, key=lambda p: p.stat().st_size)
+    doc_dir = tenant_doc_dir(Path(os.environ["DOC_DIR"]), args.tenant)
+    doc_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(pdf, doc_dir / pdf.name)
+    url = f"/api/v1/chat/doc/{pdf.name}"
+
+    if scenario == "doc":
+        return lambda client, i: client.get(url)
+    if scenario == "doc_range":
+        range_header = {"Range": f"bytes=0-{args.range_kb * 1024 - 1}"}
+        return lambda client, i: client.get(url, headers=range_header)
+    if scenario == "doc_304":
+        etag = (await client.head(url)).headers["etag"]
+        return lambda client, i: client.get(url, headers={"If-None-Match": etag})
+    if scenario == "doc_post":
+        return lambda client, i: client.post("/api/v1/chat/doc", json={"docName": pdf.name})
+    print(f"❌ Неизвестный сценарий: {scenario}")
+    return None
+
+
+def storage_report() -> Dict[str, Any]:
+    """Память коллекции в Milvus и размер хранилища текста чанков"""
+    from proxy.utils.search import get_milvus, get_chunk_store
+
+    milvus = get_milvus()
+    milvus.setup_database("rag_db")
+    try:
+        milvus_mb = round(milvus.memory_bytes("docs") / 1024 / 1024, 2)
+    except Exception as e:
+        milvus_mb = f"unavailable: {e}"
+    return {"milvus_memory_mb": milvus_mb, "chunk_store": get_chunk_store().stats()}
+
+
+async def wait_ready(timeout: float):
+    from proxy.utils.warmup import start_warmup, readiness
+
+    start_warmup()
+    deadline = time.time() + timeout
+    while True:
+        state = readiness()
+        if state["status"] == "ready":
+            print(f"✅ Приложение готово за {state['startup_sec']} сек")
+            return state["startup_sec"]
+        if state["status"] == "failed" or time.time() > deadline:
+            print(f"❌ Приложение не стало готовым: {json.dumps(state, ensure_ascii=False)}")
+            sys.exit(1)
+        await asyncio.sleep(1)
+
+
+async def main_async(args):
+    import httpx
+    from proxy.main import app
+    from proxy.utils.search import insert_records
+    from proxy.utils import metrics
+
+    startup_sec = await wait_ready(args.ready_timeout)
+
+    if args.seed_chunks:
+        rows = json.loads(Path(args.seed_chunks).read_text(encoding="utf-8"))
+        inserted = insert_records(rows)
+        print(f"🌱 Загружено {inserted} чанков из {args.seed_chunks}")
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "milvus": args.milvus,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_error_rate": args.llm_error_rate,
+            "log_mode": args.log_mode,
+            "accept_encoding": args.accept_encoding,
+            "fragments": args.fragments,
+            "startup_sec": startup_sec,
+        },
+        "scenarios": {},
+    }
+
+    headers = {"X-Tenant-ID": args.tenant} if args.tenant else {}
+    headers["Accept-Encoding"] = args.accept_encoding
+    q_params = {"fragments": args.fragments}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None, headers=headers) as client:
+        for scenario in args.scenario:
+            print(f"⏳ Сценарий {scenario}: {args.requests} запросов, конкурентность {args.concurrency}...")
+
+            if scenario == "upload":
+                pdfs = sorted(Path(args.pdf_dir).glob("*.pdf")) if args.pdf_dir else []
+                if not pdfs:
+                    print("❌ Для сценария upload нужен --pdf-dir с PDF файлами")
+                    sys.exit(1)
+                files = cycle(pdfs)
+
+                async def make_request(client, i, files=files):
+                    path = next(files)
+                    # Уникальное имя, чтобы параллельные загрузки не перезаписывали один файл
+                    name = f"bench_{i}_{path.name}"
+                    return await client.post(
+                        "/api/v1/chat/upload",
+                        files=[("files", (name, path.read_bytes(), "application/pdf"))],
+                    )
+            elif scenario.startswith("doc"):
+                make_request = await prepare_doc_scenario(client, scenario, args)
+                if make_request is None:
+                    sys.exit(1)
+            elif scenario == "q_same":
+                # Все запросы — один и тот же вопрос с разным регистром и пробелами:
+                # одновременные должны объединяться в один поиск и одну генерацию
+                question = args.same_query
+
+                async def make_request(client, i, question=question):
+                    text = question.upper() if i % 2 else f"  {question}  "
+                    return await client.post("/api/v1/chat/q", json={"request": text}, params=q_params)
+            elif scenario == "live":
+                # Пустой обработчик: время запроса — накладные расходы middleware и логирования
+                async def make_request(client, i):
+                    return await client.get("/api/v1/health/live")
+            elif scenario == "q_batch":
+                # Те же вопросы пакетами по --batch-items: -n — общее число вопросов, как в сценарии q
+                queries = DEFAULT_QUERIES
+                if args.queries:
+                    queries = [q.strip() for q in Path(args.queries).read_text(encoding="utf-8").splitlines() if q.strip()]
+                questions = cycle(queries)
+
+                async def make_request(client, i, questions=questions):
+                    batch = [{"request": next(questions)} for _ in range(args.batch_items)]
+                    return await client.post("/api/v1/chat/q/batch", json={"requests": batch}, params=q_params)
+            elif scenario == "q":
+                queries = DEFAULT_QUERIES
+                if args.queries:
+                    queries = [q.strip() for q in Path(args.queries).read_text(encoding="utf-8").splitlines() if q.strip()]
+                questions = cycle(queries)
+
+                async def make_request(client, i, questions=questions):
+                    return await client.post("/api/v1/chat/q", json={"request": next(questions)}, params=q_params)
+            else:
+                print(f"❌ Неизвестный сценарий: {scenario}")
+                sys.exit(1)
+
+            before = {name: metrics.get(name) for name in REPORT_COUNTERS}
+            total = max(1, args.requests // args.batch_items) if scenario == "q_batch" else args.requests
+            report["scenarios"][scenario] = await run_load(client, make_request, total, args.concurrency)
+            if scenario == "q_batch":
+                summary = report["scenarios"][scenario]
+                summary["questions_per_sec"] = round(summary["throughput_rps"] * args.batch_items, 3)
+            report["scenarios"][scenario]["counters"] = {
+                name: int(metrics.get(name) - before[name]) for name in REPORT_COUNTERS
+            }
+
+    # ru_maxrss в Linux — в килобайтах
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    report["storage"] = storage_report()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк /q, /upload и /doc")
+    parser.add_argument("--scenario", action="append", default=None,
+                        help="q, q_same, q_batch, live, upload, doc, doc_range, doc_304, doc_post (можно несколько раз)")
+    parser.add_argument("--requests", "-n", type=int, default=100, help="Запросов на сценарий (по умолчанию: 100)")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="Одновременных запросов (по умолчанию: 4)")
+    parser.add_argument("--queries", type=str, default=None, help="Файл с вопросами (строка = вопрос)")
+    parser.add_argument("--batch-items", type=int, default=32, help="Вопросов в одном запросе сценария q_batch")
+    parser.add_argument("--same-query", type=str, default=DEFAULT_QUERIES[0], help="Вопрос для сценария q_same")
+    parser.add_argument("--pdf-dir", type=str, default=None, help="Папка с PDF для сценария upload")
+    parser.add_argument("--range-kb", type=int, default=64, help="Размер диапазона в сценарии doc_range")
+    parser.add_argument("--seed-chunks", type=str, default=None, help="files_chunks.json для наполнения индекса")
+    parser.add_argument("--tenant", type=str, default=None, help="Значение заголовка X-Tenant-ID")
+    parser.add_argument("--milvus", choices=["memory", "standalone"], default="memory",
+                        help="memory — встроенная замена, standalone — локальный контейнер Milvus")
+    parser.add_argument("--llm-latency-ms", type=float, default=1500, help="Задержка заглушки GigaChat")
+    parser.add_argument("--llm-jitter-ms", type=float, default=300, help="Разброс задержки заглушки GigaChat")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Доля вызовов заглушки GigaChat с ошибкой")
+    parser.add_argument("--llm-deadline-sec", type=float, default=None, help="LLM_DEADLINE_SEC приложения")
+    parser.add_argument("--accept-encoding", type=str, default="gzip, br",
+                        help="Заголовок Accept-Encoding клиента; identity — без сжатия (по умолчанию: gzip, br)")
+    parser.add_argument("--fragments", choices=["full", "snippet", "ids"], default="full",
+                        help="Вид фрагментов в ответах /q и /q/batch")
+    parser.add_argument("--with-cache", action="store_true", help="Не отключать семантический кэш")
+    parser.add_argument("--log-mode", choices=["async", "sync"], default="async",
+                        help="async — запись логов через очередь в отдельном потоке, sync — прямо из запроса")
+    parser.add_argument("--log-file", type=str, default=None, help="Писать логи приложения в файл, а не в stderr")
+    parser.add_argument("--ready-timeout", type=float, default=900, help="Сколько ждать прогрева приложения")
+    parser.add_argument("--output", type=str, default=None, help="Куда сохранить JSON отчет")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON отчет прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Допустимое ухудшение (по умолчанию: 0.15)")
+    args = parser.parse_args()
+    args.scenario = args.scenario or ["q"]
+
+    configure_env(args)
+    report = asyncio.run(main_async(args))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"💾 Отчет сохранен в {args.output}")
+
+    same = report["scenarios"].get("q_same")
+    if same and args.concurrency > 1 and same["counters"]["q_coalesced"] == 0:
+        print("❌ q_same: одновременные одинаковые вопросы не объединились")
+        sys.exit(1)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ Регрессии: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Офлайн-индексация папки с PDF напрямую в Milvus, минуя HTTP и веб-контейнер.
+
+Разбор PDF выполняется пулом процессов (по умолчанию — все ядра), эмбеддинги
+считаются большими батчами, вставка в Milvus — крупными пачками. После каждой
+пачки сохраняется чекпоинт, поэтому прерванный запуск продолжается с того же места.
+Новые чанки дописываются и в files_chunks.json, чтобы полная переиндексация их не потеряла.
+
+PDF попадают в папку документов тенанта (DOC_DIR/<tenant>), откуда их отдают /doc и /page:
+жесткой ссылкой, если папки на одной файловой системе, иначе копией (--stage).
+Копии файлов, которые не удалось разобрать или вставить, удаляются.
+Утилита работает одновременно с сервисом: id чанков выделяются из общего счетчика, а вставка
+каждой пачки идет под той же блокировкой, что и загрузки через /upload.
+
+Пример:
+    python -m proxy.tools.bulk_index --folder /data/manuals --tenant aeroflot
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_chunker = None
+
+
+def _parse_file(path: str) -> Tuple[str, List[Tuple[str, Dict[str, Any]]]]:
+    """Выполняется в процессе пула: PDF -> [(текст чанка, метаданные)]"""
+    global _chunker
+    if _chunker is None:
+        from proxy.utils.TextChunker_impl import TextChunker
+        _chunker = TextChunker()
+
+    docs = _chunker.load_pdf_documents(Path(path))
+    if sum(len(doc.page_content) for doc in docs) == 0:
+        return path, []
+    chunks = _chunker.splitting(docs)
+    return path, [(chunk.page_content, dict(chunk.metadata)) for chunk in chunks]
+
+
+class Checkpoint:
+    """Чекпоинт: готовые файлы и пачка, которая вставлялась в момент остановки"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.state = {"done": {}, "in_flight": None}
+        if path.exists():
+            self.state.update(json.loads(path.read_text(encoding="utf-8")))
+
+    def save(self):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def file_key(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def stage_pdf(path: Path, doc_dir: Path, mode: str = "link") -> Optional[Path]:
+    """PDF в папке документов тенанта (None — файл с тем же именем там уже другой).
+
+    link — жесткая ссылка (место на диске не удваивается), а если папки на разных
+    файловых системах — копия; symlink — символическая ссылка; copy — всегда копия"""
+    from proxy.utils.docfiles import safe_doc_name
+
+    try:
+        target = doc_dir / safe_doc_name(path.name)
+    except ValueError:
+        print(f"⚠️  Недопустимое имя файла {path.name}, пропускаем")
+        return None
+    if target.exists():
+        if target.resolve() == path.resolve() or file_key(target) == file_key(path):
+            return target
+        print(f"⚠️  В {doc_dir} уже есть другой {target.name}; замените его через PUT /doc/{target.name}, пропускаем")
+        return None
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        if mode == "link":
+            os.link(path, tmp)
+        elif mode == "symlink":
+            os.symlink(path.resolve(), tmp)
+        else:
+            raise OSError("copy requested")
+    except OSError:
+        # copy2 сохраняет время изменения: при повторном запуске копия совпадет с оригиналом по file_key
+        shutil.copy2(path, tmp)
+    os.replace(tmp, target)
+    return target
+
+
+def unstage_pdf(target: Path, original: Path, tenant: str):
+    """Убрать файл из папки документов, если его чанков в индексе нет
+    (разбор или вставка не удались, иначе /doc отдавал бы непроиндексированный файл)"""
+    from proxy.utils.search import is_document_indexed
+
+    if target.resolve() == original.resolve() or is_document_indexed(target.name, tenant):
+        return
+    target.unlink(missing_ok=True)
+
+
+def rollback_in_flight(checkpoint: Checkpoint, args):
+    """Удалить следы пачки, вставка которой была прервана (чтобы не получить дубли).
+    id пачки выделены из общего счетчика только этой утилите, чужие чанки не затрагиваются"""
+    in_flight = checkpoint.state.get("in_flight")
+    if not in_flight:
+        return
+    first, last = in_flight["first_id"], in_flight["last_id"]
+    print(f"🧹 Откатываем незавершенную пачку: id {first}..{last}")
+
+    from proxy.utils.search import (
+        get_milvus, get_chunk_store, ingest_lock, read_bulk_records, write_bulk_records, BULK_SIDECAR
+    )
+    with ingest_lock:
+        milvus = get_milvus()
+        milvus.setup_database(args.name_db)
+        try:
+            milvus.delete_by_expr(args.collection, f"id in [{', '.join(str(i) for i in range(first, last + 1))}]")
+        except Exception as e:
+            print(f"⚠️  Не удалось удалить строки из Milvus: {e}")
+        get_chunk_store().delete_ids(list(range(first, last + 1)))
+
+        if BULK_SIDECAR.exists():
+            write_bulk_records([row for row in read_bulk_records() if not (first <= int(row["id"]) <= last)])
+
+    checkpoint.state["in_flight"] = None
+    checkpoint.save()
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.time()
+        self.files = 0
+        self.chunks = 0
+        self.parse_wait_sec = 0.0
+        self.embed_sec = 0.0
+        self.insert_sec = 0.0
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = max(time.time() - self.started, 1e-6)
+        return {
+            "files": self.files,
+            "chunks": self.chunks,
+            "elapsed_sec": round(elapsed, 1),
+            "docs_per_hour": round(self.files / elapsed * 3600, 1),
+            "chunks_per_sec": round(self.chunks / elapsed, 2),
+            "parse_wait_sec": round(self.parse_wait_sec, 1),
+            "embed_sec": round(self.embed_sec, 1),
+            "insert_sec": round(self.insert_sec, 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-индексация PDF в Milvus")
+    parser.add_argument("--folder", "-f", type=str, required=True, help="Папка с PDF файлами")
+    parser.add_argument("--tenant", type=str, default=None, help="Тенант (по умолчанию — тенант по умолчанию)")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1,
+                        help="Процессов для разбора PDF (по умолчанию: все ядра)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1,
+                        help="Потоков torch для эмбеддингов (по умолчанию: все ядра)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Размер батча эмбеддингов")
+    parser.add_argument("--flush-rows", type=int, default=5000, help="Чанков в одной вставке в Milvus")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                        help="Файл чекпоинта (по умолчанию: <папка>/.bulk_index_checkpoint.json)")
+    parser.add_argument("--stage", choices=["link", "symlink", "copy"], default="link",
+                        help="Как класть PDF в папку документов: жесткая ссылка (с откатом на копию), "
+                             "символическая ссылка или копия (по умолчанию: link)")
+    parser.add_argument("--name-db", type=str, default="rag_db")
+    parser.add_argument("--collection", type=str, default="docs")
+    args = parser.parse_args()
+
+    from proxy.utils.log import setup_logging
+    from proxy.utils.tenant import normalize_tenant, tenant_doc_dir
+    from proxy.utils.search import (
+        DOC_DIR, BULK_SIDECAR, get_embedding_model, get_chunk_store, insert_records, chunk_page,
+        ingest_lock, allocate_chunk_ids, merge_bulk_records
+    )
+
+    setup_logging()
+    folder = Path(args.folder)
+    tenant = normalize_tenant(args.tenant)
+    doc_dir = tenant_doc_dir(DOC_DIR, tenant)
+    doc_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(Path(args.checkpoint) if args.checkpoint else folder / ".bulk_index_checkpoint.json")
+
+    rollback_in_flight(checkpoint, args)
+
+    pdfs = sorted(folder.glob("*.pdf"))
+    todo = [p for p in pdfs if checkpoint.state["done"].get(p.name) != file_key(p)]
+    print(f"📁 PDF: {len(pdfs)}, уже проиндексировано: {len(pdfs) - len(todo)}, осталось: {len(todo)}")
+    # Разбираются копии в папке тенанта: source чанков указывает на файл, который отдает /doc
+    staged = {}
+    for p in todo:
+        target = stage_pdf(p, doc_dir, args.stage)
+        if target is not None:
+            staged[str(target)] = p
+    if not staged:
+        print(f"📝 Перенесено в files_chunks.json: {merge_bulk_records()} записей")
+        return
+
+    try:
+        import torch
+        torch.set_num_threads(args.threads)
+    except ImportError:
+        pass
+    emb = get_embedding_model()
+
+    stats = Stats()
+    buffer: List[Tuple[Path, List[Tuple[str, Dict[str, Any]]]]] = []
+    buffered_chunks = 0
+
+    def flush():
+        nonlocal buffer, buffered_chunks
+        if not buffer:
+            return
+        texts = [text for _, chunks in buffer for text, _ in chunks]
+
+        started = time.time()
+        vectors = emb.embedding_model.encode(texts, batch_size=args.batch_size) if texts else []
+        stats.embed_sec += time.time() - started
+
+        rows = []
+        i = 0
+        for path, chunks in buffer:
+            for text, metadata in chunks:
+                vec = vectors[i]
+                rows.append({
+                    "id": None,
+                    "source": metadata.get("source", str(path)),
+                    "embeddings": vec.tolist() if hasattr(vec, "tolist") else vec,
+                    "content": text,
+                    "page": chunk_page(metadata),
+                    "token_count": metadata.get("token_count"),
+                    "tenant": tenant,
+                })
+                i += 1
+
+        if rows:
+            # Загрузки сервиса и переиндексация ждут конца вставки пачки: id берутся из общего счетчика,
+            # а переиндексация видит либо всю пачку (в BULK_SIDECAR), либо ничего
+            try:
+                with ingest_lock:
+                    first_id = allocate_chunk_ids(len(rows))
+                    for offset, row in enumerate(rows):
+                        row["id"] = first_id + offset
+                    # Сначала фиксируем диапазон id: при падении во время вставки он будет откатан
+                    checkpoint.state["in_flight"] = {"first_id": first_id, "last_id": first_id + len(rows) - 1}
+                    checkpoint.save()
+                    with open(BULK_SIDECAR, "a", encoding="utf-8") as f:
+                        for row in rows:
+                            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    started = time.time()
+                    insert_records(rows, name_db=args.name_db, collec=args.collection)
+                    stats.insert_sec += time.time() - started
+            except Exception:
+                # Откатываем пачку сразу, чтобы убрать и файлы, которые в индекс так и не попали
+                rollback_in_flight(checkpoint, args)
+                for path, _ in buffer:
+                    unstage_pdf(path, staged[str(path)], tenant)
+                raise
+
+        for path, _ in buffer:
+            original = staged[str(path)]
+            checkpoint.state["done"][original.name] = file_key(original)
+        checkpoint.state["in_flight"] = None
+        checkpoint.save()
+
+        stats.files += len(buffer)
+        stats.chunks += len(rows)
+        buffer, buffered_chunks = [], 0
+        print(f"📈 {json.dumps(stats.report(), ensure_ascii=False)}", flush=True)
+
+    with ProcessPoolExecutor(max_workers=args.parse_workers) as pool:
+        futures = {pool.submit(_parse_file, path): path for path in staged}
+        waited = time.time()
+        for future in as_completed(futures):
+            try:
+                path, chunks = future.result()
+            except Exception as e:
+                path = futures[future]
+                print(f"❌ Ошибка разбора {Path(path).name}: {e}")
+                unstage_pdf(Path(path), staged[path], tenant)
+                continue
+            stats.parse_wait_sec += time.time() - waited
+            if not chunks:
+                print(f"⚠️  В {Path(path).name} нет текста, пропускаем")
+                # Файл отмечается готовым в чекпоинте, но в папке документов не остается
+                unstage_pdf(Path(path), staged[path], tenant)
+            # Пачка всегда состоит из целых файлов — так чекпоинт отмечает только полностью вставленные
+            buffer.append((Path(path), chunks))
+            buffered_chunks += len(chunks)
+            if buffered_chunks >= args.flush_rows:
+                flush()
+            waited = time.time()
+        flush()
+
+    merged = merge_bulk_records()
+    print(f"📝 Перенесено в files_chunks.json: {merged} записей")
+    # Поколение кэша общее с сервисом: ответы тенанта, посчитанные до загрузки, больше не отдаются
+    get_chunk_store().bump_cache_generation(tenant)
+    print("=" * 60)
+    print(f"✅ Готово: {json.dumps(stats.report(), ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
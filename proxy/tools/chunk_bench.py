@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Сравнение способов разбиения PDF на чанки (structured / recursive): число чанков,
+размер в токенах (сколько чанков модель обрежет на 512), время разбора и
+эмбеддингов, качество поиска на размеченных вопросах.
+
+Разметка — JSONL, строка на вопрос: {"query": "...", "source": "manual.pdf", "page": 12}
+(page необязателен). Попадание засчитывается, если среди top-k чанков есть чанк
+из этого файла (hit@k по документу) и с этой страницы (hit@k по странице).
+
+Пример:
+    python -m proxy.tools.chunk_bench --pdf-dir td --labels labels.jsonl --output chunks.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Предел длины входа e5: всё, что длиннее, модель молча обрезает
+MODEL_MAX_TOKENS = 512
+
+
+def load_labels(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return []
+    return [json.loads(line) for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def evaluate(chunks, chunk_vecs: np.ndarray, labels: List[Dict[str, Any]], query_vecs: np.ndarray, k: int):
+    sources = [Path(c.metadata.get("source", "")).name for c in chunks]
+    pages = [int(c.metadata["page"]) + 1 if c.metadata.get("page") is not None else None for c in chunks]
+
+    doc_hits, page_hits, page_total, reciprocal_ranks = 0, 0, 0, []
+    for label, q in zip(labels, query_vecs):
+        top = np.argsort(-(chunk_vecs @ q))[:k]
+        target = Path(label["source"]).name
+        ranks = [rank for rank, i in enumerate(top, 1) if sources[i] == target]
+        doc_hits += bool(ranks)
+        reciprocal_ranks.append(1.0 / ranks[0] if ranks else 0.0)
+        if label.get("page") is not None:
+            page_total += 1
+            page_hits += any(sources[i] == target and pages[i] == int(label["page"]) for i in top)
+
+    n = len(labels)
+    return {
+        "queries": n,
+        f"doc_hit@{k}": round(doc_hits / n, 3) if n else None,
+        f"page_hit@{k}": round(page_hits / page_total, 3) if page_total else None,
+        "mrr": round(float(np.mean(reciprocal_ranks)), 3) if n else None,
+    }
+
+
+def run_chunker(mode: str, pdfs: List[Path], model, labels, query_vecs, args) -> Dict[str, Any]:
+    from proxy.utils.TextChunker_impl import TextChunker
+
+    chunker = TextChunker(mode=mode, tokenizer=model.tokenizer)
+
+    started = time.perf_counter()
+    chunks = []
+    for pdf in pdfs:
+        chunks.extend(chunker.splitting(chunker.load_pdf_documents(pdf)))
+    chunk_sec = time.perf_counter() - started
+
+    if not chunks:
+        return {"chunks": 0}
+
+    started = time.perf_counter()
+    vecs = model.encode([c.page_content for c in chunks], batch_size=args.batch_size, normalize_embeddings=True)
+    embed_sec = time.perf_counter() - started
+
+    tokens = np.asarray([c.metadata["token_count"] for c in chunks])
+    report = {
+        "chunks": len(chunks),
+        "tokens": {
+            "mean": round(float(tokens.mean()), 1),
+            "p95": int(np.percentile(tokens, 95)),
+            "max": int(tokens.max()),
+            "total": int(tokens.sum()),
+            "truncated_chunks": int((tokens > MODEL_MAX_TOKENS).sum()),
+        },
+        "chunk_sec": round(chunk_sec, 2),
+        "embed_sec": round(embed_sec, 2),
+        "ingest_sec": round(chunk_sec + embed_sec, 2),
+    }
+    if labels:
+        report["retrieval"] = evaluate(chunks, np.asarray(vecs), labels, query_vecs, args.k)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение способов разбиения на чанки")
+    parser.add_argument("--pdf-dir", type=str, required=True, help="Папка с PDF")
+    parser.add_argument("--labels", type=str, default=None, help="JSONL с размеченными вопросами")
+    parser.add_argument("--chunker", action="append", default=None, help="structured, recursive (можно несколько раз)")
+    parser.add_argument("--k", type=int, default=5, help="Глубина поиска для hit@k (по умолчанию: 5)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Размер батча эмбеддингов")
+    parser.add_argument("--output", type=str, default=None, help="Куда сохранить JSON отчет")
+    args = parser.parse_args()
+    chunkers = args.chunker or ["recursive", "structured"]
+
+    pdfs = sorted(Path(args.pdf_dir).glob("*.pdf"))
+    if not pdfs:
+        print(f"❌ В {args.pdf_dir} нет PDF файлов")
+        sys.exit(1)
+
+    from proxy.utils.TextEncoder_impl import TextEmbedding
+
+    model = TextEmbedding().embedding_model
+    labels = load_labels(args.labels)
+    query_vecs = np.asarray(model.encode([l["query"] for l in labels], normalize_embeddings=True)) if labels else None
+
+    report: Dict[str, Any] = {"pdfs": len(pdfs), "chunkers": {}}
+    for mode in chunkers:
+        print(f"⏳ {mode}...")
+        report["chunkers"][mode] = run_chunker(mode, pdfs, model, labels, query_vecs, args)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"💾 Отчет сохранен в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
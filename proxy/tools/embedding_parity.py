@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Сравнение бэкендов эмбеддингов (torch fp32 / int8 / onnx): совпадение векторов
+с эталонной fp32 моделью, recall@k, задержка, пропускная способность и память.
+
+Каждый бэкенд запускается в отдельном процессе, чтобы пиковая память (RSS)
+одного не смешивалась с другим.
+
+Пример:
+    python -m proxy.tools.embedding_parity --candidate int8 --candidate onnx --output parity.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import random
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def load_texts(path: Path, limit: int, seed: int) -> List[str]:
+    """Тексты корпуса: files_chunks.json (поле content) или текстовый файл (строка = текст)"""
+    if path.suffix == ".json":
+        rows = json.loads(path.read_text(encoding="utf-8"))
+        texts = [str(r.get("content", "")) for r in rows if r.get("content")]
+    else:
+        texts = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    random.Random(seed).shuffle(texts)
+    return texts[:limit]
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _run_backend(backend: str, corpus: List[str], queries: List[str], batch_size: int, conn):
+    """Выполняется в дочернем процессе: загрузка, кодирование, замеры"""
+    from proxy.utils.TextEncoder_impl import TextEmbedding
+
+    started = time.perf_counter()
+    model = TextEmbedding(backend=backend).embedding_model
+    load_sec = time.perf_counter() - started
+
+    started = time.perf_counter()
+    corpus_vecs = model.encode(corpus, batch_size=batch_size, normalize_embeddings=True)
+    corpus_sec = time.perf_counter() - started
+
+    # Задержка одиночного запроса — как в /q
+    latencies = []
+    query_vecs = []
+    for query in queries:
+        started = time.perf_counter()
+        query_vecs.append(model.encode(query, normalize_embeddings=True))
+        latencies.append(time.perf_counter() - started)
+
+    conn.send({
+        "backend": backend,
+        "load_sec": round(load_sec, 3),
+        "corpus_texts_per_sec": round(len(corpus) / corpus_sec, 2) if corpus_sec else 0.0,
+        "query_latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "mean": round(float(np.mean(latencies)) * 1000, 2) if latencies else 0.0,
+        },
+        # ru_maxrss в Linux — в килобайтах
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "corpus_vecs": np.asarray(corpus_vecs, dtype=np.float32),
+        "query_vecs": np.asarray(query_vecs, dtype=np.float32),
+    })
+    conn.close()
+
+
+def run_backend(backend: str, corpus: List[str], queries: List[str], batch_size: int) -> Dict[str, Any]:
+    ctx = mp.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_run_backend, args=(backend, corpus, queries, batch_size, child_conn))
+    proc.start()
+    result = parent_conn.recv()
+    proc.join()
+    return result
+
+
+def compare(reference: Dict[str, Any], candidate: Dict[str, Any], k: int) -> Dict[str, Any]:
+    # Векторы нормированы, поэтому скалярное произведение = косинус
+    cos = np.sum(reference["corpus_vecs"] * candidate["corpus_vecs"], axis=1)
+
+    ref_scores = reference["query_vecs"] @ reference["corpus_vecs"].T
+    cand_scores = candidate["query_vecs"] @ candidate["corpus_vecs"].T
+    k = min(k, ref_scores.shape[1])
+    recalls = []
+    for ref_row, cand_row in zip(ref_scores, cand_scores):
+        ref_top = set(np.argsort(-ref_row)[:k].tolist())
+        cand_top = set(np.argsort(-cand_row)[:k].tolist())
+        recalls.append(len(ref_top & cand_top) / k)
+
+    return {
+        "cosine_mean": round(float(np.mean(cos)), 5),
+        "cosine_min": round(float(np.min(cos)), 5),
+        "cosine_p5": round(percentile(cos.tolist(), 5), 5),
+        f"recall@{k}": round(float(np.mean(recalls)), 4) if recalls else 0.0,
+        "speedup_query_p50": round(
+            reference["query_latency_ms"]["p50"] / candidate["query_latency_ms"]["p50"], 2
+        ) if candidate["query_latency_ms"]["p50"] else 0.0,
+        "speedup_throughput": round(
+            candidate["corpus_texts_per_sec"] / reference["corpus_texts_per_sec"], 2
+        ) if reference["corpus_texts_per_sec"] else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов эмбеддингов с эталонной fp32 моделью")
+    parser.add_argument("--texts", type=str, default="files_chunks.json",
+                        help="Корпус: files_chunks.json или текстовый файл (по умолчанию: files_chunks.json)")
+    parser.add_argument("--queries", type=str, default=None,
+                        help="Файл с запросами (строка = запрос); по умолчанию — начала текстов корпуса")
+    parser.add_argument("--candidate", action="append", default=None,
+                        help="Проверяемый бэкенд: int8 или onnx (можно указать несколько раз)")
+    parser.add_argument("--limit", type=int, default=500, help="Размер корпуса (по умолчанию: 500)")
+    parser.add_argument("--num-queries", type=int, default=50, help="Число запросов (по умолчанию: 50)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Размер батча кодирования корпуса")
+    parser.add_argument("--k", type=int, default=10, help="k для recall@k (по умолчанию: 10)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="Куда сохранить JSON отчет")
+    args = parser.parse_args()
+
+    candidates = args.candidate or ["int8"]
+    corpus = load_texts(Path(args.texts), args.limit, args.seed)
+    if not corpus:
+        print(f"❌ Нет текстов в {args.texts}")
+        sys.exit(1)
+
+    if args.queries:
+        queries = load_texts(Path(args.queries), args.num_queries, args.seed)
+    else:
+        queries = [text[:200] for text in corpus[:args.num_queries]]
+
+    print(f"📊 Корпус: {len(corpus)} текстов, запросов: {len(queries)}")
+    print("⏳ Эталон: torch fp32...")
+    reference = run_backend("torch", corpus, queries, args.batch_size)
+
+    report = {"reference": {k: v for k, v in reference.items() if not k.endswith("_vecs")}, "candidates": []}
+    for backend in candidates:
+        print(f"⏳ Кандидат: {backend}...")
+        candidate = run_backend(backend, corpus, queries, args.batch_size)
+        entry = {k: v for k, v in candidate.items() if not k.endswith("_vecs")}
+        entry["parity"] = compare(reference, candidate, args.k)
+        report["candidates"].append(entry)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"💾 Отчет сохранен в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Проверка времени импорта приложения (python -X importtime).
+
+Импорт proxy.main не должен тянуть тяжелые зависимости (torch, sentence_transformers,
+pymilvus, gigachat, langchain): они импортируются фабриками компонентов при первом
+использовании. Утилита несколько раз импортирует модуль в чистом процессе, берет
+лучший результат и завершается с кодом 1, если он больше бюджета или среди
+импортированных модулей есть запрещенные.
+
+Пример:
+    python -m proxy.tools.import_budget --budget-ms 800 --output import_budget.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Пакеты, которые должны загружаться только при первом использовании
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers", "onnxruntime", "pymilvus", "gigachat",
+                 "langchain_core", "langchain_community", "langchain_text_splitters", "pdfplumber", "fitz"]
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def measure(module: str) -> Dict[str, Any]:
+    """Один импорт в новом процессе: [(модуль, собственное время, с зависимостями)], мкс"""
+    env = dict(os.environ)
+    # proxy.utils.* читают DOC_DIR при импорте
+    env.setdefault("DOC_DIR", tempfile.gettempdir())
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    total_us = next((cumulative for name, _, cumulative in imports if name == module), 0)
+    return {"total_us": total_us, "imports": imports}
+
+
+def top_packages(imports: List, limit: int) -> List[Dict[str, Any]]:
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in imports:
+        by_package[name.split(".")[0]] += self_us
+    ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"package": package, "ms": round(us / 1000, 1)} for package, us in ranked]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бюджет времени импорта приложения")
+    parser.add_argument("--module", type=str, default="proxy.main", help="Проверяемый модуль (по умолчанию: proxy.main)")
+    parser.add_argument("--budget-ms", type=float, default=800, help="Допустимое время импорта, мс (по умолчанию: 800)")
+    parser.add_argument("--runs", type=int, default=3, help="Сколько раз импортировать; берется лучший результат")
+    parser.add_argument("--forbid", action="append", default=None,
+                        help="Модуль, который не должен импортироваться (по умолчанию: torch, pymilvus, gigachat, ...)")
+    parser.add_argument("--top", type=int, default=10, help="Сколько самых медленных пакетов показать")
+    parser.add_argument("--output", type=str, default=None, help="Куда сохранить JSON отчет")
+    args = parser.parse_args()
+
+    forbidden = args.forbid or HEAVY_MODULES
+    runs = [measure(args.module) for _ in range(max(args.runs, 1))]
+    best = min(runs, key=lambda run: run["total_us"])
+
+    loaded = {name for name, _, _ in best["imports"]}
+    leaked = sorted(name for name in forbidden if name in loaded)
+    total_ms = round(best["total_us"] / 1000, 1)
+
+    report = {
+        "module": args.module,
+        "import_ms": total_ms,
+        "runs_ms": [round(run["total_us"] / 1000, 1) for run in runs],
+        "budget_ms": args.budget_ms,
+        "modules_imported": len(loaded),
+        "forbidden_imported": leaked,
+        "top_packages": top_packages(best["imports"], args.top),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"💾 Отчет сохранен в {args.output}")
+
+    failed = False
+    if leaked:
+        print(f"❌ При импорте {args.module} загружены тяжелые зависимости: {', '.join(leaked)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"❌ Импорт {args.module}: {total_ms} мс, бюджет {args.budget_ms} мс")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print(f"✅ Импорт {args.module}: {total_ms} мс (бюджет {args.budget_ms} мс)")
+
+
+if __name__ == "__main__":
+    main()
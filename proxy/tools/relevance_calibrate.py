@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Подбор порогов отсечения слабых совпадений (RELEVANCE_MIN_SCORE, RELEVANCE_MAX_GAP,
+RELEVANCE_MIN_EVIDENCE) по размеченным вопросам.
+
+Разметка — JSONL, строка на вопрос: {"query": "...", "answerable": true}.
+answerable=false — вопросы, ответа на которые в базе нет: для них GigaChat вызывать не нужно.
+Поиск выполняется по текущему индексу (Milvus из переменных окружения) в партиции тенанта.
+
+Из всех комбинаций порогов выбирается та, что отсекает больше всего вопросов без ответа,
+сохраняя долю отвеченных вопросов с ответом не ниже --min-recall.
+
+С --cache-pairs подбирается и порог семантического кэша (SEMANTIC_CACHE_THRESHOLD).
+Разметка — JSONL с парами вопросов: {"a": "...", "b": "...", "same": true}, same=true —
+у вопросов один и тот же ответ. Рекомендуется наименьший порог, при котором ни одна пара
+с разными ответами не попадает в кэш.
+
+Пример:
+    python -m proxy.tools.relevance_calibrate --labels relevance.jsonl --min-recall 0.95 --output relevance.json
+    python -m proxy.tools.relevance_calibrate --cache-pairs cache_pairs.jsonl
+"""
+import argparse
+import json
+import sys
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+GAPS = [0.0, 0.01, 0.02, 0.03, 0.05, 0.08, 0.1, 0.15]
+MIN_EVIDENCE = [1, 2, 3, 4, 5]
+
+
+def evaluate(scores: List[List[float]], answerable: List[bool], min_score: float, max_gap: float,
+             min_evidence: int) -> Dict[str, Any]:
+    from proxy.utils.relevance import select
+
+    answered = [select(s, min_score, max_gap, min_evidence)[1] is None for s in scores]
+    positives = [a for a, label in zip(answered, answerable) if label]
+    negatives = [a for a, label in zip(answered, answerable) if not label]
+    return {
+        "min_score": round(min_score, 4),
+        "max_gap": max_gap,
+        "min_evidence": min_evidence,
+        # Доля вопросов с ответом, на которые GigaChat все еще вызывается
+        "recall": round(sum(positives) / len(positives), 3) if positives else None,
+        # Доля вопросов без ответа, отсеченных без вызова GigaChat
+        "rejected_unanswerable": round(1 - sum(negatives) / len(negatives), 3) if negatives else None,
+        "llm_calls_avoided": len(answered) - sum(answered),
+    }
+
+
+def calibrate(scores: List[List[float]], answerable: List[bool], min_recall: float) -> Dict[str, Any]:
+    tops = [s[0] for s in scores if s]
+    thresholds = [0.0] + (sorted(set(np.round(np.linspace(min(tops), max(tops), 50), 4).tolist())) if tops else [])
+
+    best = None
+    for min_score, max_gap, min_evidence in product(thresholds, GAPS, MIN_EVIDENCE):
+        result = evaluate(scores, answerable, min_score, max_gap, min_evidence)
+        if result["recall"] is not None and result["recall"] < min_recall:
+            continue
+        key = (result["rejected_unanswerable"] or 0.0, result["recall"] or 0.0, -max_gap, -min_evidence)
+        if best is None or key > best[0]:
+            best = (key, result)
+    return best[1] if best else None
+
+
+def calibrate_cache(similarities: List[float], same: List[bool]) -> Dict[str, Any]:
+    """Порог кэша: чуть выше самой близкой пары вопросов с разными ответами"""
+    different = [s for s, label in zip(similarities, same) if not label]
+    positives = [s for s, label in zip(similarities, same) if label]
+    threshold = min(round(max(different) + 0.001, 4), 1.0) if different else 0.95
+    return {
+        "threshold": threshold,
+        # Доля переформулировок, которые будут отдаваться из кэша
+        "hit_rate": round(sum(s >= threshold for s in positives) / len(positives), 3) if positives else None,
+        "max_different_similarity": round(max(different), 4) if different else None,
+    }
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор порогов релевантности для отсечения вызовов GigaChat")
+    parser.add_argument("--labels", type=str, default=None, help="JSONL с вопросами и признаком answerable")
+    parser.add_argument("--cache-pairs", type=str, default=None,
+                        help="JSONL с парами вопросов и признаком same для порога семантического кэша")
+    parser.add_argument("--tenant", type=str, default=None, help="Тенант, в партиции которого искать")
+    parser.add_argument("--min-recall", type=float, default=0.95,
+                        help="Минимальная доля вопросов с ответом, которые должны дойти до GigaChat (по умолчанию: 0.95)")
+    parser.add_argument("--output", type=str, default=None, help="Куда сохранить JSON отчет")
+    args = parser.parse_args()
+
+    if not args.labels and not args.cache_pairs:
+        parser.error("нужен --labels и/или --cache-pairs")
+
+    from proxy.utils import relevance
+    from proxy.utils.search import SEMANTIC_CACHE_THRESHOLD, embed_queries, search_fragments_batch
+
+    report: Dict[str, Any] = {}
+    if args.labels:
+        labels = read_jsonl(args.labels)
+        if not labels:
+            print(f"❌ В {args.labels} нет вопросов")
+            sys.exit(1)
+
+        query_vecs = embed_queries([label["query"] for label in labels])
+        found = search_fragments_batch(query_vecs, tenant=args.tenant)
+        scores = [[fragment["score"] for fragment in fragments] for fragments in found]
+        answerable = [bool(label.get("answerable", True)) for label in labels]
+
+        report.update({
+            "queries": len(labels),
+            "answerable": sum(answerable),
+            "current": evaluate(
+                scores, answerable,
+                relevance.RELEVANCE_MIN_SCORE, relevance.RELEVANCE_MAX_GAP, relevance.RELEVANCE_MIN_EVIDENCE
+            ),
+            "recommended": calibrate(scores, answerable, args.min_recall),
+        })
+
+    if args.cache_pairs:
+        pairs = read_jsonl(args.cache_pairs)
+        if not pairs:
+            print(f"❌ В {args.cache_pairs} нет пар вопросов")
+            sys.exit(1)
+
+        vecs = np.asarray(embed_queries([p["a"] for p in pairs] + [p["b"] for p in pairs]), dtype=np.float32)
+        vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        similarities = np.sum(vecs[:len(pairs)] * vecs[len(pairs):], axis=1).tolist()
+        same = [bool(p.get("same", False)) for p in pairs]
+        recommended = calibrate_cache(similarities, same)
+        report["cache"] = {
+            "pairs": len(pairs),
+            "current_threshold": SEMANTIC_CACHE_THRESHOLD,
+            # Пары с разными ответами, которые при текущем пороге получили бы чужой ответ из кэша
+            "current_false_hits": sum(s >= SEMANTIC_CACHE_THRESHOLD for s, label in zip(similarities, same) if not label),
+            "recommended": recommended,
+        }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"💾 Отчет сохранен в {args.output}")
+
+    print("\nПеременные для proxy/.env:")
+    if "cache" in report:
+        print(f"SEMANTIC_CACHE_THRESHOLD={report['cache']['recommended']['threshold']}")
+    if args.labels:
+        best = report["recommended"]
+        if best is None:
+            print(f"❌ Ни одна комбинация порогов не дает recall >= {args.min_recall}")
+            sys.exit(1)
+        print(f"RELEVANCE_MIN_SCORE={best['min_score']}")
+        print(f"RELEVANCE_MAX_GAP={best['max_gap']}")
+        print(f"RELEVANCE_MIN_EVIDENCE={best['min_evidence']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Повтор записанных вопросов /q на текущей (или проверяемой) конфигурации индекса.
+
+Вопросы записываются приложением при заданном QUERY_LOG_DIR (у каждого воркера свои файлы
+q.<pid>.jsonl, q.<pid>.jsonl.1, ...):
+вопрос, id и сходство найденных чанков, документ#страница и фазы запроса. Утилита выполняет
+эмбеддинг и поиск для каждого вопроса в этом процессе, без GigaChat, и сравнивает результат
+с записанным: совпадение top-k (по id чанков или по документу и странице, если чанки
+перенарезаны), совпадение первого результата, изменение решения об отсечении слабых
+совпадений и распределение задержек до и после.
+
+Проверяемая конфигурация задается как обычно: переменными окружения (модель, бэкенд
+эмбеддингов, MILVUS_HOST) и --collection (например, версия docs_v<...> после переиндексации).
+
+Пример:
+    python -m proxy.tools.replay --capture /app/docs/querylog --collection docs_v20250101120000 --output replay.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def load_capture(path: Path, tenant: str, limit: int, include_cached: bool) -> List[Dict[str, Any]]:
+    """Записи из файла или из всех файлов папки (всех воркеров и ротаций) в порядке времени"""
+    from proxy.utils.querylog import QUERY_LOG_PATTERN
+
+    files = sorted(path.glob(QUERY_LOG_PATTERN)) if path.is_dir() else [path]
+    entries = []
+    for file in files:
+        for line in file.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if tenant and entry.get("tenant") != tenant:
+                continue
+            if entry.get("cached") and not include_cached:
+                continue
+            entries.append(entry)
+    # Файлы воркеров пишутся одновременно: общий порядок восстанавливается по времени записи
+    entries.sort(key=lambda entry: entry.get("ts") or 0)
+    return entries[-limit:] if limit else entries
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    ms = np.asarray(values)
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "mean": round(float(np.mean(ms)), 2),
+    }
+
+
+def overlap(recorded: List, candidate: List, k: int) -> float:
+    reference = set(recorded[:k])
+    if not reference:
+        return 1.0
+    return len(reference & set(candidate[:k])) / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Повтор записанных вопросов /q и сравнение результатов поиска")
+    parser.add_argument("--capture", type=str, required=True, help="Файл q.jsonl или папка QUERY_LOG_DIR")
+    parser.add_argument("--tenant", type=str, default=None, help="Только вопросы этого тенанта")
+    parser.add_argument("--limit", type=int, default=1000, help="Сколько последних вопросов повторить (0 — все)")
+    parser.add_argument("--include-cached", action="store_true",
+                        help="Повторять и вопросы, на которые ответил семантический кэш")
+    parser.add_argument("--k", type=int, default=5, help="k для совпадения top-k (по умолчанию: 5)")
+    parser.add_argument("--match-by", choices=["id", "ref"], default="id",
+                        help="Сравнивать по id чанков или по документу и странице (после перенарезки)")
+    parser.add_argument("--name-db", type=str, default="rag_db")
+    parser.add_argument("--collection", type=str, default="docs", help="Коллекция или алиас для поиска")
+    parser.add_argument("--min-overlap", type=float, default=None,
+                        help="Код выхода 1, если среднее совпадение top-k ниже этого значения")
+    parser.add_argument("--output", type=str, default=None, help="Куда сохранить JSON отчет")
+    args = parser.parse_args()
+
+    entries = load_capture(Path(args.capture), args.tenant, args.limit, args.include_cached)
+    if not entries:
+        print(f"❌ В {args.capture} нет подходящих записей")
+        sys.exit(1)
+
+    from proxy.utils import relevance
+    from proxy.utils.search import embed_query, get_embedding_model, search_fragments
+
+    # Загрузка модели и первое подключение к Milvus не должны попасть в задержки
+    get_embedding_model()
+    search_fragments(embed_query(entries[0]["query"]), name_db=args.name_db, collec=args.collection,
+                     tenant=entries[0].get("tenant"))
+
+    key = "ids" if args.match_by == "id" else "refs"
+    embed_ms, search_ms, overlaps, top1, decision_changed = [], [], [], [], 0
+    for entry in entries:
+        started = time.perf_counter()
+        query_vec = embed_query(entry["query"])
+        embedded = time.perf_counter()
+        fragments = search_fragments(query_vec, name_db=args.name_db, collec=args.collection, tenant=entry.get("tenant"))
+        searched = time.perf_counter()
+        embed_ms.append((embedded - started) * 1000)
+        search_ms.append((searched - embedded) * 1000)
+
+        if args.match_by == "id":
+            found = [fragment.get("id") for fragment in fragments]
+        else:
+            found = [f"{Path(str(fragment.get('source') or '')).name}#{fragment.get('page') or ''}" for fragment in fragments]
+        recorded = entry.get(key) or []
+        overlaps.append(overlap(recorded, found, args.k))
+        top1.append(bool(recorded) and bool(found) and recorded[0] == found[0])
+
+        scores = [fragment["score"] for fragment in fragments]
+        _, reason = relevance.select(
+            scores, relevance.RELEVANCE_MIN_SCORE, relevance.RELEVANCE_MAX_GAP, relevance.RELEVANCE_MIN_EVIDENCE
+        )
+        if entry.get("cached") is False and (reason is None) != (entry.get("gated") is None):
+            decision_changed += 1
+
+    recorded_search = [
+        entry["phases_ms"].get("milvus_search", 0.0) + entry["phases_ms"].get("chunk_fetch", 0.0)
+        for entry in entries if "milvus_search" in entry.get("phases_ms", {})
+    ]
+    recorded_embed = [entry["phases_ms"]["embed"] for entry in entries if "embed" in entry.get("phases_ms", {})]
+    report = {
+        "queries": len(entries),
+        "collection": args.collection,
+        "match_by": args.match_by,
+        f"overlap@{args.k}": round(float(np.mean(overlaps)), 4),
+        f"overlap@{args.k}_min": round(float(np.min(overlaps)), 4),
+        "top1_agreement": round(sum(top1) / len(top1), 4),
+        # Вопросы, для которых изменилось решение «вызывать GigaChat / отдать запасной ответ»
+        "gate_decision_changed": decision_changed,
+        "latency_ms": {
+            "embed": percentiles(embed_ms),
+            "search": percentiles(search_ms),
+        },
+        # Задержки из записи (под нагрузкой в работающем сервисе) — для ориентира, не для точного сравнения
+        "recorded_latency_ms": {
+            "embed": percentiles(recorded_embed),
+            "search": percentiles(recorded_search),
+        },
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"💾 Отчет сохранен в {args.output}")
+
+    if args.min_overlap is not None and report[f"overlap@{args.k}"] < args.min_overlap:
+        print(f"❌ Совпадение top-{args.k} {report[f'overlap@{args.k}']} ниже {args.min_overlap}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from proxy.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# SQLite ограничивает число параметров запроса — большие выборки делим на части
+_SQL_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    source TEXT NOT NULL,
+    content TEXT NOT NULL,
+    page INTEGER,
+    token_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS chunks_tenant_source ON chunks (tenant, source);
+CREATE TABLE IF NOT EXISTS cache_generations (
+    tenant TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+"""
+
+# Строка поколения для сброса кэша всех тенантов
+_ALL_TENANTS = "*"
+
+
+class ChunkStore:
+    """Текст и метаданные чанков по id в локальном SQLite.
+
+    Milvus хранит только id, векторы и небольшие числовые поля; текст найденных
+    чанков достается отсюда одним запросом на весь top-k. Часто запрашиваемые
+    чанки держатся в LRU в памяти процесса. Файл открывается в режиме WAL:
+    несколько воркеров читают его одновременно с записью новых загрузок.
+    """
+
+    def __init__(self, path: Path, cache_size: int = 2048):
+        self.path = Path(path)
+        self.cache_size = cache_size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._local = threading.local()  # соединение SQLite на поток
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put_many(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Записать (или перезаписать) чанки; строки — записи files_chunks.json"""
+        values = [
+            (
+                int(r["id"]),
+                str(r.get("tenant") or ""),
+                str(r.get("source", "")),
+                str(r.get("content", "")),
+                r.get("page"),
+                r.get("token_count"),
+            )
+            for r in rows
+        ]
+        if not values:
+            return 0
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)", values)
+        with self._lock:
+            for value in values:
+                self._cache.pop(value[0], None)
+        return len(values)
+
+    def get_many(self, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Чанки по id: сначала из LRU, остальные одним запросом к SQLite"""
+        found: Dict[int, Dict[str, Any]] = {}
+        missing: List[int] = []
+        with self._lock:
+            for chunk_id in ids:
+                chunk = self._cache.get(chunk_id)
+                if chunk is None:
+                    missing.append(chunk_id)
+                else:
+                    self._cache.move_to_end(chunk_id)
+                    found[chunk_id] = chunk
+        metrics.inc("chunk_store_hits", len(found))
+        if not missing:
+            return found
+
+        metrics.inc("chunk_store_misses", len(missing))
+        conn = self._conn()
+        loaded: Dict[int, Dict[str, Any]] = {}
+        for i in range(0, len(missing), _SQL_BATCH):
+            part = missing[i:i + _SQL_BATCH]
+            cursor = conn.execute(
+                f"SELECT id, source, content, page, token_count FROM chunks WHERE id IN ({','.join('?' * len(part))})",
+                part,
+            )
+            for chunk_id, source, content, page, token_count in cursor:
+                loaded[chunk_id] = {"source": source, "content": content, "page": page, "token_count": token_count}
+
+        with self._lock:
+            for chunk_id, chunk in loaded.items():
+                self._cache[chunk_id] = chunk
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        found.update(loaded)
+        return found
+
+    def document_ids(self, tenant: str, doc_name: str) -> List[int]:
+        """id чанков документа тенанта; source хранится полным путем, сравниваем по имени файла"""
+        cursor = self._conn().execute("SELECT id, source FROM chunks WHERE tenant = ?", (tenant,))
+        return [chunk_id for chunk_id, source in cursor if Path(source).name == doc_name]
+
+    def delete_ids(self, ids: List[int]) -> int:
+        conn = self._conn()
+        deleted = 0
+        with conn:
+            for i in range(0, len(ids), _SQL_BATCH):
+                part = ids[i:i + _SQL_BATCH]
+                deleted += conn.execute(
+                    f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(part))})", part
+                ).rowcount
+        with self._lock:
+            for chunk_id in ids:
+                self._cache.pop(chunk_id, None)
+        return deleted
+
+    def max_id(self) -> int:
+        """Наибольший id сохраненного чанка (0 — хранилище пусто)"""
+        return int(self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM chunks").fetchone()[0])
+
+    def cache_generation(self, tenant: str) -> int:
+        """Поколение семантического кэша тенанта, общее для всех воркеров (см. SemanticCache)"""
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(generation), 0) FROM cache_generations WHERE tenant IN (?, ?)",
+            (tenant, _ALL_TENANTS),
+        ).fetchone()
+        return int(row[0])
+
+    def bump_cache_generation(self, tenant: Optional[str] = None):
+        """Сбросить кэш тенанта (None — всех тенантов) во всех воркерах"""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO cache_generations VALUES (?, 1) "
+                "ON CONFLICT(tenant) DO UPDATE SET generation = generation + 1",
+                (tenant or _ALL_TENANTS,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        with self._lock:
+            cached = len(self._cache)
+        return {
+            "path": str(self.path),
+            "rows": rows,
+            "file_mb": round(os.path.getsize(self.path) / 1024 / 1024, 2) if self.path.exists() else 0.0,
+            "cached": cached,
+            "cache_size": self.cache_size,
+        }
+
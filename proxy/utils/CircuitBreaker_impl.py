@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from proxy.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Предохранитель внешнего вызова.
+
+    После failure_threshold ошибок подряд размыкается: вызовы не выполняются
+    cooldown_sec секунд. Затем пропускается один пробный вызов — успех замыкает
+    предохранитель, ошибка снова размыкает его на cooldown_sec.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, cooldown_sec: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None  # Время размыкания; None — предохранитель замкнут
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Можно ли выполнять вызов сейчас"""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown_sec:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Circuit breaker closed", extra={"breaker": self.name})
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_skipped(self):
+        """Разрешенный вызов не состоялся (отменен, не дождался очереди) — пробу можно повторить"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._probing = False
+                metrics.inc(f"breaker_{self.name}_opened")
+                logger.warning(
+                    "Circuit breaker opened",
+                    extra={"breaker": self.name, "failures": self._failures, "cooldown_sec": self.cooldown_sec}
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._opened_at is None:
+                state = "closed"
+            elif self._probing or time.monotonic() - self._opened_at >= self.cooldown_sec:
+                state = "half_open"
+            else:
+                state = "open"
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "cooldown_sec": self.cooldown_sec,
+            }
@@ -0,0 +1,165 @@
+"""
+Общий процесс инференса эмбеддингов для многопроцессного запуска.
+
+Модель загружается один раз в этом процессе, а веб-воркеры uvicorn обращаются
+к ней через Unix-сокет (см. RemoteEncoder_impl.py). Запросы разных воркеров
+объединяются в общие батчи.
+
+Протокол: кадр = 4 байта длины (big-endian) + тело.
+  запрос  — JSON {"op": "encode", "texts": [...], "normalize": false} или {"op": "ping"}
+  ответ   — JSON-заголовок {"shape": [n, dim]} / {"error": "..."}, затем для encode
+            отдельный кадр с сырыми float32 (n * dim * 4 байт)
+
+Запуск:
+    EMBEDDING_SOCKET=/tmp/embedding.sock python -m proxy.utils.EmbeddingServer_impl
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+import numpy as np
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "/tmp/embedding.sock")
+# Сколько ждать запросы других воркеров, чтобы собрать общий батч
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+
+_HEADER = struct.Struct(">I")
+
+
+def send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    header = _recv_exact(sock, _HEADER.size)
+    return _recv_exact(sock, _HEADER.unpack(header)[0])
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        part = sock.recv(min(size - len(buf), 1 << 20))
+        if not part:
+            raise ConnectionError("Embedding socket closed")
+        buf.extend(part)
+    return bytes(buf)
+
+
+class EmbeddingBatcher:
+    """Собирает запросы воркеров в общий батч и кодирует их одним вызовом encode"""
+
+    def __init__(self, model):
+        self.model = model
+        self._queue: "queue.Queue[Tuple[List[str], bool, Future]]" = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def encode(self, texts: List[str], normalize: bool) -> np.ndarray:
+        future = Future()
+        self._queue.put((texts, normalize, future))
+        return future.result()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + EMBEDDING_BATCH_WAIT_MS / 1000
+            while size < EMBEDDING_MAX_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            # Нормировка — параметр encode, поэтому группируем по нему
+            for normalize in (False, True):
+                group = [item for item in batch if item[1] == normalize]
+                if group:
+                    self._encode_group(group, normalize)
+
+    def _encode_group(self, group, normalize: bool):
+        texts = [text for item in group for text in item[0]]
+        try:
+            vecs = np.asarray(
+                self.model.encode(texts, batch_size=EMBEDDING_MAX_BATCH, normalize_embeddings=normalize),
+                dtype=np.float32,
+            )
+        except Exception as e:
+            for _, _, future in group:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for item_texts, _, future in group:
+            future.set_result(vecs[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Соединение постоянное: воркер шлет запросы, пока не закроет сокет
+        while True:
+            try:
+                request = json.loads(recv_frame(self.request))
+            except ConnectionError:
+                return
+
+            try:
+                if request.get("op") == "ping":
+                    send_frame(self.request, json.dumps({"status": "ok", "backend": self.server.backend}).encode())
+                    continue
+
+                vecs = self.server.batcher.encode(request["texts"], bool(request.get("normalize", False)))
+                send_frame(self.request, json.dumps({"shape": list(vecs.shape)}).encode())
+                send_frame(self.request, np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+            except ConnectionError:
+                return
+            except Exception as e:
+                logger.error("Embedding request failed", extra={"error": str(e)}, exc_info=True)
+                send_frame(self.request, json.dumps({"error": str(e)}).encode())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, embedding):
+        self.batcher = EmbeddingBatcher(embedding.embedding_model)
+        self.backend = embedding.backend
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+
+def main():
+    from proxy.utils.log import setup_logging
+    from proxy.utils.TextEncoder_impl import TextEmbedding
+
+    setup_logging()
+    # Сокет создается только после загрузки модели: воркеры ждут его появления
+    embedding = TextEmbedding()
+    server = EmbeddingServer(EMBEDDING_SOCKET, embedding)
+    logger.info("Embedding server started", extra={"socket": EMBEDDING_SOCKET, "backend": embedding.backend})
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
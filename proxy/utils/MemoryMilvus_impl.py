@@ -0,0 +1,218 @@
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence, Set, Union
+
+import numpy as np
+
+Vector = Union[List[float], Sequence[float]]
+
+
+class _MemoryPartition:
+    def __init__(self):
+        # Как и в коллекциях Milvus новой схемы, текст и источник чанков здесь не хранятся (см. ChunkStore_impl.py)
+        self.ids: List[int] = []
+        self.pages: List[int] = []
+        self.token_counts: List[int] = []
+        self.vectors: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None  # нормированные векторы, пересобираются после вставки
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            m = np.asarray(self.vectors, dtype=np.float32)
+            norms = np.linalg.norm(m, axis=1, keepdims=True)
+            self._matrix = m / np.where(norms == 0, 1, norms)
+        return self._matrix
+
+
+class _MemoryCollection:
+    def __init__(self, name: str, dim: int):
+        self.name = name
+        self.dim = dim
+        self.partitions: Dict[str, _MemoryPartition] = {"_default": _MemoryPartition()}
+
+    @property
+    def num_entities(self) -> int:
+        return sum(len(p.ids) for p in self.partitions.values())
+
+    def flush(self):
+        pass
+
+    def load(self, *args, **kwargs):
+        pass
+
+
+class InMemoryMilvus:
+    """Встроенная замена MilvusSingleton для бенчмарков и локальной отладки.
+
+    Реализует тот же набор методов, что использует search.py, поиск — точный
+    перебор по косинусу. Данные живут только в памяти процесса.
+    """
+
+    _instance: Optional["InMemoryMilvus"] = None
+    _lock: Lock = Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._databases = {}
+                    cls._instance._aliases = {}
+                    cls._instance._db = "default"
+        return cls._instance
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @property
+    def _collections(self) -> Dict[str, _MemoryCollection]:
+        return self._databases.setdefault(self._db, {})
+
+    def _resolve(self, collection_name: str) -> str:
+        return self._aliases.get((self._db, collection_name), collection_name)
+
+    ############################################################## Подключение к БД
+    def setup_database(self, db_name: str):
+        self._db = db_name
+
+    ############################################################## Коллекции
+    def delete_collection(self, collection_name: str):
+        self._collections.pop(collection_name, None)
+
+    def get_collection(self, collection_name: str) -> _MemoryCollection:
+        name = self._resolve(collection_name)
+        if name not in self._collections:
+            raise ValueError(f"Collection '{collection_name}' does not exist")
+        return self._collections[name]
+
+    def create_collection(self, collection_name: str, size_vec: int, drop_if_exists: bool = False):
+        name = self._resolve(collection_name)
+        if name in self._collections and not drop_if_exists:
+            return
+        self._collections[name] = _MemoryCollection(name, size_vec)
+
+    def create_index_load(self, collection_name: str):
+        self.get_collection(collection_name)
+
+    ############################################################## Партиции (тенанты)
+    def has_partition(self, collection_name: str, partition_name: str) -> bool:
+        name = self._resolve(collection_name)
+        return name in self._collections and partition_name in self._collections[name].partitions
+
+    def create_partition(self, collection_name: str, partition_name: str):
+        self.get_collection(collection_name).partitions.setdefault(partition_name, _MemoryPartition())
+
+    def delete_partition(self, collection_name: str, partition_name: str):
+        collection = self.get_collection(collection_name)
+        if partition_name == "_default":
+            collection.partitions["_default"] = _MemoryPartition()
+        else:
+            collection.partitions.pop(partition_name, None)
+
+    ############################################################## Алиасы и версии коллекций
+    def get_alias_target(self, alias_name: str) -> Optional[str]:
+        return self._aliases.get((self._db, alias_name))
+
+    def list_versions(self, collection_name: str) -> List[str]:
+        prefix = f"{collection_name}_v"
+        return sorted(n for n in self._collections if n.startswith(prefix) and n[len(prefix):].isdigit())
+
+    def switch_alias(self, alias_name: str, collection_name: str):
+        self._aliases[(self._db, alias_name)] = collection_name
+
+    def is_plain_collection(self, collection_name: str) -> bool:
+        return collection_name in self._collections
+
+    ############################################################## Данные и поиск
+    def insert_data(
+            self,
+            collection_name: str,
+            data: Dict[str, Any],
+            flush: bool = False,
+            partition_name: Optional[str] = None,
+    ):
+        collection = self.get_collection(collection_name)
+        partition = collection.partitions.setdefault(partition_name or "_default", _MemoryPartition())
+        partition.ids.extend(int(i) for i in data["id"])
+        partition.pages.extend(data.get("page") or [0] * len(data["id"]))
+        partition.token_counts.extend(data.get("token_count") or [0] * len(data["id"]))
+        partition.vectors.extend(np.asarray(v, dtype=np.float32) for v in data["embeddings"])
+        partition._matrix = None
+
+    def list_ids(self, collection_name: str) -> Set[int]:
+        return {pk for p in self.get_collection(collection_name).partitions.values() for pk in p.ids}
+
+    def delete_by_expr(self, collection_name: str, expr: str, partition_name: Optional[str] = None):
+        # Поддерживается только выражение вида "id in [...]"
+        ids = {int(i) for i in expr.split("[", 1)[1].rstrip("] ").split(",") if i.strip()}
+        collection = self.get_collection(collection_name)
+        for name, p in collection.partitions.items():
+            if partition_name and name != partition_name:
+                continue
+            keep = [i for i, pk in enumerate(p.ids) if pk not in ids]
+            p.ids = [p.ids[i] for i in keep]
+            p.pages = [p.pages[i] for i in keep]
+            p.token_counts = [p.token_counts[i] for i in keep]
+            p.vectors = [p.vectors[i] for i in keep]
+            p._matrix = None
+
+    def compact(self, collection_name: str) -> int:
+        # Удаленные строки убираются из списков сразу, сжимать нечего
+        return 0
+
+    def memory_bytes(self, collection_name: str) -> int:
+        if self._resolve(collection_name) not in self._collections:
+            return 0
+        collection = self.get_collection(collection_name)
+        # Векторы float32 и три поля int64 на строку
+        return sum(len(p.ids) * (collection.dim * 4 + 3 * 8) for p in collection.partitions.values())
+
+    def search_by_vector(
+            self,
+            query_embedding: Vector,
+            collection_name: str,
+            limit: int = 15,
+            partition_names: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        return self.search_by_vectors([query_embedding], collection_name, limit, partition_names)[0]
+
+    def search_by_vectors(
+            self,
+            query_embeddings: List[Vector],
+            collection_name: str,
+            limit: int = 15,
+            partition_names: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        results = [
+            {"id": [], "distance": [], "source": [], "content": [], "page": [], "token_count": []}
+            for _ in query_embeddings
+        ]
+        if not results or self._resolve(collection_name) not in self._collections:
+            return results
+        collection = self.get_collection(collection_name)
+        names = partition_names or list(collection.partitions)
+        partitions = [collection.partitions[n] for n in names if n in collection.partitions]
+        partitions = [p for p in partitions if p.ids]
+        if not partitions:
+            return results
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(results), -1)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        # Одно умножение матриц на партицию для всех запросов
+        hits = [[] for _ in results]
+        for p in partitions:
+            scores = queries @ p.matrix().T
+            for qi, row in enumerate(scores):
+                top = np.argsort(-row)[:limit]
+                hits[qi].extend((float(row[i]), p, int(i)) for i in top)
+
+        for data, query_hits in zip(results, hits):
+            query_hits.sort(key=lambda h: -h[0])
+            for score, p, i in query_hits[:limit]:
+                data["id"].append(p.ids[i])
+                data["distance"].append(score)
+                data["source"].append(None)
+                data["content"].append(None)
+                data["page"].append(p.pages[i])
+                data["token_count"].append(p.token_counts[i])
+        return results
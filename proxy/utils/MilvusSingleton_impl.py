@@ -1,9 +1,21 @@
+import time
 from threading import Lock
-from typing import Any, Dict, List, Optional, Sequence, Union
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
 from pymilvus import connections, db, utility, FieldSchema, DataType, Collection, CollectionSchema
 
+from proxy.utils.timing import phase
+
 Vector = Union[List[float], Sequence[float]]
 
+# Целочисленные поля, которых нет в коллекциях старой схемы (появляются после переиндексации):
+# page — номер страницы PDF (с 1, 0 — неизвестен), token_count — размер чанка в токенах модели
+OPTIONAL_INT_FIELDS = ("page", "token_count")
+
+# Сколько секунд поиск использует закэшированные Collection, поля и партиции без обращения к Milvus.
+# Переиндексация в другом воркере меняет схему за алиасом: ошибка поиска сбрасывает кэш сразу,
+# а новые необязательные поля (page) подхватываются не позже чем через это время
+SEARCH_TARGET_TTL_SEC = 60
+
 
 class MilvusSingleton:
     _instance: Optional["MilvusSingleton"] = None
@@ -26,6 +38,9 @@ class MilvusSingleton:
         self.host = host
         self.port = port
         self.alias = alias
+        # Имя коллекции или алиаса -> (Collection, поля для выдачи, известные партиции, monotonic истечения)
+        self._search_targets: Dict[str, Tuple[Collection, List[str], Set[str], float]] = {}
+        self._search_targets_lock = Lock()
 
         self._initialize_connection()
         self._initialized = True
@@ -45,24 +60,43 @@ class MilvusSingleton:
     ############################################################## Подключение к БД
     ## Настраивает базу данных с указанным именем
     def setup_database(self, db_name: str):
+        # Вызывается на каждый поиск: если база уже выбрана, не ходим в Milvus и не пишем в stdout
+        if getattr(self, "_database", None) == db_name:
+            return
         existing = db.list_database(using=self.alias)
         if db_name not in existing:
             db.create_database(db_name=db_name, using=self.alias)
         db.using_database(db_name, using=self.alias)
+        self._database = db_name
         print(f"[INFO]: Using database '{db_name}'")
 
     ############################################################## Насчтройка схемы
-    ## Создадим схему коллекции
+    ## Создадим схему коллекции. Текст и источник чанков хранятся в ChunkStore (см. ChunkStore_impl.py),
+    ## в Milvus — только id, вектор и небольшие числовые поля
     def create_schema(self, size_vec: int) -> CollectionSchema:
         id_field = FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False)
-        source_field = FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=32000)
         embedding_field = FieldSchema(name="embeddings", dtype=DataType.FLOAT_VECTOR, dim=size_vec)
-        content_field = FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=8192)
+        optional_fields = [FieldSchema(name=name, dtype=DataType.INT64) for name in OPTIONAL_INT_FIELDS]
+
+        return CollectionSchema(fields=[id_field, embedding_field, *optional_fields])
 
-        return CollectionSchema(fields=[id_field, source_field, embedding_field, content_field])
+    ## Есть ли в коллекции поле (коллекции, созданные до его появления, живут до переиндексации)
+    @staticmethod
+    def has_field(collection: Collection, field_name: str) -> bool:
+        return any(f.name == field_name for f in collection.schema.fields)
+
+    ## Забыть закэшированное для поиска состояние коллекции (или всех коллекций)
+    def invalidate_search_target(self, collection_name: Optional[str] = None):
+        with self._search_targets_lock:
+            if collection_name is None:
+                self._search_targets.clear()
+            else:
+                self._search_targets.pop(collection_name, None)
 
     ## Удаление коллекции
     def delete_collection(self, collection_name: str):
+        # Алиас мог указывать на эту коллекцию — сбрасываем все
+        self.invalidate_search_target()
         if utility.has_collection(collection_name):
             utility.drop_collection(collection_name)
             print(f"[INFO]: Collection '{collection_name}' existed and was deleted.")
@@ -75,6 +109,7 @@ class MilvusSingleton:
 
     ## Создадим коллекцию в БД
     def create_collection(self, collection_name: str, size_vec: int, drop_if_exists: bool = False):
+        self.invalidate_search_target(collection_name)
         if utility.has_collection(collection_name):
             if drop_if_exists:
                 self.delete_collection(collection_name)
@@ -89,6 +124,68 @@ class MilvusSingleton:
         print(f"[INFO]: Create collection '{collection_name}'")
         self.create_index_load(collection_name)
 
+    ############################################################## Партиции (тенанты)
+    ## Проверка наличия партиции в коллекции
+    def has_partition(self, collection_name: str, partition_name: str) -> bool:
+        if not utility.has_collection(collection_name):
+            return False
+        return self.get_collection(collection_name).has_partition(partition_name)
+
+    ## Создание партиции (если её ещё нет) и загрузка её в память
+    def create_partition(self, collection_name: str, partition_name: str):
+        collection = self.get_collection(collection_name)
+        if collection.has_partition(partition_name):
+            return
+        collection.create_partition(partition_name)
+        collection.load(partition_names=[partition_name])
+        print(f"[INFO]: Create partition '{partition_name}' in '{collection_name}'")
+
+    ## Удаление партиции вместе с данными, остальные партиции не затрагиваются
+    def delete_partition(self, collection_name: str, partition_name: str):
+        self.invalidate_search_target()
+        collection = self.get_collection(collection_name)
+        if not collection.has_partition(partition_name):
+            print(f"[INFO]: Partition '{partition_name}' does not exist in '{collection_name}'.")
+            return
+        if partition_name == "_default":
+            # Партицию по умолчанию удалить нельзя, поэтому очищаем её по выражению
+            collection.delete(expr="id >= 0", partition_name=partition_name)
+            print(f"[INFO]: Partition '{partition_name}' in '{collection_name}' was cleared.")
+            return
+        partition = collection.partition(partition_name)
+        partition.release()
+        collection.drop_partition(partition_name)
+        print(f"[INFO]: Partition '{partition_name}' in '{collection_name}' was deleted.")
+
+    ############################################################## Алиасы и версии коллекций
+    ## Имя коллекции, на которую сейчас указывает алиас (None, если алиаса нет)
+    def get_alias_target(self, alias_name: str) -> Optional[str]:
+        for name in utility.list_collections(using=self.alias):
+            if alias_name in utility.list_aliases(name, using=self.alias):
+                return name
+        return None
+
+    ## Версии коллекции вида '<name>_v<timestamp>' от старых к новым
+    def list_versions(self, collection_name: str) -> List[str]:
+        prefix = f"{collection_name}_v"
+        return sorted(
+            name for name in utility.list_collections(using=self.alias)
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        )
+
+    ## Атомарно переключить алиас на указанную коллекцию
+    def switch_alias(self, alias_name: str, collection_name: str):
+        if self.get_alias_target(alias_name) is not None:
+            utility.alter_alias(collection_name, alias_name, using=self.alias)
+        else:
+            utility.create_alias(collection_name, alias_name, using=self.alias)
+        self.invalidate_search_target(alias_name)
+        print(f"[INFO]: Alias '{alias_name}' -> '{collection_name}'")
+
+    ## Является ли имя настоящей коллекцией (а не алиасом)
+    def is_plain_collection(self, collection_name: str) -> bool:
+        return collection_name in utility.list_collections(using=self.alias)
+
     ############################################################## Настройка индекса поиска и загрузка данных
     ## Прописываем нужные параметры индекса
     def create_index_params(self):
@@ -129,22 +226,62 @@ class MilvusSingleton:
             collection_name: str,
             data: Dict[str, Any],
             flush: bool = False,
+            partition_name: Optional[str] = None,
     ):
-        required = ("id", "source", "embeddings", "content")
+        required = ("id", "embeddings")
         for k in required:
             if k not in data:
                 raise ValueError(f"data must contain key '{k}'")
 
         ids = data["id"]
-        sources = data["source"]
-        embeddings = data["embeddings"]
-        contents = data["content"]
 
+        # Колонки в порядке полей схемы: коллекции старой схемы хранят еще source и content,
+        # в новых их нет, а числовых полей может не быть в совсем старых
         collection = self.get_collection(collection_name)
-        collection.insert([ids, sources, embeddings, contents])
+        columns = []
+        for field in collection.schema.fields:
+            if field.name in data and data[field.name] is not None:
+                columns.append(data[field.name])
+            elif field.dtype == DataType.VARCHAR:
+                columns.append([""] * len(ids))
+            else:
+                columns.append([0] * len(ids))
+        collection.insert(columns, partition_name=partition_name)
         if flush:
             collection.flush()
-        print(f"[INFO]: Inserted {len(ids)} rows into '{collection_name}'")
+        print(f"[INFO]: Inserted {len(ids)} rows into '{collection_name}' (partition='{partition_name or '_default'}')")
+
+    ## Все первичные ключи коллекции (итератором: query с одним вызовом ограничен 16384 строками)
+    def list_ids(self, collection_name: str) -> Set[int]:
+        collection = self.get_collection(collection_name)
+        ids: Set[int] = set()
+        iterator = collection.query_iterator(batch_size=10000, expr="id >= 0", output_fields=["id"])
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    return ids
+                ids.update(int(row["id"]) for row in batch)
+        finally:
+            iterator.close()
+
+    ## Удаление строк по выражению (например "id in [1, 2, 3]")
+    def delete_by_expr(self, collection_name: str, expr: str, partition_name: Optional[str] = None):
+        collection = self.get_collection(collection_name)
+        collection.delete(expr=expr, partition_name=partition_name)
+        print(f"[INFO]: Deleted rows from '{collection_name}' where {expr[:200]}")
+
+    ## Сжатие сегментов: Milvus физически удаляет помеченные удаленными строки (выполняется в фоне)
+    def compact(self, collection_name: str) -> int:
+        collection = self.get_collection(collection_name)
+        collection.compact()
+        print(f"[INFO]: Compaction of '{collection_name}' started")
+        return collection.compaction_id
+
+    ## Память, которую занимают загруженные сегменты коллекции, байт
+    def memory_bytes(self, collection_name: str) -> int:
+        segments = utility.get_query_segment_info(collection_name, using=self.alias)
+        return sum(int(getattr(segment, "mem_size", 0) or 0) for segment in segments)
 
     ############################################################## Поиск по коллекции
     ## Поиск данных в коллекции
@@ -153,25 +290,89 @@ class MilvusSingleton:
             query_embedding: Vector,
             collection_name: str,
             limit: int = 15,
+            partition_names: Optional[List[str]] = None,
     ) -> Dict[str, Any]:
-        collection = self.get_collection(collection_name)
-        collection.load()
+        return self.search_by_vectors([query_embedding], collection_name, limit, partition_names)[0]
+
+    ## Поиск сразу по нескольким запросам: один вызов search с несколькими векторами
+    def search_by_vectors(
+            self,
+            query_embeddings: List[Vector],
+            collection_name: str,
+            limit: int = 15,
+            partition_names: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._search_targets_lock:
+            was_cached = collection_name in self._search_targets
+        try:
+            return self._search(query_embeddings, collection_name, limit, partition_names, cached=True)
+        except Exception:
+            if not was_cached:
+                raise
+            # Закэшированное состояние могло устареть (переиндексация или удаление партиции в другом
+            # воркере, рестарт Milvus) — повторяем один раз с запросами к Milvus
+            self.invalidate_search_target(collection_name)
+            return self._search(query_embeddings, collection_name, limit, partition_names, cached=False)
+
+    ## Collection, поля для выдачи и известные партиции: из кэша или с запросами к Milvus
+    def _search_target(self, collection_name: str, cached: bool) -> Tuple[Collection, List[str], Set[str]]:
+        with self._search_targets_lock:
+            target = self._search_targets.get(collection_name)
+        if cached and target is not None and target[3] > time.monotonic():
+            return target[0], target[1], target[2]
+
+        # Для загруженной коллекции load() — быстрый запрос к Milvus; после переиндексации или
+        # рестарта Milvus — загрузка сегментов в память, отдельный спан в трассировке медленных запросов
+        with phase("milvus_load"):
+            collection = self.get_collection(collection_name)
+            collection.load()
+        # source и content есть только в коллекциях старой схемы; в новых текст берется из ChunkStore
+        output_fields = [name for name in ("source", "content", *OPTIONAL_INT_FIELDS) if self.has_field(collection, name)]
+        partitions: Set[str] = set()
+        with self._search_targets_lock:
+            self._search_targets[collection_name] = (
+                collection, output_fields, partitions, time.monotonic() + SEARCH_TARGET_TTL_SEC
+            )
+        return collection, output_fields, partitions
+
+    def _search(
+            self,
+            query_embeddings: List[Vector],
+            collection_name: str,
+            limit: int,
+            partition_names: Optional[List[str]],
+            cached: bool,
+    ) -> List[Dict[str, Any]]:
+        collection, output_fields, known_partitions = self._search_target(collection_name, cached)
+
+        # Поиск только по партициям тенанта: чужие документы не сканируются.
+        # Запоминаются только существующие партиции: новую мог создать другой воркер
+        if partition_names:
+            for p in partition_names:
+                if p not in known_partitions and collection.has_partition(p):
+                    known_partitions.add(p)
+            partition_names = [p for p in partition_names if p in known_partitions]
+            if not partition_names:
+                return [self.filter_results([[]]) for _ in query_embeddings]
 
         results = collection.search(
-            data=[query_embedding],
+            data=list(query_embeddings),
             anns_field="embeddings",
             param=self.create_search_params(),
             limit=limit,
-            output_fields=["source", "content"],
+            output_fields=output_fields,
+            partition_names=partition_names,
         )
-        return self.filter_results(results)
+        return [self.filter_results(results, i) for i in range(len(query_embeddings))]
 
     ## Обработка результата
-    def filter_results(self, results) -> Dict[str, Any]:
-        data = {"id": [], "distance": [], "source": [], "content": []}
-        for hit in results[0]:
+    def filter_results(self, results, index: int = 0) -> Dict[str, Any]:
+        data = {"id": [], "distance": [], "source": [], "content": [], **{name: [] for name in OPTIONAL_INT_FIELDS}}
+        for hit in results[index]:
             data["id"].append(hit.id)
             data["distance"].append(hit.distance)
             data["source"].append(hit.entity.get("source"))
             data["content"].append(hit.entity.get("content"))
+            for name in OPTIONAL_INT_FIELDS:
+                data[name].append(hit.entity.get(name) or 0)
         return data
\ No newline at end of file
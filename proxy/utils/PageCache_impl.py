@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from proxy.utils import metrics
+from proxy.utils.filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Файл блокировки вытеснения внутри папки кэша (сам в кэш не входит)
+_LOCK_NAME = ".evict.lock"
+
+
+class PageCache:
+    """Дисковый кэш отдельных страниц документов (одностраничный PDF или текст).
+
+    Страница создается при первом запросе и дальше отдается с диска. Кэш общий
+    для всех воркеров: запись атомарная (временный файл + rename), а размер
+    ограничивается по всей папке — после каждой записи папка пересчитывается
+    под flock и удаляются файлы, к которым дольше всего не обращались (mtime
+    обновляется при каждом попадании). Страница возвращается содержимым,
+    а не путем: файл может вытеснить другой воркер до того, как его отдадут.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._evict_lock = FileLock(self.cache_dir / _LOCK_NAME)
+
+    def get_or_create(self, key: str, produce: Callable[[Path], None]) -> bytes:
+        """Содержимое файла `key` из кэша; если его нет — `produce(path)` записывает его"""
+        path = self.cache_dir / key
+        data = self._read(path)
+        if data is not None:
+            metrics.inc("page_cache_hits")
+            return data
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Одновременные запросы одной страницы ждут одну генерацию
+        try:
+            with key_lock:
+                data = self._read(path)
+                if data is not None:
+                    metrics.inc("page_cache_hits")
+                    return data
+
+                tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+                try:
+                    produce(tmp)
+                    data = tmp.read_bytes()
+                    os.replace(tmp, path)
+                finally:
+                    tmp.unlink(missing_ok=True)
+                metrics.inc("page_cache_misses")
+                self._evict(keep=key)
+                return data
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    @staticmethod
+    def _read(path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # Уже вытеснен — содержимое прочитано, отдать его можно
+        return data
+
+    def _scan(self):
+        """Файлы кэша всей папки (всех воркеров): [(mtime, размер, имя)]"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name == _LOCK_NAME or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.name))
+        return entries
+
+    def _evict(self, keep: str):
+        with self._evict_lock:
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                (self.cache_dir / name).unlink(missing_ok=True)
+                total -= size
+                metrics.inc("page_cache_evictions")
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._scan()
+        return {"files": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
@@ -0,0 +1,100 @@
+import json
+import logging
+import socket
+import threading
+import time
+from typing import List, Union
+
+import numpy as np
+
+from proxy.utils.EmbeddingServer_impl import send_frame, recv_frame
+
+logger = logging.getLogger(__name__)
+
+
+class _RemoteModel:
+    """Клиент общего процесса эмбеддингов с интерфейсом SentenceTransformer.encode"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        # Соединение на поток: запросы из разных потоков воркера не перемешиваются
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _reset(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _call(self, request: dict):
+        # Одна повторная попытка на случай перезапуска процесса эмбеддингов
+        for attempt in range(2):
+            try:
+                sock = self._connect()
+                send_frame(sock, json.dumps(request, ensure_ascii=False).encode("utf-8"))
+                header = json.loads(recv_frame(sock))
+                if "error" in header:
+                    raise RuntimeError(f"Embedding server error: {header['error']}")
+                if request.get("op") != "encode":
+                    return header
+                data = recv_frame(sock)
+                return np.frombuffer(data, dtype=np.float32).reshape(header["shape"])
+            except (ConnectionError, OSError):
+                self._reset()
+                if attempt:
+                    raise
+
+    def ping(self) -> dict:
+        return self._call({"op": "ping"})
+
+    def encode(self, sentences: Union[str, List[str]], normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vecs = self._call({"op": "encode", "texts": texts, "normalize": normalize_embeddings})
+        return vecs[0] if single else vecs
+
+
+class RemoteTextEmbedding:
+    """Замена TextEmbedding в веб-воркере: сама модель живет в общем процессе"""
+
+    def __init__(self, socket_path: str, timeout: float = 60, wait_sec: float = 900):
+        self.embedding_model = _RemoteModel(socket_path, timeout)
+
+        # Процесс эмбеддингов открывает сокет только после загрузки модели — ждем его
+        started = time.time()
+        while True:
+            try:
+                info = self.embedding_model.ping()
+                break
+            except (ConnectionError, OSError):
+                if time.time() - started > wait_sec:
+                    raise
+                time.sleep(1)
+
+        self.backend = info.get("backend")
+        logger.info(
+            "Connected to shared embedding server",
+            extra={"socket": socket_path, "backend": self.backend, "wait_sec": round(time.time() - started, 2)}
+        )
+
+    def vectorize_text(self, chunks):
+        Data_db = {
+            'id': [i for i in range(1, len(chunks) + 1)],
+            'source': [chunk.metadata['source'] for chunk in chunks],
+            'emb': list(self.embedding_model.encode([chunk.page_content for chunk in chunks])),
+            'content': [chunk.page_content for chunk in chunks]
+        }
+        return Data_db
+
+    def model_emb(self):
+        return self.embedding_model
@@ -0,0 +1,215 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from proxy.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    tenant: str
+    query: str
+    response: str
+    fragments: List[Dict[str, Any]]
+    created: float
+    compute_sec: float  # Сколько стоил исходный ответ (поиск + генерация)
+    generation: int = 0  # Поколение кэша тенанта, по данным которого посчитан ответ
+
+
+class LocalGenerations:
+    """Поколения кэша в памяти процесса: для одного воркера и утилит.
+    В сервисе используется ChunkStore — поколения в SQLite общие для всех воркеров"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._generations: Dict[Optional[str], int] = {}
+
+    def cache_generation(self, tenant: str) -> int:
+        with self._lock:
+            return self._generations.get(None, 0) + self._generations.get(tenant, 0)
+
+    def bump_cache_generation(self, tenant: Optional[str] = None):
+        with self._lock:
+            self._generations[tenant] = self._generations.get(tenant, 0) + 1
+
+
+class SemanticCache:
+    """Кэш ответов по близости эмбеддингов запросов.
+
+    Нормированные эмбеддинги хранятся в одной матрице, поэтому поиск ближайшего
+    запроса — это одно матричное умножение. Вытеснение по LRU и TTL.
+
+    Каждый сброс увеличивает поколение тенанта. Ответ, посчитанный по индексу
+    до сброса, не записывается: put получает поколение, прочитанное до поиска.
+    Поколения хранятся в `generations` (в сервисе — ChunkStore, общий для воркеров):
+    запись другого поколения не отдается, так что сброс в одном воркере действует во всех.
+    Прочитанное поколение держится в памяти `generation_ttl_sec` секунд, чтобы не ходить
+    в SQLite из event loop на каждый запрос: сброс в своем воркере виден сразу,
+    сброс в другом — не позже чем через `generation_ttl_sec`.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_sec: float = 3600, threshold: float = 0.95, generations=None,
+                 generation_ttl_sec: float = 1.0):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.threshold = threshold
+        self.generations = generations if generations is not None else LocalGenerations()
+        self.generation_ttl_sec = generation_ttl_sec
+        self._generation_cache: Dict[str, tuple] = {}  # тенант -> (поколение, monotonic истечения)
+
+        self._lock = Lock()
+        self._vectors: Optional[np.ndarray] = None  # (max_size, dim), выделяется при первой записи
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()  # слот -> запись, порядок LRU
+        self._free_slots = list(range(max_size - 1, -1, -1))
+
+    @staticmethod
+    def _normalize(vec: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _release(self, slot: int):
+        del self._entries[slot]
+        self._free_slots.append(slot)
+
+    def generation(self, tenant: str) -> int:
+        """Поколение кэша тенанта: читается до поиска и передается в put"""
+        if self.max_size <= 0:
+            # Кэш выключен — поколение не нужно, хранилище не трогаем
+            return 0
+        now = time.monotonic()
+        cached = self._generation_cache.get(tenant)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        generation = self.generations.cache_generation(tenant)
+        self._generation_cache[tenant] = (generation, now + self.generation_ttl_sec)
+        return generation
+
+    def get(self, tenant: str, query_vec: Sequence[float]) -> Optional[CacheEntry]:
+        if self.max_size <= 0:
+            return None
+        started = time.perf_counter()
+        q = self._normalize(query_vec)
+        now = time.time()
+        generation = self.generation(tenant)
+
+        with self._lock:
+            best_slot, best_score = None, -1.0
+            if self._entries and self._vectors is not None and self._vectors.shape[1] == q.size:
+                slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+                scores = self._vectors[slots] @ q
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    entry = self._entries[int(slots[i])]
+                    if now - entry.created > self.ttl_sec:
+                        continue
+                    if entry.tenant == tenant:
+                        if entry.generation != generation:
+                            # Кэш тенанта сброшен (возможно, другим воркером) — запись устарела
+                            self._release(int(slots[i]))
+                            continue
+                        best_slot, best_score = int(slots[i]), float(scores[i])
+                        break
+
+                # Заодно выбрасываем просроченные записи
+                for slot in [s for s, e in self._entries.items() if now - e.created > self.ttl_sec]:
+                    self._release(slot)
+
+            if best_slot is None:
+                metrics.inc("semantic_cache_misses")
+                return None
+
+            self._entries.move_to_end(best_slot)
+            entry = self._entries[best_slot]
+
+        lookup_sec = time.perf_counter() - started
+        metrics.inc("semantic_cache_hits")
+        metrics.inc("semantic_cache_saved_sec", max(entry.compute_sec - lookup_sec, 0.0))
+        logger.info(
+            "Semantic cache hit",
+            extra={"tenant": tenant, "similarity": round(best_score, 4), "cached_query": entry.query}
+        )
+        return entry
+
+    def put(
+            self,
+            tenant: str,
+            query_vec: Sequence[float],
+            query: str,
+            response: str,
+            fragments: List[Dict[str, Any]],
+            compute_sec: float,
+            generation: Optional[int] = None,
+    ):
+        if self.max_size <= 0:
+            return
+        q = self._normalize(query_vec)
+        current = self.generation(tenant)
+        if generation is not None and generation != current:
+            # Пока считался ответ, документы тенанта изменились — ответ мог устареть
+            metrics.inc("semantic_cache_stale_puts")
+            return
+
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != q.size:
+                # Размерность изменилась (другая модель) — старые записи бесполезны
+                self._vectors = np.zeros((self.max_size, q.size), dtype=np.float32)
+                self._entries.clear()
+                self._free_slots = list(range(self.max_size - 1, -1, -1))
+
+            if not self._free_slots:
+                lru_slot = next(iter(self._entries))
+                self._release(lru_slot)
+                metrics.inc("semantic_cache_evictions")
+
+            slot = self._free_slots.pop()
+            self._vectors[slot] = q
+            self._entries[slot] = CacheEntry(
+                tenant=tenant,
+                query=query,
+                response=response,
+                fragments=fragments,
+                created=time.time(),
+                compute_sec=compute_sec,
+                generation=current,
+            )
+
+    def invalidate(self, tenant: Optional[str] = None):
+        """Сбросить кэш тенанта (или весь кэш) — вызывается после загрузки документов"""
+        self.generations.bump_cache_generation(tenant)
+        # Свой сброс должен действовать сразу, не дожидаясь истечения прочитанного поколения
+        if tenant is None:
+            self._generation_cache.clear()
+        else:
+            self._generation_cache.pop(tenant, None)
+        with self._lock:
+            slots = [s for s, e in self._entries.items() if tenant is None or e.tenant == tenant]
+            for slot in slots:
+                self._release(slot)
+        metrics.inc("semantic_cache_invalidations")
+        logger.info("Semantic cache invalidated", extra={"tenant": tenant, "entries": len(slots)})
+
+    def stats(self) -> Dict[str, Any]:
+        hits = metrics.get("semantic_cache_hits")
+        misses = metrics.get("semantic_cache_misses")
+        total = hits + misses
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "ttl_sec": self.ttl_sec,
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "saved_sec": round(metrics.get("semantic_cache_saved_sec"), 3),
+        }
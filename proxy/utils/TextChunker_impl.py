@@ -1,28 +1,111 @@
 import logging
+import os
+import re
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_community.document_loaders import PDFPlumberLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 logger = logging.getLogger(__name__)
 
+# structured — разбиение по структуре документа (заголовки, списки, таблицы) с размером в токенах;
+# recursive — прежнее разбиение по символам (1200 / 200)
+CHUNKERS = ("structured", "recursive")
+CHUNKER = os.getenv("CHUNKER", "structured")
+# Лимит e5 — 512 токенов вместе со служебными, запас оставляем на строку с заголовком раздела
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "480"))
+# Раздел короче этого не выделяется в отдельный чанк, а присоединяется к предыдущему
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+# Токенизатор должен совпадать с моделью эмбеддингов
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "intfloat/multilingual-e5-large-instruct")
+
+_HEADING_RE = re.compile(r"^(\d+(\.\d+)*\.?|[IVXLC]+\.|(Глава|Раздел|Часть|Приложение|Chapter|Section)\s+\S+)\s+\S")
+_LIST_RE = re.compile(r"^([-•–—*▪●]|\d+[.)]|[а-яa-z][.)])\s+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+")
+_TABLE_PREFIX = "| "
+# Шапка таблицы повторяется в каждой части и занимает не больше этой доли бюджета чанка:
+# длинная шапка обрезается, иначе на строки таблицы почти не остается места
+TABLE_HEADER_MAX_SHARE = 0.25
+
 
 class TextChunker:
-    def __init__(self, chunk_size: int = 1200, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1200, chunk_overlap: int = 200, mode: str = None,
+                 max_tokens: int = None, min_tokens: int = None, tokenizer=None):
+        self.mode = (mode or CHUNKER).lower()
+        if self.mode not in CHUNKERS:
+            raise ValueError(f"Unknown chunker '{self.mode}', expected one of {CHUNKERS}")
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
         )
+        self.max_tokens = max_tokens or CHUNK_MAX_TOKENS
+        self.min_tokens = min_tokens if min_tokens is not None else CHUNK_MIN_TOKENS
+        # Токенизатор можно передать готовым (например, embedding_model.tokenizer), иначе загрузится при первом использовании
+        self._tokenizer = tokenizer
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(CHUNK_TOKENIZER)
+        return self._tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        """Число токенов модели, включая служебные"""
+        return len(self.tokenizer(text, add_special_tokens=True)["input_ids"])
+
+    def _text_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
 
     def load_pdf_documents(self, pdf_path: Path) -> List[Document]:
-        return PDFPlumberLoader(str(pdf_path)).load()
+        if self.mode == "recursive":
+            return PDFPlumberLoader(str(pdf_path)).load()
+        return self._load_with_tables(pdf_path)
+
+    @staticmethod
+    def _load_with_tables(pdf_path: Path) -> List[Document]:
+        """Страницы PDF, где таблицы записаны построчно ('| a | b |') на своем месте в тексте.
+        Метаданные такие же, как у PDFPlumberLoader (page — с 0)."""
+        import pdfplumber
+
+        docs = []
+        with pdfplumber.open(str(pdf_path)) as pdf:
+            total_pages = len(pdf.pages)
+            for i, page in enumerate(pdf.pages):
+                tables = page.find_tables()
+                boxes = [t.bbox for t in tables]
+
+                def outside_tables(obj):
+                    return not any(
+                        x0 <= obj.get("x0", -1) and obj.get("x1", -1) <= x1
+                        and top <= obj.get("top", -1) and obj.get("bottom", -1) <= bottom
+                        for x0, top, x1, bottom in boxes
+                    )
+
+                items: List[Tuple[float, str]] = []
+                text_page = page.filter(outside_tables) if boxes else page
+                for line in text_page.extract_text_lines():
+                    items.append((line["top"], line["text"]))
+                for table in tables:
+                    rows = [
+                        _TABLE_PREFIX + " | ".join((cell or "").replace("\n", " ").strip() for cell in row) + " |"
+                        for row in table.extract()
+                    ]
+                    items.append((table.bbox[1], "\n".join(rows)))
+                items.sort(key=lambda item: item[0])
+
+                docs.append(Document(
+                    page_content="\n".join(text for _, text in items),
+                    metadata={"source": str(pdf_path), "file_path": str(pdf_path), "page": i, "total_pages": total_pages},
+                ))
+        return docs
 
     def splitting(self, docs: List[Document]) -> List[Document]:
         if not docs:
             logger.warning("Empty documents list provided to splitting")
             return []
-        
+
         # Логируем информацию о документах перед разбиением
         total_text_length = sum(len(doc.page_content) for doc in docs)
         logger.info(
@@ -30,19 +113,173 @@ class TextChunker:
             extra={
                 "docs_count": len(docs),
                 "total_text_length": total_text_length,
-                "chunk_size": self.splitter._chunk_size,
-                "chunk_overlap": self.splitter._chunk_overlap
+                "chunker": self.mode,
+                "chunk_size": self.splitter._chunk_size if self.mode == "recursive" else self.max_tokens,
+                "chunk_overlap": self.splitter._chunk_overlap if self.mode == "recursive" else 0
             }
         )
-        
-        chunks = self.splitter.split_documents(docs)
-        
+
+        if self.mode == "recursive":
+            chunks = self.splitter.split_documents(docs)
+        else:
+            chunks = []
+            heading = None
+            for doc in docs:
+                page_chunks, heading = self._split_page(doc, heading)
+                chunks.extend(page_chunks)
+
+        # Размер в токенах нужен для бюджета промпта и контроля обрезки моделью
+        for chunk in chunks:
+            chunk.metadata["token_count"] = self.count_tokens(chunk.page_content)
+
         logger.info(
             "Documents split into chunks",
             extra={
                 "input_docs": len(docs),
-                "output_chunks": len(chunks)
+                "output_chunks": len(chunks),
+                "over_limit_chunks": sum(1 for c in chunks if c.metadata["token_count"] > self.max_tokens + 32)
             }
         )
-        
-        return chunks
\ No newline at end of file
+
+        return chunks
+
+    ############################################################## Разбиение по структуре
+    @staticmethod
+    def _is_heading(line: str) -> bool:
+        if len(line) > 120 or line.endswith((".", ",", ";")):
+            return False
+        if _HEADING_RE.match(line):
+            return True
+        letters = [c for c in line if c.isalpha()]
+        # Строка прописными буквами — типичный заголовок в руководствах
+        return len(letters) >= 4 and all(c.isupper() for c in letters)
+
+    def _blocks(self, text: str) -> List[Tuple[str, str]]:
+        """Разбить текст страницы на блоки: heading, list, table, text"""
+        blocks: List[Tuple[str, List[str]]] = []
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line:
+                continue
+            if line.startswith(_TABLE_PREFIX.strip()):
+                kind = "table"
+            elif self._is_heading(line):
+                kind = "heading"
+            elif _LIST_RE.match(line):
+                kind = "list"
+            else:
+                kind = "text"
+
+            last = blocks[-1] if blocks else None
+            if kind == "heading":
+                blocks.append((kind, [line]))
+            elif last and last[0] == "table" and kind == "table":
+                last[1].append(line)
+            elif last and last[0] in ("list", "text") and kind == "text":
+                # Продолжение абзаца или пункта списка
+                last[1].append(line)
+            else:
+                blocks.append((kind, [line]))
+        return [(kind, "\n".join(lines)) for kind, lines in blocks]
+
+    def _truncate(self, text: str, max_tokens: int) -> Optional[str]:
+        """Начало текста по словам в пределах max_tokens с многоточием (None — не помещается ни одно слово)"""
+        words = text.split()
+        n = len(words) * max_tokens // (self._text_tokens(text) + 1)
+        while n > 0:
+            truncated = " ".join(words[:n]) + " …"
+            if self._text_tokens(truncated) <= max_tokens:
+                return truncated
+            n -= 1
+        return None
+
+    def _split_block(self, kind: str, text: str, budget: int) -> List[str]:
+        """Разбить слишком большой блок: таблицу по строкам (с шапкой), текст по предложениям, затем по словам"""
+        if kind == "table":
+            rows = text.split("\n")
+            header, units, sep = rows[0], rows[1:], "\n"
+        else:
+            header, units, sep = None, _SENTENCE_RE.split(text), " "
+
+        header_tokens = self._text_tokens(header) if header else 0
+        header_limit = int(budget * TABLE_HEADER_MAX_SHARE)
+        if header_tokens > header_limit:
+            # Полная шапка остается первой строкой таблицы, а в частях повторяется ее начало
+            units = [header] + units
+            header = self._truncate(header, header_limit)
+            header_tokens = self._text_tokens(header) if header else 0
+
+        parts, current, current_tokens = [], [], 0
+        for unit in units:
+            unit_tokens = self._text_tokens(unit)
+            if unit_tokens + header_tokens > budget:
+                # Одно предложение длиннее лимита — режем по словам
+                words = unit.split()
+                step = max(1, len(words) * (budget - header_tokens) // (unit_tokens + 1))
+                pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+            else:
+                pieces = [unit]
+            for piece in pieces:
+                piece_tokens = self._text_tokens(piece)
+                if current and current_tokens + piece_tokens + header_tokens > budget:
+                    parts.append(sep.join(([header] if header else []) + current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+        if current:
+            parts.append(sep.join(([header] if header else []) + current))
+        return parts
+
+    def _split_page(self, doc: Document, heading: Optional[str]) -> Tuple[List[Document], Optional[str]]:
+        """Собрать чанки страницы из целых блоков. Чанк не пересекает границу страницы,
+        новый раздел начинает новый чанк. Если чанк начинается не с заголовка,
+        первой строкой в него добавляется заголовок текущего раздела."""
+        chunks: List[Document] = []
+        parts: List[str] = []
+        tokens = 0
+
+        def flush():
+            nonlocal parts, tokens
+            # Чанк из одного заголовка-контекста без текста не нужен
+            if parts and parts != [heading]:
+                chunks.append(Document(page_content="\n".join(parts), metadata=dict(doc.metadata)))
+            parts, tokens = [], 0
+
+        def start_with_context():
+            nonlocal parts, tokens
+            if heading:
+                parts = [heading]
+                tokens = self._text_tokens(heading)
+
+        start_with_context()
+        for kind, text in self._blocks(doc.page_content):
+            if kind == "heading":
+                if parts == [heading]:
+                    # В чанке пока только заголовок предыдущего раздела — он больше не нужен
+                    parts, tokens = [], 0
+                elif tokens >= self.min_tokens:
+                    flush()
+                # Короткий предыдущий раздел остается в одном чанке со следующим
+                heading = text
+                parts.append(text)
+                tokens += self._text_tokens(text)
+                continue
+
+            block_tokens = self._text_tokens(text)
+            if tokens + block_tokens > self.max_tokens:
+                flush()
+                start_with_context()
+            if tokens + block_tokens <= self.max_tokens:
+                parts.append(text)
+                tokens += block_tokens
+                continue
+
+            for piece in self._split_block(kind, text, self.max_tokens - tokens):
+                if parts and tokens + self._text_tokens(piece) > self.max_tokens:
+                    flush()
+                    start_with_context()
+                parts.append(piece)
+                tokens += self._text_tokens(piece)
+
+        flush()
+        return chunks, heading
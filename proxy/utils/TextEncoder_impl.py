@@ -7,18 +7,34 @@ from sentence_transformers import SentenceTransformer
 
 logger = logging.getLogger(__name__)
 
+# Бэкенд инференса: torch (fp32/fp16), int8 (динамическая квантизация torch, только CPU)
+# или onnx (ONNX Runtime, требует sentence-transformers[onnx])
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Имя готового ONNX файла в репозитории модели (например onnx/model_qint8_avx512_vnni.onnx);
+# без него модель экспортируется в ONNX при первой загрузке
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE")
+
 
 class TextEmbedding:
-    def __init__(self):
+    def __init__(self, backend: str = None):
         model_name = 'intfloat/multilingual-e5-large-instruct'
+        backend = (backend or EMBEDDING_BACKEND).lower()
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
         # Автоматически определяем устройство: используем GPU если доступен, иначе CPU
         device = "cuda" if torch.cuda.is_available() else "cpu"
+        if backend != "torch":
+            # Квантизованный torch и ONNX Runtime рассчитаны на CPU-хосты
+            device = "cpu"
+        self.backend = backend
         start_time = time.time()
         logger.info(
             "Starting model loading",
             extra={
                 "model_name": model_name,
-                "device": device
+                "device": device,
+                "backend": backend
             }
         )
         try:
@@ -57,7 +73,14 @@ class TextEmbedding:
             # SentenceTransformer сам определит оптимальные настройки
             try:
                 # Для CPU не передаем model_kwargs с dtype, чтобы избежать проблем
-                if device == "cuda":
+                if backend == "onnx":
+                    self.embedding_model = SentenceTransformer(
+                        model_name,
+                        device=device,
+                        backend="onnx",
+                        model_kwargs={"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+                    )
+                elif device == "cuda":
                     self.embedding_model = SentenceTransformer(
                         model_name,
                         device=device,
@@ -69,6 +92,14 @@ class TextEmbedding:
                         model_name,
                         device=device
                     )
+                    if backend == "int8":
+                        # Linear-слои трансформера переводим в int8, активации квантуются на лету
+                        torch.quantization.quantize_dynamic(
+                            self.embedding_model,
+                            {torch.nn.Linear},
+                            dtype=torch.qint8,
+                            inplace=True
+                        )
             finally:
                 self._loading = False
             
@@ -78,6 +109,7 @@ class TextEmbedding:
                 extra={
                     "model_name": model_name,
                     "device": device,
+                    "backend": backend,
                     "load_time_seconds": round(load_time, 2),
                     "load_time_minutes": round(load_time / 60, 2)
                 }
@@ -89,6 +121,7 @@ class TextEmbedding:
                 extra={
                     "model_name": model_name,
                     "device": device,
+                    "backend": backend,
                     "load_time_seconds": round(load_time, 2),
                     "error": str(e),
                     "error_type": type(e).__name__
@@ -101,7 +134,8 @@ class TextEmbedding:
         Data_db = {
             'id': [i for i in range(1, len(chunks) + 1)],
             'source': [chunk.metadata['source'] for chunk in chunks],
-            'emb': [self.embedding_model.encode(chunk.page_content) for chunk in chunks],
+            # Кодируем все чанки одним батчевым вызовом, а не по одному
+            'emb': list(self.embedding_model.encode([chunk.page_content for chunk in chunks], batch_size=32)),
             'content': [chunk.page_content for chunk in chunks]
         }
         return Data_db
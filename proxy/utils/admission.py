@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from proxy.utils import metrics
+from proxy.utils.timing import phase
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Стадии обработки и их лимиты по умолчанию: (одновременно, в очереди, сколько ждать в очереди, сек).
+# Переопределяются переменными ADMISSION_<STAGE>_INFLIGHT / _QUEUE / _TIMEOUT_SEC
+_STAGE_DEFAULTS: Dict[str, Tuple[int, int, float]] = {
+    "q": (16, 64, 10.0),      # запрос /q целиком
+    "embed": (2, 64, 5.0),    # эмбеддинг вопроса (CPU/GPU модели)
+    "llm": (4, 32, 20.0),     # генерация ответа (квота GigaChat)
+    "upload": (2, 4, 30.0),   # прием файлов /upload
+    "batch": (2, 4, 30.0),    # пакеты вопросов /q/batch
+}
+# Сколько загрузок может ждать фонового разбора, прежде чем /upload начнет отвечать 503
+UPLOAD_MAX_PENDING = int(os.getenv("UPLOAD_MAX_PENDING", "8"))
+
+# Ограничение частоты запросов одного клиента: запросов в минуту и размер всплеска (0 — без ограничения)
+_RATE_DEFAULTS: Dict[str, Tuple[float, int]] = {
+    "q": (60.0, 10),
+    "upload": (10.0, 5),
+    "batch": (6.0, 2),
+}
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# За nginx адрес клиента приходит в X-Real-IP; если приложение открыто напрямую, доверять заголовку нельзя
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "true").lower() in ("1", "true", "yes")
+
+
+class Rejected(Exception):
+    """Запрос не принят: status_code 429 (лимит клиента) или 503 (перегрузка)"""
+
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class StageLimiter:
+    """Ограничение числа одновременных операций стадии с ограниченной очередью.
+
+    Если очередь заполнена, запрос отклоняется сразу; если место не освободилось
+    за `queue_timeout_sec`, запрос отклоняется по таймауту. В обоих случаях
+    Retry-After оценивается по среднему времени операции.
+    """
+
+    def __init__(self, name: str, max_inflight: int, max_queue: int, queue_timeout_sec: float):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout_sec = queue_timeout_sec
+
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self._inflight = 0
+        self._waiting = 0
+        self._avg_sec = 1.0  # Экспоненциальное среднее длительности операции
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_sec * (self._waiting + 1) / self.max_inflight))
+
+    def _reject(self, reason: str) -> Rejected:
+        metrics.inc(f"admission_{self.name}_{reason}")
+        logger.warning(
+            "Request rejected by admission control",
+            extra={"stage": self.name, "reason": reason, "inflight": self._inflight, "waiting": self._waiting}
+        )
+        return Rejected(503, self._retry_after(), f"Stage '{self.name}' is overloaded ({reason})")
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise self._reject("queue_full")
+
+        self._waiting += 1
+        try:
+            with phase(f"queue_{self.name}"):
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout_sec)
+        except asyncio.TimeoutError:
+            raise self._reject("queue_timeout")
+        finally:
+            self._waiting -= 1
+
+        self._inflight += 1
+        metrics.inc(f"admission_{self.name}_admitted")
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._avg_sec = 0.8 * self._avg_sec + 0.2 * (time.perf_counter() - started)
+            self._inflight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "inflight": self._inflight,
+            "waiting": self._waiting,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "queue_timeout_sec": self.queue_timeout_sec,
+            "avg_sec": round(self._avg_sec, 3),
+        }
+
+
+class RateLimiter:
+    """Token bucket на каждого клиента; самые давние клиенты вытесняются при переполнении"""
+
+    def __init__(self, name: str, per_minute: float, burst: int, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # клиент -> (токены, время)
+
+    def check(self, client: Optional[str]):
+        """Списать токен клиента или бросить Rejected(429)"""
+        if self.rate <= 0 or not client:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+        if not allowed:
+            metrics.inc(f"rate_limited_{self.name}")
+            logger.warning("Client rate limit exceeded", extra={"limiter": self.name, "client_ip": client})
+            raise Rejected(429, max(1, math.ceil((1.0 - tokens) / self.rate)), "Too many requests")
+
+
+class PendingCounter:
+    """Счетчик отложенных задач (например, загрузок, ждущих разбора) с верхней границей"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def reserve(self):
+        with self._lock:
+            if self._pending >= self.limit:
+                metrics.inc(f"admission_{self.name}_backlog_full")
+                raise Rejected(503, 30, f"Too many pending '{self.name}' tasks")
+            self._pending += 1
+
+    def release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": self._pending, "limit": self.limit}
+
+
+def _env_stage(name: str) -> StageLimiter:
+    inflight, queue, timeout = _STAGE_DEFAULTS[name]
+    prefix = f"ADMISSION_{name.upper()}"
+    return StageLimiter(
+        name,
+        max_inflight=int(os.getenv(f"{prefix}_INFLIGHT", str(inflight))),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+        queue_timeout_sec=float(os.getenv(f"{prefix}_TIMEOUT_SEC", str(timeout))),
+    )
+
+
+def _env_rate(name: str) -> RateLimiter:
+    per_minute, burst = _RATE_DEFAULTS[name]
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return RateLimiter(
+        name,
+        per_minute=float(os.getenv(f"{prefix}_PER_MIN", str(per_minute))),
+        burst=int(os.getenv(f"{prefix}_BURST", str(burst))),
+    )
+
+
+_stages: Dict[str, StageLimiter] = {name: _env_stage(name) for name in _STAGE_DEFAULTS}
+_rates: Dict[str, RateLimiter] = {name: _env_rate(name) for name in _RATE_DEFAULTS}
+upload_backlog = PendingCounter("upload", UPLOAD_MAX_PENDING)
+
+
+def stage(name: str) -> StageLimiter:
+    return _stages[name]
+
+
+def rate_limit(name: str, client: Optional[str]):
+    _rates[name].check(client)
+
+
+def client_ip(request) -> Optional[str]:
+    """Адрес клиента: за nginx — из X-Real-IP, иначе адрес соединения"""
+    if TRUST_PROXY_HEADERS:
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+    return request.client.host if request.client else None
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    result = {name: limiter.stats() for name, limiter in _stages.items()}
+    result["upload_backlog"] = upload_backlog.stats()
+    return result
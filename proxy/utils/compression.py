@@ -0,0 +1,147 @@
+import os
+import zlib
+from typing import Optional
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from proxy.utils import metrics
+from proxy.utils.timing import phase
+
+try:
+    import brotli
+except ImportError:  # без пакета brotli ответы сжимаются только gzip
+    brotli = None
+
+load_dotenv()
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() in ("1", "true", "yes")
+# Ответы меньше этого размера не сжимаются: выигрыш меньше заголовков и затрат CPU
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# Невысокие уровни: почти весь выигрыш в размере JSON при малой цене в CPU
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+# Сжимаются только текстовые ответы; PDF и страницы документов уже сжаты
+_COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Кодировка ответа по Accept-Encoding: br, если доступен, иначе gzip; None — без сжатия"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    def accepted(encoding: str) -> bool:
+        return weights.get(encoding, weights.get("*", 0.0)) > 0
+
+    if brotli is not None and accepted("br"):
+        return "br"
+    if accepted("gzip"):
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            # wbits=31 — формат gzip (заголовок и контрольная сумма)
+            self._zlib = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Сжать часть потока и вытолкнуть ее клиенту (строки NDJSON не должны застревать в буфере)"""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """Сжатие gzip/brotli по Accept-Encoding. Чистый ASGI, как LoggingMiddleware:
+    ответ целиком сжимается одним вызовом, потоковый — по частям. Время сжатия — фаза compress"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not RESPONSE_COMPRESSION:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                # Заголовки отправляем вместе с первой частью тела: до нее неизвестно, сжимать ли ответ
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(scope=start)
+                content_type = headers.get("content-type", "")
+                if (
+                    start["status"] in (204, 206, 304)
+                    or "content-encoding" in headers
+                    or "content-range" in headers
+                    or not content_type.startswith(_COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < COMPRESS_MIN_BYTES)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                encoder = _Encoder(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    with phase("compress"):
+                        data = encoder.finish(body)
+                    headers["Content-Length"] = str(len(data))
+                    metrics.inc("compressed_bytes_in", len(body))
+                    metrics.inc("compressed_bytes_out", len(data))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                await send(start)
+
+            with phase("compress"):
+                data = encoder.chunk(body) if more_body else encoder.finish(body)
+            metrics.inc("compressed_bytes_in", len(body))
+            metrics.inc("compressed_bytes_out", len(data))
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Если задан, файл отдает nginx: приложение отвечает пустым телом с X-Accel-Redirect
+# на internal location (например, /internal/docs/), указывающую на DOC_DIR
+DOC_ACCEL_REDIRECT_PREFIX = os.getenv("DOC_ACCEL_REDIRECT_PREFIX", "")
+DOC_CACHE_MAX_AGE_SEC = int(os.getenv("DOC_CACHE_MAX_AGE_SEC", "3600"))
+
+# Дисковый кэш отдельных страниц для превью цитат (по умолчанию — внутри DOC_DIR)
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR") or str(Path(os.getenv("DOC_DIR", ".")) / ".page_cache")
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", "512"))
+PAGE_FORMATS = {"pdf": "application/pdf", "text": "text/plain; charset=utf-8"}
+
+_HASH_CHUNK = 1024 * 1024
+
+# (путь, mtime_ns, размер) -> ETag. Хэш считаем один раз на версию файла
+_etags: Dict[Tuple[str, int, int], str] = {}
+_etags_lock = threading.Lock()
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+
+def safe_doc_name(name: str) -> str:
+    """Имя PDF в директории тенанта (ValueError, если имя пытается выйти за её пределы)"""
+    if not name or ".." in name or "/" in name or "\\" in name:
+        raise ValueError(f"Invalid file name: {name!r}")
+    if not name.lower().endswith(".pdf"):
+        name += ".pdf"
+    return name
+
+
+def file_etag(path: Path, stat: os.stat_result) -> str:
+    """Сильный ETag: SHA-256 содержимого файла (меняется при любом изменении байтов)"""
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _etags_lock:
+        etag = _etags.get(key)
+    if etag is not None:
+        return etag
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(block)
+    etag = f'"{digest.hexdigest()[:32]}"'
+
+    with _etags_lock:
+        # Старые версии того же файла больше не нужны
+        for old in [k for k in _etags if k[0] == key[0]]:
+            del _etags[old]
+        _etags[key] = etag
+    return etag
+
+
+def last_modified(stat: os.stat_result) -> str:
+    return formatdate(stat.st_mtime, usegmt=True)
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str,
+                    stat: os.stat_result) -> bool:
+    """Условный GET (RFC 9110): If-None-Match приоритетнее If-Modified-Since"""
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stat.st_mtime) <= since
+    return False
+
+
+def doc_headers(etag: str, stat: os.stat_result) -> Dict[str, str]:
+    """Заголовки валидации и кэширования документа"""
+    return {
+        "ETag": etag,
+        "Last-Modified": last_modified(stat),
+        "Cache-Control": f"public, max-age={DOC_CACHE_MAX_AGE_SEC}",
+        # Один и тот же URL у разных тенантов указывает на разные файлы — кэш nginx
+        # должен различать их по заголовку тенанта
+        "Vary": "X-Tenant-ID",
+    }
+
+
+def get_page_cache():
+    global _page_cache
+    if _page_cache is None:
+        with _page_cache_lock:
+            if _page_cache is None:
+                from proxy.utils.PageCache_impl import PageCache
+                _page_cache = PageCache(Path(PAGE_CACHE_DIR), int(PAGE_CACHE_MAX_MB * 1024 * 1024))
+    return _page_cache
+
+
+def page_etag(doc_etag: str, page: int, fmt: str) -> str:
+    """ETag страницы выводится из ETag документа: меняется вместе с файлом"""
+    return f'"{doc_etag.strip(chr(34))}-p{page}-{fmt}"'
+
+
+def render_page(pdf_path: Path, page: int, fmt: str, out_path: Path):
+    """Записать страницу `page` (с 1) как одностраничный PDF или как текст.
+    IndexError — если такой страницы в документе нет."""
+    if fmt == "pdf":
+        from pypdf import PdfReader, PdfWriter
+
+        reader = PdfReader(str(pdf_path))
+        if not 1 <= page <= len(reader.pages):
+            raise IndexError(f"Page {page} out of range (1..{len(reader.pages)})")
+        writer = PdfWriter()
+        writer.add_page(reader.pages[page - 1])
+        with open(out_path, "wb") as f:
+            writer.write(f)
+        return
+
+    import pdfplumber
+
+    with pdfplumber.open(str(pdf_path)) as pdf:
+        if not 1 <= page <= len(pdf.pages):
+            raise IndexError(f"Page {page} out of range (1..{len(pdf.pages)})")
+        text = pdf.pages[page - 1].extract_text() or ""
+    Path(out_path).write_text(text, encoding="utf-8")
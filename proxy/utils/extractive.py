@@ -0,0 +1,91 @@
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from proxy.utils.timing import phase
+
+load_dotenv()
+
+# Извлекающий ответ — запасной режим, когда GigaChat не ответил к сроку или отключен предохранителем:
+# ответом становятся предложения найденных фрагментов, больше всего совпадающие с вопросом по словам.
+# Модель здесь не вызывается: после истекшего срока GigaChat ответ должен уйти за миллисекунды.
+# Сколько предложений попадает в ответ
+EXTRACTIVE_MAX_SENTENCES = int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "3"))
+# Больше предложений не рассматривается
+EXTRACTIVE_MAX_CANDIDATES = int(os.getenv("EXTRACTIVE_MAX_CANDIDATES", "64"))
+# Более короткие куски (номера пунктов, заголовки) не считаются предложениями
+EXTRACTIVE_MIN_CHARS = 20
+
+DEGRADED_NOTICE = (
+    "Сервис генерации ответов временно недоступен. "
+    "Ниже — наиболее подходящие к вопросу выдержки из документации."
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…;])\s+|\n\s*\n")
+_WORD = re.compile(r"\w{3,}")
+# Грубая замена стемминга для русского: слова сравниваются по началу (билет, билета, билетов)
+STEM_CHARS = 6
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = [" ".join(part.split()) for part in _SENTENCE_END.split(text or "")]
+    kept = [s for s in sentences if len(s) >= EXTRACTIVE_MIN_CHARS]
+    if not kept and text and text.strip():
+        # Фрагмент целиком короче порога — используем его как одно предложение
+        kept = [" ".join(text.split())]
+    return kept
+
+
+def terms(text: str) -> set:
+    return {word[:STEM_CHARS] for word in _WORD.findall(text.lower().replace("ё", "е"))}
+
+
+def rank_sentences(query: str, sentences: List[str]) -> List[float]:
+    """Сумма IDF слов вопроса, встречающихся в предложении; IDF считается по самим кандидатам,
+    поэтому слова, которые есть почти везде, почти ничего не весят"""
+    query_terms = terms(query)
+    sentence_terms = [terms(sentence) & query_terms for sentence in sentences]
+    df = Counter(term for found in sentence_terms for term in found)
+    idf = {term: math.log(1 + len(sentences) / count) for term, count in df.items()}
+    return [sum(idf[term] for term in found) for found in sentence_terms]
+
+
+def _citation(fragment: Dict[str, Any]) -> str:
+    name = Path(str(fragment.get("source") or "")).name
+    page = fragment.get("page")
+    if name and page:
+        return f"{name}, стр. {page}"
+    return name
+
+
+def extractive_answer(query: str, fragments: List[Dict[str, Any]]) -> str:
+    """Ответ из лучших предложений фрагментов (фрагменты отсортированы по убыванию сходства)"""
+    with phase("extractive"):
+        candidates = []  # (предложение, фрагмент)
+        seen = set()
+        for fragment in fragments:
+            for sentence in split_sentences(fragment.get("text", "")):
+                if sentence not in seen:
+                    seen.add(sentence)
+                    candidates.append((sentence, fragment))
+            if len(candidates) >= EXTRACTIVE_MAX_CANDIDATES:
+                break
+        candidates = candidates[:EXTRACTIVE_MAX_CANDIDATES]
+        if not candidates:
+            return DEGRADED_NOTICE
+
+        scores = rank_sentences(query, [sentence for sentence, _ in candidates])
+        # При равном счете выше предложение из более близкого по вектору фрагмента (порядок кандидатов)
+        best = sorted(range(len(candidates)), key=lambda i: -scores[i])[:EXTRACTIVE_MAX_SENTENCES]
+
+    lines = [DEGRADED_NOTICE, ""]
+    for i in best:
+        sentence, fragment = candidates[i]
+        citation = _citation(fragment)
+        lines.append(f"- {sentence}" + (f" ({citation})" if citation else ""))
+    return "\n".join(lines)
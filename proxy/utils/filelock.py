@@ -0,0 +1,56 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows (локальная разработка): блокировка действует только внутри процесса
+    fcntl = None
+
+
+class FileLock:
+    """Блокировка между потоками и процессами через flock на файле.
+
+    Нужна там, где общие файлы (files_chunks.json, счетчик id) меняют несколько
+    воркеров uvicorn и офлайн-утилиты. Внутри процесса сначала берется обычный
+    Lock, затем — flock на отдельном дескрипторе. Блокировку снимает ОС, если
+    процесс упал, поэтому «зависших» lock-файлов не бывает.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        # Путь относительный, как и files_chunks.json: файл открывается в текущей директории процесса
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BaseException as e:
+            os.close(fd)
+            self._thread_lock.release()
+            if isinstance(e, BlockingIOError):
+                return False
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -1,32 +1,74 @@
 import logging
-from gigachat import GigaChat
+import random
+import threading
+import time
+from types import SimpleNamespace
 
 import os
 
 from dotenv import load_dotenv
 
+from proxy.utils import metrics
+from proxy.utils.CircuitBreaker_impl import CircuitBreaker
+from proxy.utils.timing import phase
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 GIGA_KEY = os.getenv("GIGA_KEY")
+# gigachat — настоящий API, fake — локальная заглушка с настраиваемой задержкой (для бенчмарков)
+GIGA_BACKEND = os.getenv("GIGA_BACKEND", "gigachat")
+GIGA_FAKE_LATENCY_MS = float(os.getenv("GIGA_FAKE_LATENCY_MS", "1500"))
+GIGA_FAKE_JITTER_MS = float(os.getenv("GIGA_FAKE_JITTER_MS", "300"))
+# Доля вызовов заглушки, которые завершаются ошибкой (проверка деградированного режима)
+GIGA_FAKE_ERROR_RATE = float(os.getenv("GIGA_FAKE_ERROR_RATE", "0"))
 
-giga = GigaChat(
-   credentials=GIGA_KEY,
-   verify_ssl_certs=False
-)
+# Сколько ждать ответа GigaChat; не успел — /q отдает извлекающий ответ (0 — ждать без ограничения)
+LLM_DEADLINE_SEC = float(os.getenv("LLM_DEADLINE_SEC", "20"))
+# После стольких ошибок/таймаутов подряд GigaChat не вызывается LLM_BREAKER_COOLDOWN_SEC секунд (0 — не отключать)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SEC = float(os.getenv("LLM_BREAKER_COOLDOWN_SEC", "30"))
 
-def giga_answer(query: str, fragments: list[dict]) -> str:
-   logger.info(
-       "Generating answer with GigaChat",
-       extra={
-           "query": query,
-           "fragments_count": len(fragments)
-       }
-   )
-   
-   try:
-       q = f"""
+llm_breaker = CircuitBreaker("llm", LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SEC)
+
+
+class FakeGigaChat:
+   """Заглушка GigaChat: отвечает фиксированным текстом после задержки, похожей на реальную"""
+
+   def chat(self, prompt: str):
+      delay = max(GIGA_FAKE_LATENCY_MS + random.uniform(-GIGA_FAKE_JITTER_MS, GIGA_FAKE_JITTER_MS), 0)
+      time.sleep(delay / 1000)
+      if random.random() < GIGA_FAKE_ERROR_RATE:
+         raise RuntimeError("Fake GigaChat error")
+      content = f"Тестовый ответ на основе {prompt.count(chr(10))} строк контекста."
+      return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+_giga = None
+_giga_lock = threading.Lock()
+
+
+def get_giga():
+   """Клиент GigaChat (ленивая инициализация): пакет gigachat импортируется при первом вопросе"""
+   global _giga
+   if _giga is None:
+      with _giga_lock:
+         if _giga is None:
+            if GIGA_BACKEND == "fake":
+               _giga = FakeGigaChat()
+            else:
+               from gigachat import GigaChat
+               _giga = GigaChat(
+                  credentials=GIGA_KEY,
+                  verify_ssl_certs=False,
+                  # Поток, от которого /q перестал ждать по LLM_DEADLINE_SEC, не должен висеть дольше
+                  timeout=LLM_DEADLINE_SEC or None
+               )
+   return _giga
+
+def build_prompt(query: str, fragments: list[dict]) -> str:
+   q = f"""
        Ваша роль - выступать в качестве системы информационного поиска.
        Вам будет задан вопрос, а также предоставлены релевантные отрывки из различных документов.
        Ваша задача - сформировать короткий и информативный ответ (не более 150 слов), основанный исключительно на представленных отрывках.
@@ -45,13 +87,29 @@ def giga_answer(query: str, fragments: list[dict]) -> str:
        
        """
 
-       for fragment in fragments:
-          # fragments - это список словарей с ключами 'text' и 'source'
-          fragment_text = fragment.get('text', '') if isinstance(fragment, dict) else getattr(fragment, 'text', '')
-          q += f"{fragment_text}\n"
+   for fragment in fragments:
+      # fragments - это список словарей с ключами 'text' и 'source'
+      fragment_text = fragment.get('text', '') if isinstance(fragment, dict) else getattr(fragment, 'text', '')
+      q += f"{fragment_text}\n"
+   return q
+
+def giga_answer(query: str, fragments: list[dict]) -> str:
+   logger.info(
+       "Generating answer with GigaChat",
+       extra={
+           "query": query,
+           "fragments_count": len(fragments)
+       }
+   )
+   
+   try:
+       with phase("prompt_build"):
+          q = build_prompt(query, fragments)
 
        logger.debug("Sending request to GigaChat", extra={"prompt_length": len(q)})
-       response = giga.chat(q)
+       with phase("llm"):
+          response = get_giga().chat(q)
+       metrics.inc("llm_calls")
        
        answer = response.choices[0].message.content
        logger.info(
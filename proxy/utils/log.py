@@ -0,0 +1,129 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Optional
+
+from dotenv import load_dotenv
+from pythonjsonlogger import jsonlogger
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Запись в stdout выполняет отдельный поток: запрос только кладет запись в очередь
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+# Переполненная очередь не тормозит запросы — лишние записи отбрасываются (счетчик log_dropped)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Длинные строки в полях записи (вопрос, текст чанков) обрезаются до этого числа символов
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "1000"))
+# Длинные списки в полях записи обрезаются до этого числа элементов
+LOG_MAX_ITEMS = int(os.getenv("LOG_MAX_ITEMS", "20"))
+# Доля DEBUG записей, которые попадают в лог (содержимое чанков, промпты); 1 — все
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+
+# Атрибуты самой LogRecord — всё остальное пришло через extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _truncate(value, depth: int = 0):
+    if isinstance(value, str):
+        if len(value) > LOG_MAX_FIELD_CHARS:
+            return f"{value[:LOG_MAX_FIELD_CHARS]}…(+{len(value) - LOG_MAX_FIELD_CHARS} chars)"
+        return value
+    if depth >= 2:
+        return value
+    if isinstance(value, (list, tuple)):
+        items = [_truncate(v, depth + 1) for v in value[:LOG_MAX_ITEMS]]
+        if len(value) > LOG_MAX_ITEMS:
+            items.append(f"…(+{len(value) - LOG_MAX_ITEMS} items)")
+        return items
+    if isinstance(value, dict):
+        return {k: _truncate(v, depth + 1) for k, v in value.items()}
+    return value
+
+
+class PayloadFilter(logging.Filter):
+    """Обрезка больших полей и выборка DEBUG записей"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and LOG_DEBUG_SAMPLE_RATE < 1.0:
+            if random.random() >= LOG_DEBUG_SAMPLE_RATE:
+                return False
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                record.__dict__[key] = _truncate(value)
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не блокируется на полной очереди и сохраняет поля extra"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы сообщения и исключение форматируем здесь: в другом потоке они могут измениться,
+        # а остальные поля (extra) передаем как есть для JSON форматтера
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = _truncate(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            from proxy.utils import metrics
+            metrics.inc("log_dropped")
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        # Дописываем оставшиеся в очереди записи перед выходом
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging():
+    global _listener
+
+    logger = logging.getLogger()
+    logger.setLevel(LOG_LEVEL)
+
+    # Удаляем все существующие обработчики
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    _stop_listener()
+
+    # Создаем форматтер для JSON
+    formatter = jsonlogger.JsonFormatter(
+        '%(asctime)s %(name)s %(levelname)s %(message)s %(service)s %(method)s %(endpoint)s %(status_code)s %(duration_sec)s',
+        json_ensure_ascii=False,
+        rename_fields={
+            "asctime": "timestamp",
+            "levelname": "level",
+            "name": "logger"
+        }
+    )
+
+    # Обработчик для вывода в консоль (Docker будет собирать эти логи)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    if not LOG_ASYNC:
+        console_handler.addFilter(PayloadFilter())
+        logger.addHandler(console_handler)
+        return
+
+    queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(PayloadFilter())
+    logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
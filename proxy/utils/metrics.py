@@ -0,0 +1,22 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Dict
+
+# Простые счетчики процесса (количество событий, суммарные секунды и т.п.)
+_lock = Lock()
+_counters: Dict[str, float] = defaultdict(float)
+
+
+def inc(name: str, value: float = 1.0):
+    with _lock:
+        _counters[name] += value
+
+
+def get(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0.0)
+
+
+def snapshot() -> Dict[str, float]:
+    with _lock:
+        return {k: round(v, 6) for k, v in _counters.items()}
@@ -0,0 +1,170 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from proxy.utils import metrics
+from proxy.utils.timing import span_tree
+
+load_dotenv()
+
+# Запросы дольше порога сохраняются с деревом фаз (embed, milvus_load, milvus_search, prompt_build, llm, ...)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "3000"))
+# Сколько последних медленных запросов хранить в памяти
+SLOW_TRACE_KEEP = int(os.getenv("SLOW_TRACE_KEEP", "100"))
+# Профилировщик: самый длинный допустимый запуск, интервал выборки по умолчанию и сколько профилей хранить
+PROFILE_MAX_SEC = float(os.getenv("PROFILE_MAX_SEC", "60"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "5"))
+
+_slow: Deque[Dict[str, Any]] = deque(maxlen=SLOW_TRACE_KEEP)
+_profiles: Deque[Dict[str, Any]] = deque(maxlen=PROFILE_KEEP)
+_profile_lock = threading.Lock()
+_profile_ids = itertools.count(1)
+
+# Кадры ожидания: поток пула без работы и цикл событий без готовых задач. По умолчанию не пишутся
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+# Админские запросы (профиль, переиндексация) долгие по своей природе и в трассировку не попадают
+_UNTRACED_PREFIX = "/api/v1/admin/"
+
+_ROOT = str(Path(__file__).resolve().parents[2])
+_frame_names: Dict[Any, str] = {}
+
+
+# ---------------------------------------------------------------------- медленные запросы
+
+def record_slow(method: str, path: str, status_code: int, started: float, duration: float,
+                spans: List[list]):
+    """Сохранить запрос с деревом фаз, если он дольше SLOW_REQUEST_MS.
+    Запросы без фаз не сохраняются: кроме длительности из лога, в них нечего смотреть"""
+    if duration * 1000 < SLOW_REQUEST_MS or not spans or path.startswith(_UNTRACED_PREFIX):
+        return
+    _slow.append({
+        "ts": round(time.time(), 3),
+        "method": method,
+        "path": path,
+        "status_code": status_code,
+        "duration_ms": round(duration * 1000, 2),
+        "spans": span_tree(spans, started),
+    })
+    metrics.inc("slow_requests")
+
+
+def slow_requests(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Медленные запросы, последние первыми"""
+    entries = list(_slow)[::-1]
+    return entries[:limit] if limit else entries
+
+
+def clear_slow():
+    _slow.clear()
+
+
+# ---------------------------------------------------------------------- профилировщик
+
+def _frame_name(code) -> str:
+    """Имя кадра в стиле py-spy: функция (файл:строка), путь — от корня проекта или site-packages"""
+    name = _frame_names.get(code)
+    if name is None:
+        filename = code.co_filename
+        if filename.startswith(_ROOT):
+            filename = filename[len(_ROOT) + 1:]
+        elif "site-packages" in filename:
+            filename = filename.split("site-packages", 1)[1].lstrip("/\\")
+        else:
+            filename = Path(filename).name
+        name = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+        _frame_names[code] = name
+    return name
+
+
+def _is_idle(code) -> bool:
+    return (Path(code.co_filename).name, code.co_name) in _IDLE_FRAMES
+
+
+def _sample(stacks: Counter, own_id: int, idle: bool):
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id == own_id:
+            continue
+        if not idle and _is_idle(frame.f_code):
+            continue
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        stacks[(names.get(thread_id, str(thread_id)), tuple(reversed(codes)))] += 1
+
+
+def _folded(stacks: Counter) -> str:
+    """Формат collapsed stacks (flamegraph.pl, speedscope, inferno): «поток;кадр;...;кадр число»"""
+    lines = [
+        ";".join([f"thread:{thread}", *(_frame_name(code) for code in codes)]) + f" {count}"
+        for (thread, codes), count in stacks.most_common()
+    ]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def profile(seconds: float, interval_ms: Optional[float] = None, idle: bool = False) -> Dict[str, Any]:
+    """Выборочный профиль всех потоков процесса за seconds секунд.
+
+    Раз в interval_ms снимаются стеки всех потоков (sys._current_frames), одинаковые стеки
+    суммируются. Замер идет по стенным часам: видно и CPU, и ожидание Milvus/GigaChat.
+    Одновременно идет только один профиль; RuntimeError, если другой уже запущен"""
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("Profiling is already running")
+    try:
+        interval = (interval_ms or PROFILE_INTERVAL_MS) / 1000
+        seconds = min(seconds, PROFILE_MAX_SEC)
+        own_id = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        started_at = time.time()
+        started = time.perf_counter()
+        deadline = started + seconds
+        while True:
+            _sample(stacks, own_id, idle)
+            samples += 1
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(interval, deadline - now))
+
+        result = {
+            "id": next(_profile_ids),
+            "started_at": round(started_at, 3),
+            "duration_sec": round(time.perf_counter() - started, 3),
+            "interval_ms": round(interval * 1000, 3),
+            "samples": samples,
+            "stacks": len(stacks),
+            "folded": _folded(stacks),
+        }
+        _profiles.append(result)
+        metrics.inc("profiles")
+        return result
+    finally:
+        _profile_lock.release()
+
+
+def is_profiling() -> bool:
+    return _profile_lock.locked()
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Сохраненные профили без стеков, последние первыми"""
+    return [{k: v for k, v in entry.items() if k != "folded"} for entry in reversed(_profiles)]
+
+
+def get_profile(profile_id: int) -> Optional[Dict[str, Any]]:
+    return next((entry for entry in _profiles if entry["id"] == profile_id), None)
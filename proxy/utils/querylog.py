@@ -0,0 +1,114 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import orjson
+from dotenv import load_dotenv
+
+from proxy.utils import metrics
+from proxy.utils.timing import get_phases
+
+load_dotenv()
+
+# Запись вопросов /q и результатов поиска для офлайн-сравнения индексов (python -m proxy.tools.replay).
+# Папка для файлов q.<pid>.jsonl, q.<pid>.jsonl.1, ...; пусто — запись выключена
+QUERY_LOG_DIR = os.getenv("QUERY_LOG_DIR", "")
+# Доля записываемых вопросов
+QUERY_LOG_SAMPLE_RATE = float(os.getenv("QUERY_LOG_SAMPLE_RATE", "1.0"))
+# Размер файла, после которого он переименовывается в q.<pid>.jsonl.1, и сколько таких файлов хранить
+QUERY_LOG_MAX_MB = float(os.getenv("QUERY_LOG_MAX_MB", "50"))
+QUERY_LOG_BACKUPS = int(os.getenv("QUERY_LOG_BACKUPS", "5"))
+
+# У каждого воркера uvicorn свой файл: ротация переименовывает файл, и при общем файле
+# записи остальных воркеров терялись бы или перемешивались. replay читает все файлы папки
+QUERY_LOG_PATTERN = "q*.jsonl*"
+
+
+def _log_file_name() -> str:
+    return f"q.{os.getpid()}.jsonl"
+
+_logger = logging.getLogger("proxy.querylog")
+_listener: Optional[logging.handlers.QueueListener] = None
+_started = False
+
+
+class _CaptureQueueHandler(logging.handlers.QueueHandler):
+    """Запись уже сериализована — в очередь кладем как есть, полная очередь не тормозит запрос"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("query_log_dropped")
+
+
+def _stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _start() -> bool:
+    """Файл открывается при первой записи; запись в файл идет из отдельного потока"""
+    global _listener, _started
+    if _started:
+        return _listener is not None
+    _started = True
+    if not QUERY_LOG_DIR:
+        return False
+
+    directory = Path(QUERY_LOG_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        directory / _log_file_name(),
+        maxBytes=int(QUERY_LOG_MAX_MB * 1024 * 1024),
+        backupCount=QUERY_LOG_BACKUPS,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    queue_handler = _CaptureQueueHandler(queue.Queue(10000))
+    _logger.addHandler(queue_handler)
+    _logger.setLevel(logging.INFO)
+    # Записи не должны попадать в общий JSON лог
+    _logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler)
+    _listener.start()
+    atexit.register(_stop)
+    return True
+
+
+def record(tenant: str, query: str, fragments: List[Dict[str, Any]], kept: Optional[int] = None,
+           gated: Optional[str] = None, cached: bool = False, degraded: bool = False):
+    """Записать вопрос и найденные чанки (id, сходство, документ#страница) с фазами текущего запроса"""
+    if not QUERY_LOG_DIR or random.random() >= QUERY_LOG_SAMPLE_RATE:
+        return
+    if not _start():
+        return
+    entry = {
+        "ts": round(time.time(), 3),
+        "tenant": tenant,
+        "query": query,
+        "ids": [fragment.get("id") for fragment in fragments],
+        "scores": [fragment.get("score") for fragment in fragments],
+        # Документ и страница: по ним сравниваются результаты, если после перенарезки id чанков изменились
+        "refs": [f"{Path(str(fragment.get('source') or '')).name}#{fragment.get('page') or ''}" for fragment in fragments],
+        "kept": len(fragments) if kept is None else kept,
+        "gated": gated,
+        "cached": cached,
+        "degraded": degraded,
+        "phases_ms": {name: round(sec * 1000, 2) for name, sec in get_phases().items()},
+    }
+    _logger.info(orjson.dumps(entry).decode())
+    metrics.inc("query_log_records")
@@ -0,0 +1,53 @@
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from proxy.utils import metrics
+
+load_dotenv()
+
+# Пороги подбираются по размеченным вопросам: python -m proxy.tools.relevance_calibrate.
+# Значения по умолчанию повторяют прежнее поведение (ответ, если найдено хотя бы 3 фрагмента)
+# Минимальное косинусное сходство лучшего фрагмента и фрагментов-доказательств (0 — не проверять)
+RELEVANCE_MIN_SCORE = float(os.getenv("RELEVANCE_MIN_SCORE", "0"))
+# Фрагменты, которые хуже лучшего больше чем на столько, отбрасываются (0 — не отбрасывать)
+RELEVANCE_MAX_GAP = float(os.getenv("RELEVANCE_MAX_GAP", "0"))
+# Сколько фрагментов должно пройти пороги, чтобы вызывать GigaChat
+RELEVANCE_MIN_EVIDENCE = int(os.getenv("RELEVANCE_MIN_EVIDENCE", "3"))
+
+
+def select(scores: Sequence[float], min_score: float, max_gap: float, min_evidence: int) -> Tuple[int, Optional[str]]:
+    """Сколько лучших фрагментов (scores отсортированы по убыванию) оставить и причина отказа, если ответ не нужен.
+
+    Причины: no_results — ничего не найдено, low_score — лучший фрагмент ниже порога,
+    insufficient_evidence — порог прошли меньше min_evidence фрагментов
+    """
+    if not scores:
+        return 0, "no_results"
+    top = scores[0]
+    if min_score > 0 and top < min_score:
+        return 0, "low_score"
+
+    floor = min_score if min_score > 0 else float("-inf")
+    if max_gap > 0:
+        floor = max(floor, top - max_gap)
+    kept = sum(1 for score in scores if score >= floor)
+
+    if kept < min_evidence:
+        return kept, "insufficient_evidence"
+    return kept, None
+
+
+def gate(fragments: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Фрагменты, на которых строится ответ, и причина, по которой GigaChat вызывать не нужно.
+
+    Отказ учитывается в метриках: llm_calls_avoided и relevance_gated_<причина>
+    """
+    # У фрагментов без оценки (старые записи кэша) сходство считаем максимальным
+    scores = [fragment.get("score", 1.0) for fragment in fragments]
+    kept, reason = select(scores, RELEVANCE_MIN_SCORE, RELEVANCE_MAX_GAP, RELEVANCE_MIN_EVIDENCE)
+    if reason:
+        metrics.inc("llm_calls_avoided")
+        metrics.inc(f"relevance_gated_{reason}")
+    return fragments[:kept], reason
@@ -1,13 +1,24 @@
 import json
+import random
+import time
 import numpy as np
-from typing import List
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 from pathlib import Path
 from datetime import datetime
 import logging
+import threading
 
-from proxy.utils.TextChunker_impl import TextChunker
-from proxy.utils.TextEncoder_impl import TextEmbedding
-from proxy.utils.MilvusSingleton_impl import MilvusSingleton
+from proxy.utils.SemanticCache_impl import SemanticCache
+from proxy.utils.ChunkStore_impl import ChunkStore
+from proxy.utils.filelock import FileLock
+from proxy.utils import metrics
+from proxy.utils.timing import phase
+from proxy.utils.tenant import normalize_tenant, tenant_partition, tenant_doc_dir
+
+# pymilvus и langchain (загрузчики PDF) импортируются фабриками get_milvus и get_text_chunker
+# при первом использовании: импорт модуля не должен тянуть тяжелые зависимости
+if TYPE_CHECKING:
+    from proxy.utils.MilvusSingleton_impl import MilvusSingleton
 
 import os
 
@@ -22,14 +33,58 @@ DOC_DIR = Path(os.getenv("DOC_DIR"))
 # Ленивая инициализация моделей - загружаются только при первом использовании
 _emb = None
 _text_docs = None
+_semantic_cache = None
+_chunk_store = None
+_emb_lock = threading.Lock()
+_store_lock = threading.Lock()
+
+# Путь к сокету общего процесса эмбеддингов (многопроцессный режим, см. EmbeddingServer_impl.py)
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET")
+EMBEDDING_SERVER_TIMEOUT_SEC = float(os.getenv("EMBEDDING_SERVER_TIMEOUT_SEC", "600"))
+
+# standalone — контейнер Milvus, memory — встроенная замена для бенчмарков (MemoryMilvus_impl.py)
+MILVUS_BACKEND = os.getenv("MILVUS_BACKEND", "standalone")
+MILVUS_HOST = os.getenv("MILVUS_HOST", "standalone")
+MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
+
+# Кэш выключен по умолчанию: на эмбеддингах e5 разные вопросы на одну тему часто близки больше чем на 0.95,
+# поэтому включать его стоит только с порогом, подобранным relevance_calibrate --cache-pairs
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "0"))
+SEMANTIC_CACHE_TTL_SEC = float(os.getenv("SEMANTIC_CACHE_TTL_SEC", "3600"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_GENERATION_TTL_SEC = float(os.getenv("SEMANTIC_CACHE_GENERATION_TTL_SEC", "1"))
+
+# Текст чанков хранится не в Milvus, а в SQLite рядом с документами (в томе, который переживает пересоздание контейнера)
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH") or str(DOC_DIR / ".chunks.sqlite3")
+CHUNK_STORE_CACHE_SIZE = int(os.getenv("CHUNK_STORE_CACHE_SIZE", "2048"))
+
+# files_chunks.json общий для всех тенантов, воркеров uvicorn и офлайн-утилит: загрузки, удаления
+# и переиндексация выполняются по очереди под блокировкой на файле рядом с ним,
+# чтобы не потерять записи и не выдать одинаковые id
+ingest_lock = FileLock("files_chunks.json.lock")
+# Следующий свободный id чанка. Счетчик только растет: id удаленных документов повторно не выдаются
+CHUNK_ID_FILE = Path("files_chunks.next_id")
+# Чанки офлайн-индексации (proxy.tools.bulk_index), уже вставленные в Milvus, но еще не перенесенные
+# в files_chunks.json: переиндексация учитывает их, чтобы они не потерялись при переключении алиаса
+BULK_SIDECAR = Path("files_chunks.bulk.jsonl")
 
 def get_embedding_model():
     """Получить модель эмбеддингов (ленивая инициализация)"""
     global _emb
     if _emb is None:
-        logger.info("Initializing embedding model (first use)")
-        _emb = TextEmbedding()
-        logger.info("Embedding model initialized successfully")
+        # Прогрев при старте и первый запрос не должны загрузить модель дважды
+        with _emb_lock:
+            if _emb is None:
+                logger.info("Initializing embedding model (first use)")
+                if EMBEDDING_SOCKET:
+                    # Модель одна на все воркеры и живет в отдельном процессе,
+                    # поэтому torch в воркере даже не импортируем
+                    from proxy.utils.RemoteEncoder_impl import RemoteTextEmbedding
+                    _emb = RemoteTextEmbedding(EMBEDDING_SOCKET, timeout=EMBEDDING_SERVER_TIMEOUT_SEC)
+                else:
+                    from proxy.utils.TextEncoder_impl import TextEmbedding
+                    _emb = TextEmbedding()
+                logger.info("Embedding model initialized successfully")
     return _emb
 
 def get_text_chunker():
@@ -37,64 +92,266 @@ def get_text_chunker():
     global _text_docs
     if _text_docs is None:
         logger.info("Initializing TextChunker (first use)")
-        _text_docs = TextChunker()
+        from proxy.utils.TextChunker_impl import TextChunker
+        # Если модель эмбеддингов уже загружена в процессе, берем её токенизатор, а не грузим второй
+        tokenizer = getattr(getattr(_emb, "embedding_model", None), "tokenizer", None)
+        _text_docs = TextChunker(tokenizer=tokenizer)
         logger.info("TextChunker initialized successfully")
     return _text_docs
 
+def get_milvus():
+    """Получить клиент векторной БД"""
+    if MILVUS_BACKEND == "memory":
+        from proxy.utils.MemoryMilvus_impl import InMemoryMilvus
+        return InMemoryMilvus()
+    from proxy.utils.MilvusSingleton_impl import MilvusSingleton
+    return MilvusSingleton(host=MILVUS_HOST, port=MILVUS_PORT)
+
+def get_semantic_cache():
+    """Получить кэш ответов по близости запросов (ленивая инициализация)"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(
+            max_size=SEMANTIC_CACHE_SIZE,
+            ttl_sec=SEMANTIC_CACHE_TTL_SEC,
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            generation_ttl_sec=SEMANTIC_CACHE_GENERATION_TTL_SEC,
+            # Поколения в SQLite рядом с текстом чанков: сброс после загрузки в одном воркере действует во всех
+            generations=get_chunk_store(),
+        )
+    return _semantic_cache
 
-def poisk(query, name_db="rag_db", collec="docs"):
-    milvus = MilvusSingleton(host="standalone", port="19530")
-    milvus.setup_database(name_db)
 
+def get_chunk_store():
+    """Получить хранилище текста чанков (ленивая инициализация)"""
+    global _chunk_store
+    if _chunk_store is None:
+        with _store_lock:
+            if _chunk_store is None:
+                _chunk_store = ChunkStore(Path(CHUNK_STORE_PATH), cache_size=CHUNK_STORE_CACHE_SIZE)
+    return _chunk_store
+
+
+def embed_query(query: str) -> List[float]:
+    """Эмбеддинг поискового запроса"""
+    emb = get_embedding_model()
+    with phase("embed"):
+        return np.asarray(emb.embedding_model.encode(query), dtype=np.float32).tolist()
+
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """Эмбеддинги нескольких запросов одним вызовом модели"""
     emb = get_embedding_model()
-    query_vec = np.asarray(emb.embedding_model.encode(query), dtype=np.float32).tolist()
-    milv_id = milvus.search_by_vector(query_vec, collec, limit=15)
+    with phase("embed"):
+        return np.asarray(emb.embedding_model.encode(list(queries)), dtype=np.float32).tolist()
+
+
+def _attach_text(results: List[dict]):
+    """Текст и источник найденных чанков одним запросом к ChunkStore на все результаты.
+    Коллекции старой схемы отдают их сами; чанки, которых нет в хранилище, из результата убираются"""
+    ids = [chunk_id for hits in results for chunk_id, text in zip(hits['id'], hits['content']) if text is None]
+    if not ids:
+        return
+    with phase("chunk_fetch"):
+        chunks = get_chunk_store().get_many(ids)
+
+    missing = 0
+    for hits in results:
+        keep = []
+        for i, chunk_id in enumerate(hits['id']):
+            if hits['content'][i] is None:
+                chunk = chunks.get(chunk_id)
+                if chunk is None:
+                    missing += 1
+                    continue
+                hits['content'][i] = chunk['content']
+                hits['source'][i] = chunk['source']
+            keep.append(i)
+        if len(keep) != len(hits['id']):
+            for key, values in hits.items():
+                hits[key] = [values[i] for i in keep]
+
+    if missing:
+        metrics.inc("chunk_store_missing", missing)
+        logger.warning("Chunks missing in chunk store", extra={"missing": missing, "path": CHUNK_STORE_PATH})
+
+
+def _to_fragments(hits) -> list:
+    return [
+        {
+            # id чанка: клиент, запросивший ?fragments=ids, получает только его и ссылку на страницу
+            "id": int(hits['id'][i]),
+            "text": hits['content'][i],
+            "source": hits['source'][i],
+            # Номер страницы для превью цитаты (GET /doc/{name}/page/{page}); None — неизвестен
+            "page": hits['page'][i] or None,
+            # Косинусное сходство с вопросом: по нему решается, стоит ли вызывать GigaChat
+            "score": round(float(hits['distance'][i]), 4),
+        }
+        for i in range(len(hits['id']))
+    ]
+
+
+def search_fragments(query_vec, name_db="rag_db", collec="docs", tenant=None):
+    """Поиск релевантных фрагментов по готовому эмбеддингу запроса"""
+    tenant = normalize_tenant(tenant)
+    partition = tenant_partition(tenant)
+
+    milvus = get_milvus()
+    milvus.setup_database(name_db)
 
-    while not milv_id['id']:
-        print("[INFO]: Milvus no results found, retrying...")
-        milv_id = milvus.search_milvus(query, collec, limit=10)
-    print("[INFO]: Search results milvus:", milv_id['id'])
+    with phase("milvus_search"):
+        milv_id = milvus.search_by_vector(query_vec, collec, limit=15, partition_names=[partition])
+    _attach_text([milv_id])
 
-    print("[INFO]: Relevant chunks found:", milv_id['id'])
+    if not milv_id['id']:
+        logger.info("Milvus no results found", extra={"tenant": tenant, "partition": partition})
+        return []
 
-    res_chunks = []
-    for i in range(len(milv_id['id'])):
-        res_chunks.append({"text": milv_id['content'][i], "source": milv_id['source'][i]})
+    res_chunks = _to_fragments(milv_id)
 
-    print("[INFO]: Promt successfully:\n", res_chunks)
+    # Текст чанков — десятки КБ на вопрос: пишем только в DEBUG и с выборкой (LOG_DEBUG_SAMPLE_RATE)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Relevant chunks found",
+            extra={"tenant": tenant, "ids": milv_id['id'], "distances": milv_id['distance'], "fragments": res_chunks}
+        )
     return res_chunks
 
 
-def parser(files: List[str]):
-    logger.info("Starting document parsing", extra={"files": files})
-    existing_records = []
-    if Path("files_chunks.json").exists():
-        raw = Path("files_chunks.json").read_text(encoding="utf-8").strip()
-        if raw:
-            try:
-                data = json.loads(raw)
-                if isinstance(data, list):
-                    existing_records = data
-                else:
-                    raise ValueError("JSON is not an array")
-            except Exception:
-                backup = Path("files_chunks.json").with_name(
-                    f"files_chunks_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                )
-                backup.write_text(raw, encoding="utf-8")
-                existing_records = []
+def search_fragments_batch(query_vecs, name_db="rag_db", collec="docs", tenant=None) -> List[list]:
+    """Поиск фрагментов сразу для нескольких запросов одним обращением к Milvus"""
+    if not query_vecs:
+        return []
+    tenant = normalize_tenant(tenant)
+    partition = tenant_partition(tenant)
+
+    milvus = get_milvus()
+    milvus.setup_database(name_db)
+
+    with phase("milvus_search"):
+        results = milvus.search_by_vectors(query_vecs, collec, limit=15, partition_names=[partition])
+    _attach_text(results)
+
+    logger.info(
+        "Batch search completed",
+        extra={"tenant": tenant, "queries": len(query_vecs), "empty": sum(1 for r in results if not r['id'])}
+    )
+    return [_to_fragments(hits) for hits in results]
+
+
+def poisk(query, name_db="rag_db", collec="docs", tenant=None):
+    return search_fragments(embed_query(query), name_db=name_db, collec=collec, tenant=tenant)
+
+
+def chunk_page(metadata: dict) -> Optional[int]:
+    """Номер страницы чанка (с 1). PDFPlumberLoader пишет в metadata['page'] номер с 0"""
+    page = metadata.get("page")
+    return int(page) + 1 if page is not None else None
+
 
-    # 2) Считаем следующий id
+def parser(files: List[str], tenant=None, name_db="rag_db", collec="docs"):
+    with ingest_lock:
+        _parse_files(files, tenant=tenant, name_db=name_db, collec=collec)
+
+
+def _read_records() -> List[dict]:
+    """Записи files_chunks.json; поврежденный файл сохраняется в резервную копию"""
+    if not Path("files_chunks.json").exists():
+        return []
+    raw = Path("files_chunks.json").read_text(encoding="utf-8").strip()
+    if not raw:
+        return []
+    try:
+        data = json.loads(raw)
+        if isinstance(data, list):
+            return data
+        raise ValueError("JSON is not an array")
+    except Exception:
+        backup = Path("files_chunks.json").with_name(
+            f"files_chunks_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        backup.write_text(raw, encoding="utf-8")
+        return []
+
+
+def _write_records(records: List[dict]):
+    tmp = Path("files_chunks.json.tmp")
+    tmp.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, "files_chunks.json")
+
+
+def read_bulk_records() -> List[dict]:
+    """Записи офлайн-индексации, еще не перенесенные в files_chunks.json"""
+    if not BULK_SIDECAR.exists():
+        return []
+    return [json.loads(line) for line in BULK_SIDECAR.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def write_bulk_records(rows: List[dict]):
+    tmp = BULK_SIDECAR.with_name(BULK_SIDECAR.name + ".tmp")
+    tmp.write_text("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows), encoding="utf-8")
+    os.replace(tmp, BULK_SIDECAR)
+
+
+def merge_bulk_records() -> int:
+    """Перенести записи офлайн-индексации в files_chunks.json одной атомарной записью файла"""
+    with ingest_lock:
+        rows = read_bulk_records()
+        if rows:
+            records = _read_records()
+            records.extend(rows)
+            _write_records(records)
+        BULK_SIDECAR.unlink(missing_ok=True)
+    return len(rows)
+
+
+def _max_record_id(records: List[dict]) -> int:
     max_id = 0
-    for item in existing_records:
+    for item in records:
         if isinstance(item, dict) and "id" in item:
             try:
                 max_id = max(max_id, int(item["id"]))
             except Exception:
                 pass
-    next_id = max_id + 1
+    return max_id
+
+
+def allocate_chunk_ids(count: int, records: Optional[List[dict]] = None) -> int:
+    """Выделить count новых id чанков и вернуть первый. Вызывается под ingest_lock.
+
+    Счетчик сохраняется до вставки чанков, поэтому id не повторяются ни между воркерами,
+    ни после удаления документов или падения процесса. records (уже прочитанный
+    files_chunks.json) защищают от id, выданных в обход счетчика. Если счетчика нет
+    (первый запуск после обновления или файл потерян), он начинается после наибольшего
+    id из files_chunks.json, офлайн-индексации и ChunkStore — там остаются и чанки,
+    пропавшие из files_chunks.json"""
+    next_id = 0
+    if CHUNK_ID_FILE.exists():
+        raw = CHUNK_ID_FILE.read_text(encoding="utf-8").strip()
+        next_id = int(raw) if raw else 0
+    if not next_id or records is not None:
+        records = _read_records() if records is None else records
+        next_id = max(
+            next_id,
+            _max_record_id(records) + 1,
+            _max_record_id(read_bulk_records()) + 1,
+            get_chunk_store().max_id() + 1,
+        )
+
+    tmp = CHUNK_ID_FILE.with_name(CHUNK_ID_FILE.name + ".tmp")
+    tmp.write_text(str(next_id + count), encoding="utf-8")
+    os.replace(tmp, CHUNK_ID_FILE)
+    return next_id
+
 
-    # 3) Генерируем новые записи и добавляем
+def _parse_files(files: List[str], tenant=None, name_db="rag_db", collec="docs"):
+    tenant = normalize_tenant(tenant)
+    doc_dir = tenant_doc_dir(DOC_DIR, tenant)
+    logger.info("Starting document parsing", extra={"files": files, "tenant": tenant})
+    existing_records = _read_records()
+
+    # 2) Генерируем новые записи (id выделяются после разбора всех файлов)
     new_records = []
 
     logger.info("Loading models for parsing")
@@ -103,7 +360,7 @@ def parser(files: List[str]):
     logger.info("Models loaded, starting document processing")
     
     for file_name in files:
-        file_path = DOC_DIR / file_name
+        file_path = doc_dir / file_name
         logger.info("Processing file", extra={"file_name": file_name, "file_path": str(file_path)})
 
         docs = text_docs.load_pdf_documents(file_path)
@@ -134,21 +391,25 @@ def parser(files: List[str]):
 
             new_records.append(
                 {
-                    "id": next_id,
+                    "id": None,
                     "source": chunk.metadata.get("source", str(file_name)),
                     "embeddings": vec,
                     "content": chunk.page_content,
+                    "page": chunk_page(chunk.metadata),
+                    "token_count": chunk.metadata.get("token_count"),
+                    "tenant": tenant,
                 }
             )
-            next_id += 1
 
+    # 3) Выделяем id из общего счетчика
+    if new_records:
+        first_id = allocate_chunk_ids(len(new_records), existing_records)
+        for offset, record in enumerate(new_records):
+            record["id"] = first_id + offset
     existing_records.extend(new_records)
 
     # 4) Сохраняем обратно (валидный JSON-массив)
-    Path("files_chunks.json").write_text(
-        json.dumps(existing_records, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    _write_records(existing_records)
 
     logger.info(
         "Chunks added to JSON",
@@ -158,70 +419,467 @@ def parser(files: List[str]):
         }
     )
 
-    logger.info("Starting Milvus data push")
-    push_milv()
-    logger.info("Document parsing completed successfully", extra={"files": files})
+    # Вставляем только новые чанки в партицию тенанта: коллекцию не пересоздаем,
+    # поэтому поиск у остальных тенантов во время загрузки не прерывается
+    logger.info("Starting Milvus data push", extra={"tenant": tenant})
+    insert_records(new_records, name_db=name_db, collec=collec)
+    # Закэшированные ответы могли устареть после появления новых документов
+    get_semantic_cache().invalidate(tenant)
+    logger.info("Document parsing completed successfully", extra={"files": files, "tenant": tenant})
 
 
-def push_milv(name_db="rag_db", collec="docs"):
-    json_path = Path("files_chunks.json")
-    
-    if not json_path.exists():
-        logger.warning("files_chunks.json not found, skipping Milvus push")
-        return
-    
-    rows = json.loads(json_path.read_text(encoding="utf-8"))
-    
-    if not rows or len(rows) == 0:
-        logger.warning("No data in files_chunks.json to push to Milvus")
-        return
+############################################################## Удаление и замена документов
+# Чанки документа удаляются из Milvus по первичному ключу, из ChunkStore и из files_chunks.json
+# (иначе следующая переиндексация вернула бы их). Место удаленных строк Milvus освобождает
+# при сжатии сегментов, которое запускается в фоне не чаще раза в COMPACTION_DELAY_SEC.
 
-    milvus = MilvusSingleton(host="standalone", port="19530")
-    milvus.setup_database(name_db)
+COMPACTION_DELAY_SEC = float(os.getenv("COMPACTION_DELAY_SEC", "300"))
+# Сколько id в одном выражении удаления
+DELETE_BATCH_IDS = 1000
 
-    DIM = int(np.asarray(rows[0]["embeddings"]).size)
-    milvus.create_collection(collec, size_vec=DIM, drop_if_exists=True)
+_compaction_lock = threading.Lock()
+_compaction_timer: Optional[threading.Timer] = None
 
-    max_bytes = 40 * 1024 * 1024
 
-    ids, sources, embs, contents = [], [], [], []
-    batch_bytes = 0
-    total = 0
+def _is_document_row(record: dict, tenant: str, doc_name: str) -> bool:
+    return (
+        normalize_tenant(record.get("tenant")) == tenant
+        and Path(str(record.get("source", ""))).name == doc_name
+    )
 
-    def send():
-        nonlocal ids, sources, embs, contents, batch_bytes, total
-        if not ids:
+
+def _delete_chunks(milvus: "MilvusSingleton", collec: str, partition: str, ids: List[int]):
+    for i in range(0, len(ids), DELETE_BATCH_IDS):
+        part = ids[i:i + DELETE_BATCH_IDS]
+        milvus.delete_by_expr(collec, f"id in [{', '.join(str(pk) for pk in part)}]", partition_name=partition)
+    get_chunk_store().delete_ids(ids)
+
+
+def _remove_document_chunks(ids: List[int], tenant: str, name_db: str, collec: str) -> int:
+    """Удалить чанки с этими id из Milvus, ChunkStore и files_chunks.json"""
+    if not ids:
+        return 0
+    milvus = get_milvus()
+    milvus.setup_database(name_db)
+    if milvus.has_partition(collec, tenant_partition(tenant)):
+        _delete_chunks(milvus, collec, tenant_partition(tenant), ids)
+    else:
+        get_chunk_store().delete_ids(ids)
+
+    removed = set(ids)
+    records = _read_records()
+    _write_records([r for r in records if int(r.get("id", -1)) not in removed])
+    if BULK_SIDECAR.exists():
+        # Документ мог прийти из офлайн-индексации, которая еще не перенесла записи в files_chunks.json
+        write_bulk_records([r for r in read_bulk_records() if int(r.get("id", -1)) not in removed])
+
+    get_semantic_cache().invalidate(tenant)
+    metrics.inc("chunks_deleted", len(ids))
+    schedule_compaction(name_db, collec)
+    return len(ids)
+
+
+def _document_ids(doc_name: str, tenant: str) -> List[int]:
+    ids = {int(r["id"]) for r in _read_records() + read_bulk_records() if _is_document_row(r, tenant, doc_name)}
+    # Чанки, которых уже нет в files_chunks.json (например, после ручной правки), находим по ChunkStore
+    ids.update(get_chunk_store().document_ids(tenant, doc_name))
+    return sorted(ids)
+
+
+def is_document_indexed(doc_name: str, tenant=None) -> bool:
+    """Есть ли в индексе чанки документа тенанта (файла документа при этом может уже не быть)"""
+    return bool(_document_ids(doc_name, normalize_tenant(tenant)))
+
+
+def delete_document(doc_name: str, tenant=None, name_db="rag_db", collec="docs", remove_file=False) -> int:
+    """Удалить все чанки документа тенанта. Возвращает число удаленных чанков.
+
+    remove_file: удалить и PDF, но только после чанков. Если удаление чанков не удалось,
+    файл остается, и повторный DELETE доводит дело до конца"""
+    tenant = normalize_tenant(tenant)
+    with ingest_lock:
+        deleted = _remove_document_chunks(_document_ids(doc_name, tenant), tenant, name_db, collec)
+        if remove_file:
+            (tenant_doc_dir(DOC_DIR, tenant) / doc_name).unlink(missing_ok=True)
+    logger.info("Document deleted", extra={"doc_name": doc_name, "tenant": tenant, "chunks": deleted})
+    return deleted
+
+
+def replace_document(doc_name: str, tenant=None, name_db="rag_db", collec="docs") -> int:
+    """Переиндексировать документ после замены файла: сначала добавляются новые чанки,
+    затем удаляются старые, так что поиск не остается без документа. Возвращает число удаленных чанков"""
+    tenant = normalize_tenant(tenant)
+    with ingest_lock:
+        old_ids = _document_ids(doc_name, tenant)
+        _parse_files([doc_name], tenant=tenant, name_db=name_db, collec=collec)
+        deleted = _remove_document_chunks(old_ids, tenant, name_db, collec)
+    logger.info("Document replaced", extra={"doc_name": doc_name, "tenant": tenant, "old_chunks": deleted})
+    return deleted
+
+
+def schedule_compaction(name_db="rag_db", collec="docs"):
+    """Отложенное сжатие сегментов: несколько удалений подряд приводят к одному compact"""
+    global _compaction_timer
+    with _compaction_lock:
+        if _compaction_timer is not None:
             return
-        milvus.insert_data(
-            collec,
-            {"id": ids, "source": sources, "embeddings": embs, "content": contents},
-            flush=False
-        )
-        total += len(ids)
-        ids, sources, embs, contents = [], [], [], []
-        batch_bytes = 0
+        _compaction_timer = threading.Timer(COMPACTION_DELAY_SEC, _run_compaction, args=(name_db, collec))
+        _compaction_timer.daemon = True
+        _compaction_timer.start()
+
+
+def _run_compaction(name_db: str, collec: str):
+    global _compaction_timer
+    with _compaction_lock:
+        _compaction_timer = None
+    try:
+        milvus = get_milvus()
+        milvus.setup_database(name_db)
+        compaction_id = milvus.compact(collec)
+        metrics.inc("compactions")
+        logger.info("Compaction started", extra={"collection": collec, "compaction_id": compaction_id})
+    except Exception as e:
+        logger.error("Compaction failed", extra={"collection": collec, "error": str(e)}, exc_info=True)
+
+
+def _insert_rows(milvus: "MilvusSingleton", collec: str, rows: List[dict]) -> int:
+    """Вставить строки в коллекцию батчами (не более ~40 MB), раскладывая их по партициям тенантов"""
+    max_bytes = 40 * 1024 * 1024
+    total = 0
 
+    by_partition = {}
     for r in rows:
-        src = str(r.get("source", ""))
-        txt = str(r.get("content", ""))
+        by_partition.setdefault(tenant_partition(r.get("tenant")), []).append(r)
+
+    # Текст пишем раньше векторов: найденный в Milvus id всегда есть в хранилище
+    get_chunk_store().put_many(
+        {**r, "tenant": normalize_tenant(r.get("tenant"))} for r in rows
+    )
+
+    for partition, partition_rows in by_partition.items():
+        milvus.create_partition(collec, partition)
+
+        ids, sources, embs, contents, pages, token_counts = [], [], [], [], [], []
+        batch_bytes = 0
+
+        def send():
+            nonlocal ids, sources, embs, contents, pages, token_counts, batch_bytes, total
+            if not ids:
+                return
+            milvus.insert_data(
+                collec,
+                {"id": ids, "source": sources, "embeddings": embs, "content": contents,
+                 "page": pages, "token_count": token_counts},
+                flush=False,
+                partition_name=partition,
+            )
+            total += len(ids)
+            ids, sources, embs, contents, pages, token_counts = [], [], [], [], [], []
+            batch_bytes = 0
+
+        for r in partition_rows:
+            src = str(r.get("source", ""))
+            txt = str(r.get("content", ""))
+
+            emb = np.asarray(r["embeddings"], dtype=np.float32).reshape(-1).tolist()
+
+            row_bytes = (len(emb) * 4) + len(src.encode("utf-8")) + len(txt.encode("utf-8")) + 256
+
+            if ids and (batch_bytes + row_bytes > max_bytes):
+                send()
+
+            ids.append(int(r["id"]))
+            sources.append(src)
+            embs.append(emb)
+            contents.append(txt)
+            pages.append(int(r.get("page") or 0))
+            token_counts.append(int(r.get("token_count") or 0))
+            batch_bytes += row_bytes
 
-        emb = np.asarray(r["embeddings"], dtype=np.float32).reshape(-1).tolist()
+        send()
 
-        row_bytes = (len(emb) * 4) + len(src.encode("utf-8")) + len(txt.encode("utf-8")) + 256
+    return total
+
+
+def _ensure_live_collection(milvus: "MilvusSingleton", collec: str, dim: int):
+    """Убедиться, что `collec` (алиас или обычная коллекция) существует.
+    В новой инсталляции сразу создается версионная коллекция с алиасом."""
+    if milvus.get_alias_target(collec) is not None or milvus.is_plain_collection(collec):
+        milvus.create_collection(collec, size_vec=dim, drop_if_exists=False)
+        return
 
-        if ids and (batch_bytes + row_bytes > max_bytes):
-            send()
+    version = _new_version_name(collec)
+    milvus.create_collection(version, size_vec=dim, drop_if_exists=False)
+    milvus.switch_alias(collec, version)
+
+
+def insert_records(rows: List[dict], name_db="rag_db", collec="docs") -> int:
+    """Дописать новые записи в существующую коллекцию (создается, если её нет)"""
+    if not rows:
+        logger.warning("No new records to push to Milvus")
+        return 0
+
+    milvus = get_milvus()
+    milvus.setup_database(name_db)
 
-        ids.append(int(r["id"]))
-        sources.append(src)
-        embs.append(emb)
-        contents.append(txt)
-        batch_bytes += row_bytes
+    DIM = int(np.asarray(rows[0]["embeddings"]).size)
+    _ensure_live_collection(milvus, collec, DIM)
 
-    send()
+    total = _insert_rows(milvus, collec, rows)
 
     col = milvus.get_collection(collec)
     col.flush()
     col.load()
 
     return total
+
+
+def _load_rows(tenant=None) -> List[dict]:
+    rows = _read_records() + read_bulk_records()
+
+    if tenant is not None:
+        tenant = normalize_tenant(tenant)
+        rows = [r for r in rows if normalize_tenant(r.get("tenant")) == tenant]
+
+    if not rows:
+        logger.warning("No data in files_chunks.json to push to Milvus", extra={"tenant": tenant})
+    return rows
+
+
+def push_milv(name_db="rag_db", collec="docs", tenant=None):
+    """Полная перезаливка данных из files_chunks.json.
+
+    Без `tenant` выполняется blue/green переиндексация (см. `reindex`), живая
+    коллекция не удаляется. С `tenant` пересобирается только партиция этого
+    тенанта, данные и поиск остальных тенантов не затрагиваются.
+
+    Партиция тенанта удаляется и заполняется заново, поэтому пока идет вставка,
+    поиск этого тенанта возвращает пустой результат. Без простоя пересобирается
+    только вся коллекция (`reindex`).
+    """
+    if tenant is None:
+        return reindex(name_db=name_db, collec=collec)
+
+    tenant = normalize_tenant(tenant)
+    # Загрузки тенанта ждут: иначе их чанки попали бы в удаляемую партицию или
+    # files_chunks.json был бы прочитан без них
+    with ingest_lock:
+        rows = _load_rows(tenant)
+        if not rows:
+            return
+
+        milvus = get_milvus()
+        milvus.setup_database(name_db)
+
+        DIM = int(np.asarray(rows[0]["embeddings"]).size)
+        _ensure_live_collection(milvus, collec, DIM)
+        logger.warning("Rebuilding tenant partition, search is empty until it completes",
+                       extra={"tenant": tenant, "rows": len(rows)})
+        milvus.delete_partition(collec, tenant_partition(tenant))
+
+        total = _insert_rows(milvus, collec, rows)
+
+        col = milvus.get_collection(collec)
+        col.flush()
+        col.load()
+        get_semantic_cache().invalidate(tenant)
+
+    return total
+
+
+############################################################## Blue/green переиндексация
+# Поиск всегда идет через алиас `collec`, который указывает на одну из версий
+# '<collec>_v<timestamp>'. Новая версия строится рядом с живой, проверяется
+# и только после этого алиас атомарно переключается на неё.
+
+REINDEX_KEEP_VERSIONS = int(os.getenv("REINDEX_KEEP_VERSIONS", "2"))
+REINDEX_SAMPLE_SIZE = int(os.getenv("REINDEX_SAMPLE_SIZE", "20"))
+REINDEX_MIN_SELF_HIT = float(os.getenv("REINDEX_MIN_SELF_HIT", "0.95"))
+
+# Отдельная блокировка на файле: повторный запуск в любом воркере сразу получает отказ
+_reindex_lock = FileLock("files_chunks.reindex.lock")
+_reindex_state = {"status": "idle"}
+
+
+def _new_version_name(collec: str) -> str:
+    return f"{collec}_v{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+
+def get_reindex_state() -> dict:
+    return dict(_reindex_state)
+
+
+def is_reindex_running() -> bool:
+    """Идет ли переиндексация в каком-либо воркере (состояние _reindex_state — только этого воркера)"""
+    if not _reindex_lock.acquire(blocking=False):
+        return True
+    _reindex_lock.release()
+    return False
+
+
+def _sample_pairs(sample_queries: Optional[List[Union[str, Tuple[str, str]]]]) -> List[Tuple[str, str]]:
+    """Контрольные запросы как пары (тенант, запрос); строка — запрос тенанта по умолчанию"""
+    return [
+        (normalize_tenant(None), item) if isinstance(item, str) else (normalize_tenant(item[0]), item[1])
+        for item in sample_queries or []
+    ]
+
+
+def _validate_version(milvus: "MilvusSingleton", version: str, rows: List[dict],
+                      sample_queries: Optional[List[Union[str, Tuple[str, str]]]]):
+    """Проверить новую версию: число строк и выборку поисковых запросов. Бросает RuntimeError."""
+    col = milvus.get_collection(version)
+    if col.num_entities != len(rows):
+        raise RuntimeError(f"Row count mismatch in '{version}': {col.num_entities} != {len(rows)}")
+
+    # Каждый вектор из выборки должен находить сам себя (или точный дубликат)
+    sample = random.sample(rows, min(REINDEX_SAMPLE_SIZE, len(rows)))
+    hits = 0
+    for r in sample:
+        found = milvus.search_by_vector(
+            r["embeddings"], version, limit=1, partition_names=[tenant_partition(r.get("tenant"))]
+        )
+        if found["id"] and (found["id"][0] == int(r["id"]) or found["distance"][0] >= 0.999):
+            hits += 1
+    hit_rate = hits / len(sample) if sample else 1.0
+    if hit_rate < REINDEX_MIN_SELF_HIT:
+        raise RuntimeError(f"Self-retrieval check failed in '{version}': hit rate {hit_rate:.2f}")
+
+    # Контрольные текстовые запросы должны возвращать хоть что-то в партиции своего тенанта,
+    # как при поиске /q: данные другого тенанта проверку не проходят
+    samples = _sample_pairs(sample_queries)
+    for tenant, query in samples:
+        found = milvus.search_by_vector(embed_query(query), version, limit=1, partition_names=[tenant_partition(tenant)])
+        if not found["id"]:
+            raise RuntimeError(f"Sample query returned no results for tenant '{tenant}' in '{version}': {query!r}")
+
+    return {"rows": len(rows), "self_hit_rate": round(hit_rate, 3), "sample_queries": len(samples)}
+
+
+def _drop_old_versions(milvus: "MilvusSingleton", collec: str, live: str):
+    versions = milvus.list_versions(collec)
+    keep = set(versions[-REINDEX_KEEP_VERSIONS:]) | {live}
+    for version in versions:
+        if version not in keep:
+            milvus.delete_collection(version)
+
+
+def reindex(name_db="rag_db", collec="docs", sample_queries: Optional[List[Union[str, Tuple[str, str]]]] = None):
+    """Построить новую версию коллекции из files_chunks.json, проверить её
+    и атомарно переключить на неё алиас `collec`. Предыдущая версия сохраняется для отката.
+    Контрольные запросы — строки (тенант по умолчанию) или пары (тенант, запрос)"""
+    if not _reindex_lock.acquire(blocking=False):
+        raise RuntimeError("Reindex is already running")
+    started = time.time()
+    try:
+        # Пока идет переиндексация, новые загрузки ждут: иначе их чанки попали бы
+        # только в старую версию и потерялись после переключения
+        with ingest_lock:
+            _reindex_state.clear()
+            _reindex_state.update({"status": "building", "started_at": datetime.now().isoformat()})
+
+            rows = _load_rows()
+            if not rows:
+                _reindex_state.update({"status": "idle"})
+                return 0
+
+            milvus = get_milvus()
+            milvus.setup_database(name_db)
+
+            DIM = int(np.asarray(rows[0]["embeddings"]).size)
+            version = _new_version_name(collec)
+            _reindex_state["version"] = version
+            logger.info("Building new collection version", extra={"version": version, "rows": len(rows)})
+
+            try:
+                milvus.create_collection(version, size_vec=DIM, drop_if_exists=True)
+                total = _insert_rows(milvus, version, rows)
+                col = milvus.get_collection(version)
+                col.flush()
+                col.load()
+
+                _reindex_state["status"] = "validating"
+                validation = _validate_version(milvus, version, rows, sample_queries)
+            except Exception:
+                # Недостроенную версию удаляем, живая коллекция остается нетронутой
+                milvus.delete_collection(version)
+                raise
+
+            previous = milvus.get_alias_target(collec)
+            if previous is None and milvus.is_plain_collection(collec):
+                # Однократная миграция со старой схемы: имя алиаса занято обычной коллекцией
+                logger.warning("Migrating plain collection to alias", extra={"collection": collec})
+                milvus.delete_collection(collec)
+            milvus.switch_alias(collec, version)
+            _drop_old_versions(milvus, collec, version)
+            get_semantic_cache().invalidate()
+
+            duration = time.time() - started
+            _reindex_state.update({
+                "status": "done",
+                "previous": previous,
+                "validation": validation,
+                "duration_sec": round(duration, 3),
+            })
+            logger.info(
+                "Reindex completed, alias switched",
+                extra={"version": version, "previous": previous, "rows": total, "duration_sec": round(duration, 3)}
+            )
+            return total
+    except Exception as e:
+        _reindex_state.update({"status": "failed", "error": str(e)})
+        logger.error("Reindex failed", extra={"error": str(e)}, exc_info=True)
+        raise
+    finally:
+        _reindex_lock.release()
+
+
+def rollback(name_db="rag_db", collec="docs") -> dict:
+    """Переключить алиас `collec` на предыдущую сохраненную версию.
+
+    Прежняя версия построена до последних загрузок и удалений. Перед переключением
+    она сверяется с files_chunks.json: недостающие чанки дописываются, удаленные
+    с тех пор — удаляются. Иначе документы, загруженные после переключения, пропали бы
+    из поиска, хотя /doc их отдает. Бросает RuntimeError, если откатываться некуда
+    или идет переиндексация"""
+    if not _reindex_lock.acquire(blocking=False):
+        raise RuntimeError("Reindex is running, rollback is not possible")
+    try:
+        # Загрузки ждут: их чанки должны попасть в ту версию, на которую указывает алиас
+        with ingest_lock:
+            milvus = get_milvus()
+            milvus.setup_database(name_db)
+
+            live = milvus.get_alias_target(collec)
+            older = [v for v in milvus.list_versions(collec) if live is None or v < live]
+            if not older:
+                raise RuntimeError(f"No previous version of '{collec}' to roll back to")
+
+            target = older[-1]
+            milvus.create_index_load(target)
+
+            rows = _load_rows()
+            present = milvus.list_ids(target)
+            current = {int(r["id"]) for r in rows}
+            missing = [r for r in rows if int(r["id"]) not in present]
+            stale = sorted(present - current)
+            if missing:
+                _insert_rows(milvus, target, missing)
+            for i in range(0, len(stale), DELETE_BATCH_IDS):
+                part = stale[i:i + DELETE_BATCH_IDS]
+                milvus.delete_by_expr(target, f"id in [{', '.join(str(pk) for pk in part)}]")
+            if missing or stale:
+                col = milvus.get_collection(target)
+                col.flush()
+                col.load()
+
+            milvus.switch_alias(collec, target)
+            get_semantic_cache().invalidate()
+    finally:
+        _reindex_lock.release()
+
+    logger.info(
+        "Rolled back collection alias",
+        extra={"collection": collec, "from": live, "to": target, "reinserted": len(missing), "removed": len(stale)}
+    )
+    return {"version": target, "previous": live, "reinserted": len(missing), "removed": len(stale)}
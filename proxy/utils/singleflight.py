@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from proxy.utils import metrics
+from proxy.utils.timing import phase
+
+logger = logging.getLogger(__name__)
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Ключ вопроса для объединения: регистр, пробелы и знаки в конце не различаются"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return _SPACES_RE.sub(" ", query).strip().rstrip("?!. ")
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вызовов: первый вызов выполняет работу,
+    остальные с тем же ключом ждут его результат (или его исключение).
+
+    Работа выполняется отдельной задачей, поэтому отключение первого клиента
+    не отменяет её для остальных.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            metrics.inc(f"{self.name}_coalesced")
+            logger.info("Joined in-flight request", extra={"singleflight": self.name})
+            with phase("coalesced"):
+                return await asyncio.shield(future)
+
+        task = asyncio.ensure_future(func())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        metrics.inc(f"{self.name}_leaders")
+        return await asyncio.shield(task)
+
+    def joinable(self, key: Hashable) -> bool:
+        """Есть ли выполняющийся вызов с этим ключом. Между проверкой и do() не должно быть await,
+        иначе вызов может успеть завершиться"""
+        return key in self._inflight
+
+    def inflight(self) -> int:
+        return len(self._inflight)
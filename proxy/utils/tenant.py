@@ -0,0 +1,44 @@
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Заголовок, по которому определяется тенант (авиакомпания-клиент)
+TENANT_HEADER = "X-Tenant-ID"
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+
+# Имя тенанта используется в имени партиции Milvus и в пути к документам,
+# поэтому допускаем только латиницу, цифры и подчеркивание
+_TENANT_RE = re.compile(r"^[a-z0-9_]{1,64}$")
+
+
+def normalize_tenant(tenant: Optional[str]) -> str:
+    """Привести идентификатор тенанта к каноническому виду (ValueError, если он некорректен)"""
+    if tenant is None or not tenant.strip():
+        return DEFAULT_TENANT
+
+    tenant = tenant.strip().lower()
+    if not _TENANT_RE.match(tenant):
+        raise ValueError(f"Invalid tenant id: {tenant!r}")
+    return tenant
+
+
+def tenant_partition(tenant: Optional[str]) -> str:
+    """Имя партиции Milvus для тенанта. Тенант по умолчанию живет в партиции `_default`,
+    куда попадали все документы до появления мультитенантности."""
+    tenant = normalize_tenant(tenant)
+    if tenant == DEFAULT_TENANT:
+        return "_default"
+    return f"tenant_{tenant}"
+
+
+def tenant_doc_dir(base_dir: Path, tenant: Optional[str]) -> Path:
+    """Директория с PDF файлами тенанта"""
+    tenant = normalize_tenant(tenant)
+    if tenant == DEFAULT_TENANT:
+        return base_dir
+    return base_dir / tenant
@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Длительности фаз текущего запроса (embed, milvus_search, llm, ...), секунды.
+# Словарь создается middleware на каждый запрос и разделяется между задачами/потоками запроса.
+_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_phases", default=None)
+# Спаны текущего запроса для трассировки медленных запросов: [имя, начало (perf_counter),
+# длительность или None, пока фаза не закончилась, индекс родителя или -1]
+_spans: ContextVar[Optional[List[list]]] = ContextVar("request_spans", default=None)
+_parent: ContextVar[int] = ContextVar("span_parent", default=-1)
+
+# Потоковые ответы дают спан compress на каждую часть: дальше этого числа спаны не пишутся,
+# длительности по-прежнему суммируются в фазы
+MAX_SPANS = 256
+
+
+def start_request() -> Dict[str, float]:
+    phases: Dict[str, float] = {}
+    _phases.set(phases)
+    _spans.set([])
+    return phases
+
+
+def get_phases() -> Dict[str, float]:
+    return _phases.get() or {}
+
+
+def get_spans() -> List[list]:
+    spans = _spans.get()
+    return [] if spans is None else spans
+
+
+@contextmanager
+def phase(name: str):
+    """Замер фазы запроса; вне запроса (CLI, фоновые задачи) ничего не делает"""
+    phases = _phases.get()
+    if phases is None:
+        yield
+        return
+    spans = _spans.get()
+    started = time.perf_counter()
+    span = None
+    token = None
+    if spans is not None and len(spans) < MAX_SPANS:
+        # Вложенные фазы (milvus_load внутри milvus_search) становятся дочерними спанами
+        span = [name, started, None, _parent.get()]
+        token = _parent.set(len(spans))
+        spans.append(span)
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        phases[name] = phases.get(name, 0.0) + duration
+        if span is not None:
+            span[2] = duration
+            _parent.reset(token)
+
+
+def span_tree(spans: List[list], started: float) -> List[Dict[str, Any]]:
+    """Дерево спанов запроса: смещение от начала запроса и длительность в миллисекундах.
+    duration_ms = None — фаза не закончилась к концу запроса (например, GigaChat после дедлайна)"""
+    nodes: List[Dict[str, Any]] = []
+    roots: List[Dict[str, Any]] = []
+    for name, span_started, duration, parent in list(spans):
+        node = {
+            "name": name,
+            "start_ms": round((span_started - started) * 1000, 2),
+            "duration_ms": None if duration is None else round(duration * 1000, 2),
+            "children": [],
+        }
+        nodes.append(node)
+        # Родитель всегда добавлен раньше ребенка
+        (nodes[parent]["children"] if 0 <= parent < len(nodes) - 1 else roots).append(node)
+    return roots
+
+
+def server_timing(phases: Dict[str, float]) -> str:
+    """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+    return ", ".join(f"{name};dur={duration * 1000:.1f}" for name, duration in phases.items())
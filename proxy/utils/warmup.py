@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Время старта процесса: от него считаем, за сколько сервис стал готов
+PROCESS_STARTED = time.time()
+
+WARMUP_MILVUS_TIMEOUT_SEC = float(os.getenv("WARMUP_MILVUS_TIMEOUT_SEC", "600"))
+WARMUP_MILVUS_RETRY_SEC = float(os.getenv("WARMUP_MILVUS_RETRY_SEC", "5"))
+
+_lock = threading.Lock()
+_phases: Dict[str, Dict[str, Any]] = {
+    "milvus": {"status": "pending"},
+    "embedding_model": {"status": "pending"},
+}
+_ready_at = None
+_started = False
+
+
+def _set_phase(name: str, **fields):
+    with _lock:
+        _phases[name].update(fields)
+
+
+def _run_phase(name: str, func):
+    started = time.time()
+    _set_phase(name, status="loading", started_at=started)
+    try:
+        func()
+    except Exception as e:
+        _set_phase(name, status="failed", error=str(e), duration_sec=round(time.time() - started, 3))
+        logger.error("Warm-up phase failed", extra={"phase": name, "error": str(e)}, exc_info=True)
+        return
+
+    duration = time.time() - started
+    _set_phase(name, status="ready", duration_sec=round(duration, 3))
+    logger.info("Warm-up phase completed", extra={"phase": name, "duration_sec": round(duration, 3)})
+    _check_ready()
+
+
+def _check_ready():
+    global _ready_at
+    with _lock:
+        if _ready_at is not None or any(p["status"] != "ready" for p in _phases.values()):
+            return
+        _ready_at = time.time()
+    logger.info("Service ready", extra={"startup_sec": round(_ready_at - PROCESS_STARTED, 3)})
+
+
+def _warm_milvus(name_db: str, collec: str):
+    from proxy.utils.search import get_milvus
+
+    # Milvus может подниматься дольше приложения — переподключаемся, пока не истечет таймаут
+    deadline = time.time() + WARMUP_MILVUS_TIMEOUT_SEC
+    while True:
+        try:
+            milvus = get_milvus()
+            milvus.setup_database(name_db)
+            break
+        except Exception as e:
+            if time.time() >= deadline:
+                raise
+            _set_phase("milvus", last_error=str(e))
+            time.sleep(WARMUP_MILVUS_RETRY_SEC)
+
+    # Загружаем коллекцию в память заранее, чтобы первый поиск не ждал load()
+    if milvus.get_alias_target(collec) is not None or milvus.is_plain_collection(collec):
+        milvus.create_index_load(collec)
+
+
+def _warm_embedding_model():
+    from proxy.utils.search import get_embedding_model
+
+    emb = get_embedding_model()
+    # Пробный прогон, чтобы первый запрос не платил за инициализацию ядер
+    emb.embedding_model.encode("warm-up")
+
+
+def start_warmup(name_db: str = "rag_db", collec: str = "docs"):
+    """Запустить в фоне подключение к Milvus и загрузку модели эмбеддингов"""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    logger.info("Starting background warm-up")
+    threading.Thread(
+        target=_run_phase, args=("milvus", lambda: _warm_milvus(name_db, collec)), daemon=True
+    ).start()
+    threading.Thread(
+        target=_run_phase, args=("embedding_model", _warm_embedding_model), daemon=True
+    ).start()
+
+
+def is_ready() -> bool:
+    with _lock:
+        return _ready_at is not None
+
+
+def readiness() -> Dict[str, Any]:
+    now = time.time()
+    with _lock:
+        phases = {}
+        for name, phase in _phases.items():
+            info = {k: v for k, v in phase.items() if k != "started_at"}
+            if phase["status"] == "loading":
+                info["elapsed_sec"] = round(now - phase["started_at"], 1)
+            phases[name] = info
+        ready_at = _ready_at
+
+    result = {
+        "status": "ready" if ready_at is not None else "starting",
+        "process_started_at": datetime.fromtimestamp(PROCESS_STARTED).isoformat(),
+        "uptime_sec": round(now - PROCESS_STARTED, 1),
+        "phases": phases,
+    }
+    if ready_at is not None:
+        result["startup_sec"] = round(ready_at - PROCESS_STARTED, 3)
+    elif any(p["status"] == "failed" for p in phases.values()):
+        result["status"] = "failed"
+    return result
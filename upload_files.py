@@ -1,20 +1,35 @@
 #!/usr/bin/env python3
 """
 Скрипт для загрузки всех PDF файлов из папки td в контейнер через API /upload
+
+Файлы отправляются параллельными батчами ограниченного размера. Состояние
+каждого файла (хэш, статус, число попыток) хранится в локальном манифесте,
+поэтому повторный запуск пропускает уже загруженные файлы и догружает остальные.
 """
 import os
 import sys
+import json
+import hashlib
 import argparse
+import threading
 from pathlib import Path
 import requests
-from typing import List
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 import time
 
 # Конфигурация по умолчанию
 DEFAULT_API_URL = "http://127.0.0.1:10000/api/v1/chat/upload"
 DEFAULT_FOLDER_PATH = Path("td")
+MANIFEST_NAME = ".upload_manifest.json"
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 TIMEOUT = 300  # 5 минут на загрузку одного файла
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_FILES = 10
+DEFAULT_BATCH_MB = 100
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 2.0  # секунды, удваивается с каждой попыткой
 
 
 def get_pdf_files(folder: Path) -> List[Path]:
@@ -22,84 +37,274 @@ def get_pdf_files(folder: Path) -> List[Path]:
     if not folder.exists():
         print(f"❌ Папка {folder} не существует!")
         return []
-    
-    pdf_files = list(folder.glob("*.pdf"))
+
+    pdf_files = sorted(folder.glob("*.pdf"))
     print(f"📁 Найдено {len(pdf_files)} PDF файлов в папке {folder}")
     return pdf_files
 
 
-def upload_files(file_paths: List[Path], api_url: str) -> tuple[int, int, int]:
-    """Загрузить все файлы одним запросом через API"""
-    # Фильтруем файлы по размеру
+def file_sha256(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Локальный манифест загрузки: имя файла -> хэш, размер, статус, попытки"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if path.exists():
+            try:
+                self.entries = json.loads(path.read_text(encoding="utf-8"))
+            except Exception:
+                print(f"⚠️  Манифест {path} поврежден, начинаем заново")
+
+    def describe(self, file_path: Path) -> dict:
+        """Запись о файле с актуальным хэшем (хэш пересчитывается, только если файл изменился)"""
+        stat = file_path.stat()
+        entry = self.entries.get(file_path.name, {})
+        if entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime:
+            sha256 = file_sha256(file_path)
+            changed = entry.get("sha256") != sha256
+            entry = {**entry, "sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime}
+            if changed:
+                # Содержимое изменилось — прежний статус больше не действует
+                entry.update(state="pending", attempts=0, error=None)
+            with self._lock:
+                self.entries[file_path.name] = entry
+        return entry
+
+    def add_attempt(self, names: List[str]):
+        with self._lock:
+            for name in names:
+                entry = self.entries.setdefault(name, {})
+                entry["attempts"] = entry.get("attempts", 0) + 1
+
+    def update(self, names: List[str], **fields):
+        with self._lock:
+            for name in names:
+                self.entries.setdefault(name, {}).update(fields)
+            self._save()
+
+    def _save(self):
+        # Пишем через временный файл, чтобы прерванный запуск не испортил манифест
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.entries, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+
+class Progress:
+    """Живой прогресс: файлы, мегабайты и скорость"""
+
+    def __init__(self, total_files: int, total_bytes: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done_files = 0
+        self.done_bytes = 0
+        self.failed_files = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def advance(self, files: int, size: int, failed: bool = False):
+        with self._lock:
+            self.done_files += files
+            self.done_bytes += size
+            if failed:
+                self.failed_files += files
+            elapsed = max(time.time() - self.started, 1e-6)
+            speed = self.done_bytes / (1024 * 1024) / elapsed
+            print(
+                f"📈 [{self.done_files}/{self.total_files}] "
+                f"{self.done_bytes / (1024*1024):.1f}/{self.total_bytes / (1024*1024):.1f} MB, "
+                f"{speed:.2f} MB/s, {self.done_files / elapsed * 60:.1f} файлов/мин, ошибок: {self.failed_files}",
+                flush=True
+            )
+
+
+def filter_files(file_paths: List[Path]) -> tuple[List[Path], int]:
+    """Отбросить пустые и слишком большие файлы"""
     valid_files = []
     skipped = 0
-    
+
     for file_path in file_paths:
         file_name = file_path.name
         file_size = file_path.stat().st_size
-        
+
         if file_size > MAX_FILE_SIZE:
             print(f"⚠️  Пропущен {file_name}: размер {file_size / (1024*1024):.2f} MB превышает лимит {MAX_FILE_SIZE / (1024*1024):.0f} MB")
             skipped += 1
             continue
-        
+
         if file_size == 0:
             print(f"⚠️  Пропущен {file_name}: файл пустой")
             skipped += 1
             continue
-        
+
         valid_files.append(file_path)
-    
-    if not valid_files:
-        print("❌ Нет файлов для загрузки после фильтрации")
-        return 0, 0, skipped
-    
-    total_size = sum(f.stat().st_size for f in valid_files)
-    print(f"📤 Загрузка {len(valid_files)} файлов (общий размер: {total_size / (1024*1024):.2f} MB)...", end=" ", flush=True)
-    
+
+    return valid_files, skipped
+
+
+def make_batches(file_paths: List[Path], max_files: int, max_bytes: int) -> List[List[Path]]:
+    """Разбить файлы на батчи не больше max_files штук и max_bytes байт"""
+    batches, current, current_bytes = [], [], 0
+    for file_path in file_paths:
+        size = file_path.stat().st_size
+        if current and (len(current) >= max_files or current_bytes + size > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(file_path)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def post_batch(batch: List[Path], api_url: str, headers: dict) -> Optional[str]:
+    """Отправить батч одним запросом. Возвращает None при успехе или текст ошибки"""
+    batch_size = sum(f.stat().st_size for f in batch)
+    # Таймаут растет с объемом батча, а не с числом файлов
+    timeout = TIMEOUT + batch_size / (1024 * 1024) * 10
+
+    # Ключ должен совпадать с именем параметра в эндпоинте (files)
+    files_data = [('files', (f.name, open(f, 'rb'), 'application/pdf')) for f in batch]
     try:
-        # Подготавливаем все файлы для отправки
-        # В FastAPI для List[UploadFile] все файлы должны отправляться с одним ключом
-        files_data = []
-        for file_path in valid_files:
-            file_name = file_path.name
-            # Ключ должен совпадать с именем параметра в эндпоинте (files)
-            files_data.append(('files', (file_name, open(file_path, 'rb'), 'application/pdf')))
-        
-        try:
-            response = requests.post(
-                api_url,
-                files=files_data,
-                timeout=TIMEOUT * len(valid_files)  # Увеличиваем таймаут пропорционально количеству файлов
-            )
-        finally:
-            # Закрываем все открытые файлы
-            for _, (_, file_obj, _) in files_data:
-                file_obj.close()
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('success'):
-                print(f"✅ Успешно загружено {len(valid_files)} файлов")
-                return len(valid_files), 0, skipped
-            else:
-                print(f"❌ Ошибка: {result.get('message', 'Unknown error')}")
-                return 0, len(valid_files), skipped
-        else:
-            error_msg = response.json().get('detail', f'HTTP {response.status_code}') if response.headers.get('content-type', '').startswith('application/json') else f'HTTP {response.status_code}'
-            print(f"❌ Ошибка: {error_msg}")
-            return 0, len(valid_files), skipped
-            
+        response = requests.post(api_url, files=files_data, headers=headers, timeout=timeout)
     except requests.exceptions.Timeout:
-        print(f"❌ Таймаут (превышено {TIMEOUT * len(valid_files)} секунд)")
-        return 0, len(valid_files), skipped
+        return f"Таймаут (превышено {timeout:.0f} секунд)"
     except requests.exceptions.ConnectionError:
-        print(f"❌ Ошибка подключения к {api_url}")
-        print("   Убедитесь, что контейнер запущен и доступен на порту 10000")
-        return 0, len(valid_files), skipped
-    except Exception as e:
-        print(f"❌ Ошибка: {str(e)}")
-        return 0, len(valid_files), skipped
+        return f"Ошибка подключения к {api_url}"
+    finally:
+        # Закрываем все открытые файлы
+        for _, (_, file_obj, _) in files_data:
+            file_obj.close()
+
+    if response.status_code == 200:
+        result = response.json()
+        return None if result.get('success') else result.get('message', 'Unknown error')
+
+    if response.headers.get('content-type', '').startswith('application/json'):
+        detail = response.json().get('detail', f'HTTP {response.status_code}')
+    else:
+        detail = f'HTTP {response.status_code}'
+    return f"HTTP {response.status_code}: {detail}"
+
+
+def is_client_error(error: str) -> bool:
+    """4xx (кроме 429 — сервер перегружен) означает проблему с самими файлами, повтор не поможет"""
+    return error.startswith("HTTP 4") and not error.startswith("HTTP 429")
+
+
+def upload_batch(
+        batch: List[Path],
+        api_url: str,
+        headers: dict,
+        manifest: Manifest,
+        progress: Progress,
+        retries: int,
+        backoff: float,
+) -> tuple[int, int]:
+    """Загрузить батч с повторами. Возвращает (успешно, ошибок)"""
+    names = [f.name for f in batch]
+    batch_size = sum(f.stat().st_size for f in batch)
+
+    error = None
+    for attempt in range(retries + 1):
+        manifest.add_attempt(names)
+        error = post_batch(batch, api_url, headers)
+        if error is None:
+            manifest.update(names, state="uploaded", error=None, uploaded_at=datetime.now().isoformat())
+            progress.advance(len(batch), batch_size)
+            return len(batch), 0
+
+        # Сервер отклонил батч из-за конкретного файла (4xx): грузим файлы по одному,
+        # чтобы один плохой файл не мешал остальным
+        if is_client_error(error) and len(batch) > 1:
+            print(f"⚠️  Батч из {len(batch)} файлов отклонен ({error}), загружаем по одному")
+            successful = failed = 0
+            for file_path in batch:
+                s, f = upload_batch([file_path], api_url, headers, manifest, progress, retries, backoff)
+                successful += s
+                failed += f
+            return successful, failed
+
+        # Ошибки клиента не исправятся повтором
+        if is_client_error(error):
+            break
+
+        if attempt < retries:
+            delay = backoff * (2 ** attempt)
+            print(f"🔁 {', '.join(names[:3])}{'...' if len(names) > 3 else ''}: {error}, повтор через {delay:.0f} сек")
+            time.sleep(delay)
+
+    print(f"❌ Не удалось загрузить {', '.join(names)}: {error}")
+    manifest.update(names, state="failed", error=error)
+    progress.advance(len(batch), batch_size, failed=True)
+    return 0, len(batch)
+
+
+def upload_files(
+        file_paths: List[Path],
+        api_url: str,
+        manifest: Manifest,
+        workers: int = DEFAULT_WORKERS,
+        batch_files: int = DEFAULT_BATCH_FILES,
+        batch_mb: float = DEFAULT_BATCH_MB,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        tenant: Optional[str] = None,
+        force: bool = False,
+) -> tuple[int, int, int]:
+    """Загрузить файлы параллельными батчами. Возвращает (успешно, ошибок, пропущено)"""
+    valid_files, skipped = filter_files(file_paths)
+
+    # Пропускаем файлы, которые уже загружены с тем же содержимым
+    pending = []
+    already = 0
+    for file_path in valid_files:
+        entry = manifest.describe(file_path)
+        if entry.get("state") == "uploaded" and not force:
+            already += 1
+            continue
+        pending.append(file_path)
+    manifest.save()
+
+    if already:
+        print(f"⏭️  Пропущено {already} уже загруженных файлов (по манифесту)")
+    skipped += already
+
+    if not pending:
+        print("✅ Нет новых файлов для загрузки")
+        return 0, 0, skipped
+
+    batches = make_batches(pending, batch_files, int(batch_mb * 1024 * 1024))
+    total_size = sum(f.stat().st_size for f in pending)
+    print(f"📤 Загрузка {len(pending)} файлов ({total_size / (1024*1024):.2f} MB) "
+          f"в {len(batches)} батчах, потоков: {workers}")
+
+    headers = {"X-Tenant-ID": tenant} if tenant else {}
+    progress = Progress(len(pending), total_size)
+    successful = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(upload_batch, batch, api_url, headers, manifest, progress, retries, backoff)
+            for batch in batches
+        ]
+        for future in as_completed(futures):
+            s, f = future.result()
+            successful += s
+            failed += f
+
+    return successful, failed, skipped
 
 
 def main():
@@ -122,36 +327,88 @@ def main():
         default=DEFAULT_API_URL,
         help=f"URL API эндпоинта (по умолчанию: {DEFAULT_API_URL})"
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Число параллельных загрузок (по умолчанию: {DEFAULT_WORKERS})"
+    )
+    parser.add_argument(
+        "--batch-files",
+        type=int,
+        default=DEFAULT_BATCH_FILES,
+        help=f"Максимум файлов в одном запросе (по умолчанию: {DEFAULT_BATCH_FILES})"
+    )
+    parser.add_argument(
+        "--batch-mb",
+        type=float,
+        default=DEFAULT_BATCH_MB,
+        help=f"Максимальный объем одного запроса, MB (по умолчанию: {DEFAULT_BATCH_MB})"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"Повторов при ошибке (по умолчанию: {DEFAULT_RETRIES})"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help=f"Путь к манифесту (по умолчанию: <папка>/{MANIFEST_NAME})"
+    )
+    parser.add_argument(
+        "--tenant",
+        type=str,
+        default=None,
+        help="Тенант (заголовок X-Tenant-ID)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Загрузить заново даже уже загруженные файлы"
+    )
     args = parser.parse_args()
-    
+
     folder_path = Path(args.folder)
     api_url = args.api_url
-    
+    manifest_path = Path(args.manifest) if args.manifest else folder_path / MANIFEST_NAME
+
     print("=" * 60)
     print("🚀 Скрипт загрузки PDF файлов в контейнер")
     print("=" * 60)
     print(f"📂 Папка: {folder_path.absolute()}")
     print(f"🌐 API: {api_url}")
+    print(f"🗂️  Манифест: {manifest_path.absolute()}")
     print("=" * 60)
     print()
-    
+
     # Получаем список файлов
     pdf_files = get_pdf_files(folder_path)
-    
+
     if not pdf_files:
         print("❌ PDF файлы не найдены!")
         sys.exit(1)
-    
-    print()
-    print(f"📊 Начинаем загрузку {len(pdf_files)} файлов одним запросом...")
+
     print()
-    
+
     # Статистика
     start_time = time.time()
-    
-    # Загружаем все файлы одним запросом
-    successful, failed, skipped = upload_files(pdf_files, api_url)
-    
+
+    manifest = Manifest(manifest_path)
+    successful, failed, skipped = upload_files(
+        pdf_files,
+        api_url,
+        manifest,
+        workers=args.workers,
+        batch_files=args.batch_files,
+        batch_mb=args.batch_mb,
+        retries=args.retries,
+        tenant=args.tenant,
+        force=args.force,
+    )
+
     # Итоговая статистика
     elapsed_time = time.time() - start_time
     print()
@@ -162,11 +419,11 @@ def main():
     print(f"   ⚠️  Пропущено: {skipped}")
     print(f"   ⏱️  Время выполнения: {elapsed_time:.2f} секунд ({elapsed_time/60:.2f} минут)")
     print("=" * 60)
-    
+
     if failed > 0:
+        print("🔁 Запустите скрипт повторно, чтобы догрузить файлы с ошибками")
         sys.exit(1)
 
 
 if __name__ == "__main__":
     main()
-